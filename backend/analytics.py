@@ -0,0 +1,459 @@
+# =====================================================================================
+# 📈 Phân tích doanh số trên snapshot dạng cột (NumPy) của collection transactions
+# ✅ Top thuốc, chi tiêu theo khách hàng, histogram theo giờ / ngày, so sánh theo tháng
+# =====================================================================================
+#
+# Chỉ các trường cần thiết (timestamp, medicine, customer, price_eth, price_usd, status)
+# được đọc một lần và lưu thành mảng NumPy; khách hàng / tên thuốc được mã hóa thành số
+# nguyên (dictionary encoding). Mỗi truy vấn chỉ là lọc theo mask + np.bincount, không
+# lặp Python trên từng giao dịch.
+#
+# Snapshot chỉ đọc toàn bộ collection một lần (theo lô ANALYTICS_LOAD_BATCH_SIZE, không giữ
+# cả collection dạng document trong bộ nhớ), sau đó cập nhật tăng dần từ checkpoint:
+#   - giao dịch ghi bởi worker này được thêm ngay (store_transactions)
+#   - giao dịch của worker khác: đọc lại các giao dịch có timestamp gần nhất mỗi
+#     ANALYTICS_POLL_SECONDS (trùng _id thì bỏ qua)
+#   - giao dịch bị tx_verifier chuyển sang "failed" (có thể ở worker khác): đọc các giao
+#     dịch failed có verified_at từ checkpoint lần trước (index failed_verified_at)
+#   - ANALYTICS_REBUILD_SECONDS > 0: dựng lại toàn bộ định kỳ (vd. khi có dữ liệu sửa tay);
+#     mặc định tắt
+#
+# Giao dịch có status "failed" không được tính (giống bảng rollup doanh thu).
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from rollups import counts_as_revenue, medicine_lines
+
+ANALYTICS_POLL_SECONDS = float(os.getenv("ANALYTICS_POLL_SECONDS", "15"))
+ANALYTICS_REBUILD_SECONDS = float(os.getenv("ANALYTICS_REBUILD_SECONDS", "0"))
+# Khi đọc giao dịch mới, lùi lại bấy nhiêu giây so với timestamp lớn nhất đã có
+# (giao dịch ghi trễ qua bộ đệm / từ worker khác)
+ANALYTICS_OVERLAP_SECONDS = float(os.getenv("ANALYTICS_OVERLAP_SECONDS", "120"))
+ANALYTICS_LOAD_BATCH_SIZE = int(os.getenv("ANALYTICS_LOAD_BATCH_SIZE", "5000"))
+
+ANALYTICS_PROJECTION = {
+    "timestamp": 1, "medicine": 1, "customer": 1, "price_eth": 1, "price_usd": 1, "status": 1,
+}
+
+EPOCH = datetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400
+
+
+def epoch_seconds(ts: datetime) -> int:
+    """Số giây kể từ 1970-01-01 (timestamp lưu dạng UTC naive)."""
+    return int((ts - EPOCH).total_seconds())
+
+
+def _number(value: Any, default: float) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class _Columns:
+    """Các mảng NumPy cùng độ dài, thêm phần tử theo lô (capacity tăng gấp đôi khi đầy)."""
+
+    def __init__(self, dtypes: Dict[str, Any]):
+        self.size = 0
+        self._data = {name: np.empty(16, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self, values: Dict[str, List[Any]]):
+        count = len(next(iter(values.values())))
+        if not count:
+            return
+        needed = self.size + count
+        capacity = len(next(iter(self._data.values())))
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name, array in self._data.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                self._data[name] = grown
+        for name, column in values.items():
+            self._data[name][self.size:needed] = column
+        self.size = needed
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._data[name][:self.size]
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._data.values())
+
+
+class _Dictionary:
+    """Mã hóa chuỗi (khách hàng, tên thuốc) thành số nguyên liên tiếp."""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class Selection(NamedTuple):
+    rows: np.ndarray  # chỉ số giao dịch thỏa điều kiện
+    lines: np.ndarray  # chỉ số dòng thuốc thuộc các giao dịch đó
+
+
+def _top(values: np.ndarray, present: np.ndarray, limit: int) -> np.ndarray:
+    """Chỉ số của `limit` phần tử lớn nhất (chỉ xét phần tử có dữ liệu), giảm dần."""
+    candidates = np.flatnonzero(present)
+    if limit < candidates.size:
+        candidates = candidates[np.argpartition(-values[candidates], limit - 1)[:limit]]
+    return candidates[np.argsort(-values[candidates], kind="stable")]
+
+
+def _change_pct(current: float, previous: float) -> Optional[float]:
+    if not previous:
+        return None
+    return round(float((current - previous) / previous * 100), 2)
+
+
+class SalesSnapshot:
+    def __init__(self):
+        self.tx = _Columns({
+            "ts": np.int64, "price_eth": np.float64, "price_usd": np.float64,
+            "customer": np.int32, "valid": np.bool_,
+        })
+        self.lines = _Columns({"tx": np.int64, "medicine": np.int32, "qty": np.float64, "share": np.float64})
+        self.customers = _Dictionary()
+        self.medicines = _Dictionary()
+        self._rows: Dict[str, int] = {}
+        self.max_timestamp: Optional[datetime] = None
+
+    def __len__(self):
+        return self.tx.size
+
+    @classmethod
+    def build(cls, transactions: Iterable[Dict[str, Any]]) -> "SalesSnapshot":
+        snapshot = cls()
+        snapshot.add(transactions)
+        return snapshot
+
+    def add(self, transactions: Iterable[Dict[str, Any]]) -> int:
+        """Thêm giao dịch chưa có trong snapshot; trả về số giao dịch được thêm."""
+        tx_values = {"ts": [], "price_eth": [], "price_usd": [], "customer": [], "valid": []}
+        line_values = {"tx": [], "medicine": [], "qty": [], "share": []}
+        row = self.tx.size
+        for tx in transactions:
+            ts = tx.get("timestamp")
+            key = str(tx.get("_id"))
+            if not isinstance(ts, datetime) or key in self._rows:
+                continue
+            self._rows[key] = row
+            tx_values["ts"].append(epoch_seconds(ts))
+            tx_values["price_eth"].append(_number(tx.get("price_eth"), 0.0))
+            tx_values["price_usd"].append(_number(tx.get("price_usd"), 0.0))
+            tx_values["customer"].append(self.customers.code(str(tx.get("customer") or "unknown")))
+            tx_values["valid"].append(counts_as_revenue(tx))
+            for name, qty, share in medicine_lines(tx):
+                line_values["tx"].append(row)
+                line_values["medicine"].append(self.medicines.code(name))
+                line_values["qty"].append(qty)
+                line_values["share"].append(share)
+            if self.max_timestamp is None or ts > self.max_timestamp:
+                self.max_timestamp = ts
+            row += 1
+        self.tx.append(tx_values)
+        self.lines.append(line_values)
+        return len(tx_values["ts"])
+
+    def mark_failed(self, ids: Iterable[Any]) -> int:
+        """Loại các giao dịch khỏi thống kê; trả về số giao dịch trước đó còn được tính."""
+        valid = self.tx["valid"]
+        rows = [self._rows[key] for key in map(str, ids) if key in self._rows]
+        rows = [row for row in rows if valid[row]]
+        if rows:
+            self.tx["valid"][rows] = False
+        return len(rows)
+
+    # ------------------------------------------------------------------ truy vấn
+
+    def select(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Selection:
+        mask = self.tx["valid"].copy()
+        ts = self.tx["ts"]
+        if start is not None:
+            mask &= ts >= epoch_seconds(start)
+        if end is not None:
+            mask &= ts < epoch_seconds(end)
+        return Selection(np.flatnonzero(mask), np.flatnonzero(mask[self.lines["tx"]]))
+
+    def summary(self, selection: Selection) -> Dict[str, Any]:
+        rows = selection.rows
+        return {
+            "count": int(rows.size),
+            "sum_eth": float(self.tx["price_eth"][rows].sum()),
+            "sum_usd": float(self.tx["price_usd"][rows].sum()),
+            "customers": int(np.unique(self.tx["customer"][rows]).size),
+        }
+
+    def medicines_breakdown(self, selection: Selection, limit: int, sort: str = "usd") -> List[Dict[str, Any]]:
+        lines = selection.lines
+        tx_rows = self.lines["tx"][lines]
+        codes = self.lines["medicine"][lines]
+        share = self.lines["share"][lines]
+        size = len(self.medicines)
+        orders = np.bincount(codes, minlength=size)
+        qty = np.bincount(codes, weights=self.lines["qty"][lines], minlength=size)
+        eth = np.bincount(codes, weights=share * self.tx["price_eth"][tx_rows], minlength=size)
+        usd = np.bincount(codes, weights=share * self.tx["price_usd"][tx_rows], minlength=size)
+        ranking = {"usd": usd, "eth": eth, "qty": qty, "orders": orders}[sort]
+        return [
+            {
+                "medicine": self.medicines.values[code],
+                "orders": int(orders[code]),
+                "qty": float(qty[code]),
+                "sum_eth": float(eth[code]),
+                "sum_usd": float(usd[code]),
+            }
+            for code in _top(ranking, orders > 0, limit)
+        ]
+
+    def customers_breakdown(self, selection: Selection, limit: int, sort: str = "usd") -> List[Dict[str, Any]]:
+        rows = selection.rows
+        codes = self.tx["customer"][rows]
+        size = len(self.customers)
+        count = np.bincount(codes, minlength=size)
+        eth = np.bincount(codes, weights=self.tx["price_eth"][rows], minlength=size)
+        usd = np.bincount(codes, weights=self.tx["price_usd"][rows], minlength=size)
+        ranking = {"usd": usd, "eth": eth, "count": count}[sort]
+        return [
+            {
+                "customer": self.customers.values[code],
+                "count": int(count[code]),
+                "sum_eth": float(eth[code]),
+                "sum_usd": float(usd[code]),
+            }
+            for code in _top(ranking, count > 0, limit)
+        ]
+
+    def _local_seconds(self, selection: Selection, tz_offset_minutes: int) -> np.ndarray:
+        return self.tx["ts"][selection.rows] + tz_offset_minutes * 60
+
+    def hourly(self, selection: Selection, tz_offset_minutes: int = 0) -> List[Dict[str, Any]]:
+        hours = (self._local_seconds(selection, tz_offset_minutes) % SECONDS_PER_DAY) // 3600
+        count = np.bincount(hours, minlength=24)
+        usd = np.bincount(hours, weights=self.tx["price_usd"][selection.rows], minlength=24)
+        return [{"hour": hour, "count": int(count[hour]), "sum_usd": float(usd[hour])} for hour in range(24)]
+
+    def daily(self, selection: Selection, tz_offset_minutes: int = 0) -> List[Dict[str, Any]]:
+        if not selection.rows.size:
+            return []
+        days = self._local_seconds(selection, tz_offset_minutes) // SECONDS_PER_DAY
+        first = int(days.min())
+        index = days - first
+        count = np.bincount(index)
+        eth = np.bincount(index, weights=self.tx["price_eth"][selection.rows])
+        usd = np.bincount(index, weights=self.tx["price_usd"][selection.rows])
+        return [
+            {
+                "date": (EPOCH + timedelta(days=first + offset)).strftime("%Y-%m-%d"),
+                "count": int(count[offset]),
+                "sum_eth": float(eth[offset]),
+                "sum_usd": float(usd[offset]),
+            }
+            for offset in range(count.size)
+        ]
+
+    def monthly(self, year: int, month: int, months: int, tz_offset_minutes: int = 0) -> List[Dict[str, Any]]:
+        """`months` tháng kết thúc ở (year, month), kèm % thay đổi so với tháng trước."""
+        last = year * 12 + (month - 1)
+        first = last - months  # thêm một tháng trước đó để tính % thay đổi của tháng đầu
+        selection = self.select()
+        local = self._local_seconds(selection, tz_offset_minutes)
+        # datetime64[M]: số tháng kể từ 1970-01
+        index = local.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64) + 1970 * 12 - first
+        in_range = (index >= 0) & (index <= months)
+        index = index[in_range]
+        rows = selection.rows[in_range]
+        count = np.bincount(index, minlength=months + 1)
+        eth = np.bincount(index, weights=self.tx["price_eth"][rows], minlength=months + 1)
+        usd = np.bincount(index, weights=self.tx["price_usd"][rows], minlength=months + 1)
+        return [
+            {
+                "year": (first + offset) // 12,
+                "month": (first + offset) % 12 + 1,
+                "count": int(count[offset]),
+                "sum_eth": float(eth[offset]),
+                "sum_usd": float(usd[offset]),
+                "change_count_pct": _change_pct(count[offset], count[offset - 1]),
+                "change_eth_pct": _change_pct(eth[offset], eth[offset - 1]),
+                "change_usd_pct": _change_pct(usd[offset], usd[offset - 1]),
+            }
+            for offset in range(1, months + 1)
+        ]
+
+    def breakdown(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        limit: int,
+        tz_offset_minutes: int = 0,
+    ) -> Dict[str, Any]:
+        """Tất cả các phân tích của một khoảng thời gian, dùng chung một lần lọc."""
+        selection = self.select(start, end)
+        return {
+            "summary": self.summary(selection),
+            "top_medicines": self.medicines_breakdown(selection, limit),
+            "top_customers": self.customers_breakdown(selection, limit),
+            "hourly": self.hourly(selection, tz_offset_minutes),
+            "daily": self.daily(selection, tz_offset_minutes),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "transactions": self.tx.size,
+            "lines": self.lines.size,
+            "customers": len(self.customers),
+            "medicines": len(self.medicines),
+            "array_bytes": self.tx.nbytes() + self.lines.nbytes(),
+        }
+
+
+async def load_transactions(collection, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Đọc các cột cần cho phân tích (từ `since` nếu có)."""
+    query = {"timestamp": {"$gte": since}} if since is not None else {}
+    cursor = collection.find(query, ANALYTICS_PROJECTION, batch_size=ANALYTICS_LOAD_BATCH_SIZE)
+    return await cursor.to_list(length=None)
+
+
+async def build_snapshot(collection) -> SalesSnapshot:
+    """Dựng snapshot từ toàn bộ collection, mỗi lần chỉ giữ một lô document trong bộ nhớ."""
+    loop = asyncio.get_running_loop()
+    snapshot = SalesSnapshot()
+    batch = []
+    async for doc in collection.find({}, ANALYTICS_PROJECTION, batch_size=ANALYTICS_LOAD_BATCH_SIZE):
+        batch.append(doc)
+        if len(batch) >= ANALYTICS_LOAD_BATCH_SIZE:
+            await loop.run_in_executor(None, snapshot.add, batch)
+            batch = []
+    if batch:
+        await loop.run_in_executor(None, snapshot.add, batch)
+    return snapshot
+
+
+class SalesAnalytics:
+    """Giữ snapshot hiện tại và cập nhật nó ở nền (xem chú thích đầu file)."""
+
+    def __init__(
+        self,
+        get_collection: Callable[[], Any],
+        on_change: Callable[[], None] = lambda: None,
+        poll_seconds: float = ANALYTICS_POLL_SECONDS,
+        rebuild_seconds: float = ANALYTICS_REBUILD_SECONDS,
+    ):
+        self._get_collection = get_collection
+        self._on_change = on_change
+        self.poll_seconds = poll_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.snapshot = SalesSnapshot()
+        self.ready = False
+        self.built_at: Optional[datetime] = None
+        self.errors = 0
+        self.rebuilds = 0
+        # Mốc đã đồng bộ trạng thái failed (verified_at), tính theo đồng hồ lúc bắt đầu đọc
+        self._failed_checkpoint: Optional[datetime] = None
+        self._rebuilding: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _rebuild(self):
+        started = datetime.utcnow()
+        fresh = await build_snapshot(self._get_collection())
+        self.snapshot = fresh
+        # Giao dịch bị đánh dấu failed trong lúc đang đọc được bắt lại ở lần sync_failed sau
+        self._failed_checkpoint = started
+        self.ready = True
+        self.built_at = datetime.utcnow()
+        self.rebuilds += 1
+        self._on_change()
+
+    async def rebuild(self):
+        """
+        Dựng lại snapshot từ đầu. Các lời gọi đồng thời (nhiều request khi snapshot chưa
+        sẵn sàng, task nền) dùng chung một lần đọc; shield để request bị hủy không hủy
+        lần dựng mà người khác đang chờ.
+        """
+        if self._rebuilding is None or self._rebuilding.done():
+            self._rebuilding = asyncio.ensure_future(self._rebuild())
+        await asyncio.shield(self._rebuilding)
+
+    async def catch_up(self):
+        """Thêm giao dịch mới ghi bởi worker khác (trùng _id được bỏ qua)."""
+        since = self.snapshot.max_timestamp
+        if since is not None:
+            since -= timedelta(seconds=ANALYTICS_OVERLAP_SECONDS)
+        docs = await load_transactions(self._get_collection(), since)
+        if self.snapshot.add(docs):
+            self._on_change()
+
+    async def sync_failed(self):
+        """Đánh dấu các giao dịch chuyển sang "failed" từ checkpoint trước (kể cả ở worker khác)."""
+        started = datetime.utcnow()
+        since = self._failed_checkpoint - timedelta(seconds=ANALYTICS_OVERLAP_SECONDS)
+        docs = await self._get_collection().find(
+            {"status": "failed", "verified_at": {"$gte": since}}, {"_id": 1}
+        ).to_list(length=None)
+        self._failed_checkpoint = started
+        if self.snapshot.mark_failed(doc["_id"] for doc in docs):
+            self._on_change()
+
+    def add(self, transactions: Iterable[Dict[str, Any]]):
+        if self.ready and self.snapshot.add(transactions):
+            self._on_change()
+
+    def mark_failed(self, transactions: Iterable[Dict[str, Any]]):
+        if self.ready and self.snapshot.mark_failed(tx.get("_id") for tx in transactions):
+            self._on_change()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_rebuild = None
+        while True:
+            try:
+                if self._get_collection() is not None:
+                    if not self.ready or (next_rebuild is not None and loop.time() >= next_rebuild):
+                        await self.rebuild()
+                        if self.rebuild_seconds > 0:
+                            next_rebuild = loop.time() + self.rebuild_seconds
+                    else:
+                        await self.catch_up()
+                        await self.sync_failed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Warning: Could not refresh sales analytics: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+            "rebuilds": self.rebuilds,
+            "errors": self.errors,
+            **self.snapshot.stats(),
+        }
@@ -0,0 +1,401 @@
+# =====================================================================================
+# 🏁 Benchmark các endpoint chính (in-process, không qua mạng)
+# ✅ Dữ liệu seed cố định theo --seed, kết quả JSON (throughput + p50/p95/p99)
+# =====================================================================================
+#
+# Chạy app FastAPI trong cùng process qua httpx.ASGITransport, với MongoDB là
+# mongomock (mặc định) hoặc một mongod riêng cho benchmark (--mongo-uri). Cài thêm:
+#   pip install -r requirements-bench.txt
+#
+# Ví dụ:
+#   python benchmark.py --drugs 5000 --transactions 50000 --concurrency 32 --output bench.json
+#   python benchmark.py --mongo-uri mongodb://localhost:27017/bench_pharma --requests 2000
+#
+# So sánh giữa các lần chạy: giữ nguyên --seed, kích thước dữ liệu, --concurrency, --requests
+# (tất cả được ghi lại trong phần "config" của file kết quả).
+#
+# Kịch bản mà trong lúc chạy bảng rollup hoặc bộ đệm ghi báo lỗi (kể cả lỗi chỉ in ra log)
+# được đánh dấu "valid": false kèm "background_errors"; khi đó benchmark thoát với mã 1.
+# Lỗi khi seed dữ liệu dừng benchmark ngay.
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+SCENARIOS = ("login", "me", "search", "purchase", "revenue")
+BENCH_PASSWORD = "bench-password"
+
+# Âm tiết để sinh tên thuốc (có dấu, giống dữ liệu thật)
+NAME_PARTS = [
+    "Para", "ceta", "mol", "Amoxi", "cillin", "Ibu", "pro", "fen", "Vita", "min", "Bảo", "Thanh",
+    "Hoạt", "huyết", "Dưỡng", "não", "Cefa", "lexin", "Omepra", "zol", "Loratad", "ine", "Siro", "ho",
+]
+SEARCH_QUERIES = ["", "para", "amoxi", "vitamin", "bao thanh", "paracetamo", "ibuprofen", "hoat huyet", "xyz"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentile theo nearest-rank trên danh sách đã sắp xếp."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    completed = len(ordered)
+    return {
+        "requests": completed,
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "duration_s": round(elapsed, 4),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 50) * 1000, 3),
+            "p95": round(percentile(ordered, 95) * 1000, 3),
+            "p99": round(percentile(ordered, 99) * 1000, 3),
+            "mean": round(sum(ordered) / completed * 1000, 3) if completed else 0.0,
+            "max": round(ordered[-1] * 1000, 3) if completed else 0.0,
+        },
+    }
+
+
+async def run_scenario(
+    client,
+    make_request: Callable[[random.Random], Any],
+    total: int,
+    concurrency: int,
+    warmup: int,
+    seed: int,
+) -> Dict[str, Any]:
+    """Gửi `total` request với `concurrency` worker; mỗi worker có Random riêng (seed cố định)."""
+    for i in range(warmup):
+        await make_request(random.Random(seed - i - 1))
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    remaining = total
+
+    async def worker(index: int):
+        nonlocal remaining, errors
+        rng = random.Random(seed * 1000 + index)
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await make_request(rng)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - started)
+
+
+# -----------------------------------------------------------------------------------
+# Chuẩn bị dữ liệu
+# -----------------------------------------------------------------------------------
+def drug_name(rng: random.Random) -> str:
+    return "".join(rng.choice(NAME_PARTS) for _ in range(rng.randint(2, 3))) + f" {rng.randint(1, 999)}mg"
+
+
+async def seed_data(main, args) -> Dict[str, Any]:
+    from bson.objectid import ObjectId
+
+    import rollups
+    from passwords import BCRYPT_ROUNDS, _hash
+
+    rng = random.Random(args.seed)
+
+    drugs = [
+        {"name": drug_name(rng), "batch": f"B{i:06d}", "owner": f"0x{rng.getrandbits(160):040x}",
+         "price": round(rng.uniform(0.001, 0.5), 4), "stage": rng.randint(0, 3),
+         "description": "Thuốc dùng cho benchmark"}
+        for i in range(args.drugs)
+    ]
+    if drugs:
+        await main.drugs_collection.insert_many(drugs)
+
+    # Cùng một mật khẩu cho mọi user: chỉ băm một lần
+    hashed = _hash(BENCH_PASSWORD, BCRYPT_ROUNDS)
+    users = [
+        {"phone": f"09{i:08d}", "username": f"bench{i}", "password": hashed,
+         "wallet_address": f"0x{rng.getrandbits(160):040x}", "created_at": datetime.utcnow(), "role": "admin"}
+        for i in range(args.users)
+    ]
+    if users:
+        await main.users_collection.insert_many(users)
+
+    # Giao dịch rải đều trong `--months` tháng gần nhất
+    now = datetime.utcnow()
+    span = timedelta(days=30 * args.months).total_seconds()
+    medicines = [drug["name"] for drug in drugs[:200]] or ["Paracetamol"]
+    transactions = []
+    for _ in range(args.transactions):
+        price_eth = round(rng.uniform(0.001, 0.5), 6)
+        transactions.append({
+            "_id": ObjectId(),
+            "customer": f"0x{rng.getrandbits(160):040x}",
+            "medicine": rng.choice(medicines),
+            "price_eth": price_eth,
+            "price_usd": round(price_eth * 3000, 2),
+            "tx_hash": None,
+            "chain_id": 1,
+            "block_number": None,
+            "timestamp": now - timedelta(seconds=rng.uniform(0, span)),
+            "status": "completed",
+        })
+    for start in range(0, len(transactions), 10000):
+        batch = transactions[start:start + 10000]
+        await main.transactions_collection.insert_many(batch)
+        try:
+            await rollups.apply_transactions(main.revenue_rollups_collection, batch)
+        except Exception as e:
+            # Rollup thiếu thì kịch bản revenue đo đường tính từ transactions, không phải rollup
+            raise SystemExit(f"❌ Could not seed revenue rollups: {e}")
+
+    months = sorted({(tx["timestamp"].year, tx["timestamp"].month) for tx in transactions}) or [(now.year, now.month)]
+    return {"phones": [user["phone"] for user in users], "months": months, "medicines": medicines}
+
+
+def patch_mongomock():
+    """pymongo >= 4.11 truyền `sort` cho UpdateOne trong bulk_write; mongomock cũ chưa nhận tham số này."""
+    import inspect
+
+    from mongomock.collection import BulkOperationBuilder
+
+    if "sort" in inspect.signature(BulkOperationBuilder.add_update).parameters:
+        return
+    add_update = BulkOperationBuilder.add_update
+
+    def patched(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    BulkOperationBuilder.add_update = patched
+
+
+def background_errors(main) -> Dict[str, Any]:
+    """Bộ đếm lỗi của các tác vụ nền (chỉ được in ra log, request vẫn trả 2xx)."""
+    purchases = main.purchase_buffer.stats()
+    return {
+        "revenue_rollups": main.rollup_maintainer.stats()["errors"],
+        "purchases_flush": purchases["flush_errors"],
+        "purchases_rejected": purchases["rejected"],
+        "login_history_flush": main.login_history_buffer.stats()["flush_errors"],
+    }
+
+
+async def check_background(main, before: Dict[str, Any]) -> Dict[str, Any]:
+    """Chờ bộ đệm ghi xong phần của kịch bản rồi so bộ đếm lỗi với lúc bắt đầu."""
+    await main.purchase_buffer.flush()
+    await main.login_history_buffer.flush()
+    after = background_errors(main)
+    errors = {key: after[key] - before[key] for key in after if after[key] != before[key]}
+    unwritten = len(main.purchase_buffer) + len(main.login_history_buffer)
+    if unwritten:
+        errors["unwritten_documents"] = unwritten
+    if main.rollup_maintainer.stale:
+        errors["revenue_rollups_stale"] = True
+    return errors
+
+
+async def bind_mongo(main, args):
+    """Gắn app vào mongomock hoặc mongod benchmark trước khi lifespan chạy."""
+    if args.mongo_uri:
+        await main.connect_mongo()
+        # connect_mongo đã tạo index (và collection rỗng), nên kiểm tra theo số document
+        collections = (main.users_collection, main.drugs_collection, main.transactions_collection)
+        has_data = any([await collection.estimated_document_count() for collection in collections])
+        if has_data and not args.force:
+            raise SystemExit(f"❌ Database '{main.db.name}' đã có dữ liệu, dùng database riêng hoặc --force")
+        return "mongod"
+
+    from mongomock_motor import AsyncMongoMockClient
+
+    patch_mongomock()
+    main.client = AsyncMongoMockClient()
+    main.db = main.client[main.db_name]
+    main._bind_collections()
+    return "mongomock"
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+
+    import main
+
+    backend = await bind_mongo(main, args)
+    seed_started = time.perf_counter()
+    data = await seed_data(main, args)
+    seed_elapsed = time.perf_counter() - seed_started
+
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await main.refresh_search_index()
+            phones = data["phones"]
+
+            tokens = []
+            for phone in phones[:min(len(phones), 200)]:
+                response = await client.post("/api/login", json={"phone": phone, "password": BENCH_PASSWORD})
+                tokens.append(response.json()["access_token"])
+
+            def login(rng):
+                return client.post("/api/login", json={"phone": rng.choice(phones), "password": BENCH_PASSWORD})
+
+            def me(rng):
+                return client.get("/api/me", headers={"Authorization": f"Bearer {rng.choice(tokens)}"})
+
+            def search(rng):
+                q = rng.choice(SEARCH_QUERIES)
+                return client.get("/api/drugs/search", params={"q": q, "limit": 100 if not q else 20})
+
+            def purchase(rng):
+                price_eth = round(rng.uniform(0.001, 0.5), 6)
+                return client.post("/api/purchase", json={
+                    "medicine": rng.choice(data["medicines"]), "price_eth": price_eth,
+                    "price_usd": round(price_eth * 3000, 2), "customer": f"0x{rng.getrandbits(160):040x}",
+                    "chain_id": 1,
+                })
+
+            def revenue(rng):
+                year, month = rng.choice(data["months"])
+                return client.get("/api/revenue", params={"month": month, "year": year, "limit": 100})
+
+            handlers = {"login": login, "me": me, "search": search, "purchase": purchase, "revenue": revenue}
+            for name in args.scenarios:
+                if name in ("login", "me") and not phones:
+                    continue
+                requests = args.login_requests if name == "login" else args.requests
+                print(f"▶ {name}: {requests} requests, concurrency {args.concurrency}", file=sys.stderr)
+                before = background_errors(main)
+                results[name] = await run_scenario(
+                    client, handlers[name], requests, args.concurrency, args.warmup, args.seed
+                )
+                errors = await check_background(main, before)
+                results[name]["valid"] = not errors
+                results[name]["background_errors"] = errors
+                print(f"  {results[name]['throughput_rps']} req/s, p95 {results[name]['latency_ms']['p95']} ms",
+                      file=sys.stderr)
+                if errors:
+                    print(f"  ❌ {name} is invalid, background errors during the run: {errors}", file=sys.stderr)
+
+    if backend == "mongod" and not args.keep_data:
+        await main.client.drop_database(main.db.name)
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "mongo_backend": backend,
+            "seed_duration_s": round(seed_elapsed, 3),
+        },
+        "config": {
+            "seed": args.seed,
+            "drugs": args.drugs,
+            "users": args.users,
+            "transactions": args.transactions,
+            "months": args.months,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "login_requests": args.login_requests,
+            "warmup": args.warmup,
+            "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+            "response_cache": not args.no_response_cache,
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv: List[str]):
+    parser = argparse.ArgumentParser(description="Benchmark các endpoint backend")
+    parser.add_argument("--mongo-uri", help="mongod dùng riêng cho benchmark (mặc định: mongomock)")
+    parser.add_argument("--force", action="store_true", help="cho phép seed vào database đã có dữ liệu")
+    parser.add_argument("--keep-data", action="store_true", help="không xóa database benchmark sau khi chạy")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drugs", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--months", type=int, default=6, help="số tháng trải dữ liệu giao dịch")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="số request mỗi kịch bản")
+    parser.add_argument("--login-requests", type=int, default=200, help="số request login (bcrypt chậm)")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--no-response-cache", action="store_true", help="tắt cache response (đo đường tính toán)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", default="-", help="file JSON kết quả ('-' = stdout)")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    """Cấu hình app cho benchmark; phải chạy trước khi import main."""
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Mọi request đến từ cùng một "client" nên tắt rate limit / giới hạn đồng thời
+    for name in ("OTP_PHONE", "OTP_IP", "LOGIN_PHONE", "LOGIN_IP", "REGISTER_IP"):
+        os.environ[f"RATE_LIMIT_{name}"] = "1000000000/1"
+    os.environ["AUTH_MAX_CONCURRENCY"] = "1000000"
+    os.environ["PASSWORD_POOL_MAX_QUEUE"] = "1000000"
+    os.environ["TX_VERIFY_ENABLED"] = "false"
+    os.environ["WEB3_ENABLED"] = "false"
+    # Không gọi API tỷ giá bên ngoài trong lúc đo
+    os.environ["ETH_RATE_PROVIDER"] = "static"
+    os.environ["INDEXES_ON_STARTUP"] = "true" if args.mongo_uri else "false"
+    # Refresh chỉ mục định kỳ không chạy trong lúc đo (benchmark refresh một lần sau khi seed)
+    os.environ["SEARCH_INDEX_REFRESH_SECONDS"] = "86400"
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "0"
+        os.environ["RESPONSE_CACHE_CLOSED_TTL_SECONDS"] = "0"
+
+
+def main_cli(argv: List[str]) -> int:
+    args = parse_args(argv)
+    configure_environment(args)
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Kết quả đã ghi vào {args.output}", file=sys.stderr)
+    invalid = [name for name, result in report["scenarios"].items() if not result["valid"]]
+    if invalid:
+        print(f"❌ Invalid scenarios (background errors): {', '.join(invalid)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
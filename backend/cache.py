@@ -0,0 +1,167 @@
+# =====================================================================================
+# 🧠 Cache trong bộ nhớ (LRU + TTL) có bộ đếm hit/miss
+# =====================================================================================
+#
+# Mỗi worker có cache riêng. Khi dữ liệu gốc đổi ở một process (worker khác, CLI như
+# provision_users.py), SharedInvalidations gửi key cần xóa qua một document MongoDB để
+# mọi worker xóa theo trong vòng `poll_seconds`, thay vì chờ TTL.
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache LRU giới hạn số phần tử, mỗi phần tử hết hạn sau `ttl` giây.
+
+    Chỉ dùng trong event loop (không khóa), phù hợp cho dữ liệu nóng của một worker.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Lưu giá trị; `ttl` riêng (nếu có) không vượt quá ttl mặc định của cache."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SharedInvalidations:
+    """
+    Phát / nhận lệnh xóa key của `cache` giữa các process qua document
+    {_id: name, total, events: [key...]} (`events` giữ `keep` key gần nhất, `total` đếm
+    mọi lần phát). Mỗi worker đọc document định kỳ và xóa các key mới kể từ lần đọc
+    trước; nếu đã lỡ nhiều hơn `keep` key thì xóa toàn bộ cache.
+    """
+
+    def __init__(
+        self,
+        cache: TTLCache,
+        get_collection: Callable[[], Any],
+        name: str,
+        poll_seconds: float = 2.0,
+        keep: int = 1000,
+    ):
+        self.cache = cache
+        self._get_collection = get_collection
+        self.name = name
+        self.poll_seconds = poll_seconds
+        self.keep = keep
+        self.received = 0
+        self.cleared = 0
+        self.errors = 0
+        self._seen: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def publish(self, key: Hashable):
+        """Xóa key ở cache của process này và báo cho các process khác."""
+        self.cache.pop(key)
+        collection = self._get_collection()
+        if collection is None:
+            return
+        try:
+            await collection.update_one(
+                {"_id": self.name},
+                {"$inc": {"total": 1}, "$push": {"events": {"$each": [key], "$slice": -self.keep}}},
+                upsert=True,
+            )
+        except Exception as e:
+            # Worker khác vẫn tự hết hạn sau ttl của cache
+            self.errors += 1
+            print(f"⚠️ Warning: Could not publish {self.name} invalidation: {e}")
+
+    async def sync(self):
+        collection = self._get_collection()
+        if collection is None:
+            return
+        doc = await collection.find_one({"_id": self.name}) or {}
+        total = doc.get("total", 0)
+        events = doc.get("events", [])
+        new = total - self._seen if self._seen is not None else None
+        if new is None or new < 0 or new > len(events):
+            # Lần đọc đầu tiên / document bị xóa / lỡ sự kiện: không biết key nào đã đổi
+            if self._seen is not None:
+                self.cleared += 1
+            self.cache.clear()
+        elif new:
+            for key in events[-new:]:
+                self.cache.pop(key)
+            self.received += new
+        self._seen = total
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+            await asyncio.sleep(self.poll_seconds)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"received": self.received, "cleared": self.cleared, "errors": self.errors}
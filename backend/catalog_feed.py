@@ -0,0 +1,151 @@
+# =====================================================================================
+# 📡 Luồng catalog cho client: snapshot ban đầu + delta (Server-Sent Events)
+# ✅ Theo dõi drugs / products bằng MongoDB change stream, fallback polling khi không hỗ trợ
+# =====================================================================================
+#
+# Mỗi client mở một kết nối /api/catalog/stream: nhận một event `snapshot` (toàn bộ item
+# đã serialize sẵn trong chỉ mục tìm kiếm) rồi các event `upsert` / `delete`. Mỗi event
+# được serialize một lần và đưa vào hàng đợi (có giới hạn) của từng subscriber. Client
+# đọc chậm làm đầy hàng đợi thì nhận event `reset` và bị ngắt; EventSource tự kết nối lại
+# và nhận snapshot mới.
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from fast_json import dumps, object_with_array
+
+# Mã lỗi MongoDB khi change stream không dùng được (standalone mongod / không có oplog)
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+# Resume token quá cũ (oplog đã bị ghi đè)
+CHANGE_STREAM_HISTORY_LOST = {286, 280}
+
+
+def sse_event(kind: str, data: bytes, event_id: Optional[int] = None) -> bytes:
+    """Đóng gói một event SSE (data là JSON một dòng)."""
+    head = b"" if event_id is None else b"id: %d\n" % event_id
+    return head + b"event: " + kind.encode("ascii") + b"\ndata: " + data + b"\n\n"
+
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+
+class CatalogFeed:
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self.version = 0
+        self.subscribers: Set[Subscriber] = set()
+        self.published = 0
+        self.dropped = 0
+        # Trạng thái watch_catalog: starting | watching | error | polling
+        self.watcher = "starting"
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        """Bỏ subscriber bị đầy hàng đợi: xóa event đang chờ, để lại tín hiệu reset (None)."""
+        self.subscribers.discard(subscriber)
+        self.dropped += 1
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def publish(self, kind: str, payload: Dict[str, Any]):
+        self.version += 1
+        self.published += 1
+        if not self.subscribers:
+            return
+        message = sse_event(kind, dumps({"version": self.version, **payload}), self.version)
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def publish_upsert(self, item: Dict[str, Any]):
+        self.publish("upsert", {"item": item})
+
+    def publish_delete(self, item_id: str):
+        self.publish("delete", {"id": item_id})
+
+    def set_watcher(self, state: str):
+        self.watcher = state
+
+    def reset(self):
+        """Yêu cầu mọi client tải lại snapshot (vd. sau khi catalog thay đổi quá nhiều)."""
+        self.version += 1
+        for subscriber in list(self.subscribers):
+            self._drop(subscriber)
+
+    def snapshot_event(self, encoded_items: Iterable[bytes]) -> bytes:
+        data = object_with_array("items", encoded_items, {"version": self.version})
+        return sse_event("snapshot", data, self.version)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "version": self.version,
+            "published": self.published,
+            "dropped": self.dropped,
+            "watcher": self.watcher,
+        }
+
+
+async def watch_catalog(
+    get_db: Callable[[], Any],
+    sources: Iterable[str],
+    apply_change: Callable[[Dict[str, Any]], Awaitable[None]],
+    on_resync: Callable[[], Awaitable[None]],
+    retry_seconds: float = 5,
+    on_state: Optional[Callable[[str], None]] = None,
+) -> None:
+    """
+    Đọc change stream của các collection `sources` và gọi apply_change cho từng thay đổi.
+    Tự mở lại (dùng resume token) khi mất kết nối; gọi on_resync nếu phải bắt đầu lại từ
+    đầu (token hết hạn). Trả về khi MongoDB không hỗ trợ change stream.
+    `on_state` nhận "watching" khi stream mở, "error" khi stream lỗi và đang chờ mở lại,
+    "polling" khi trả về.
+    """
+    set_state = on_state or (lambda state: None)
+    pipeline = [{"$match": {"ns.coll": {"$in": list(sources)}}}]
+    resume_token = None
+    while True:
+        db = get_db()
+        if db is None:
+            await asyncio.sleep(retry_seconds)
+            continue
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                set_state("watching")
+                if resume_token is None:
+                    # Thay đổi trong lúc chưa theo dõi được: đồng bộ lại toàn bộ một lần
+                    await on_resync()
+                async for change in stream:
+                    resume_token = change["_id"]
+                    await apply_change(change)
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED or "replica set" in str(e).lower():
+                print(f"⚠️ Warning: MongoDB change streams unavailable, polling catalog instead: {e}")
+                set_state("polling")
+                return
+            if e.code in CHANGE_STREAM_HISTORY_LOST:
+                resume_token = None
+                continue
+            print(f"⚠️ Warning: Catalog change stream failed: {e}")
+            set_state("error")
+            await asyncio.sleep(retry_seconds)
+        except PyMongoError as e:
+            print(f"⚠️ Warning: Catalog change stream interrupted: {e}")
+            set_state("error")
+            await asyncio.sleep(retry_seconds)
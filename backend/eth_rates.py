@@ -0,0 +1,215 @@
+# =====================================================================================
+# 💱 Tỷ giá ETH/USD phía server: làm mới nền, cache trong bộ nhớ, giới hạn độ cũ
+# =====================================================================================
+#
+# Thay vì mỗi trình duyệt gọi Coinbase mỗi lần thanh toán, backend gọi upstream một lần
+# mỗi ETH_RATE_REFRESH_SECONDS và phục vụ giá trị cache qua /api/rates/eth. add_purchase
+# tính price_usd từ tỷ giá này nên doanh thu USD nhất quán giữa các client.
+#
+# Upstream là một coroutine không tham số trả về số USD cho 1 ETH, nên có thể thay bằng
+# stand-in cục bộ khi test (ETH_RATE_PROVIDER=static hoặc ETH_RATE_URL trỏ tới server giả).
+#
+# Nhiều worker: chỉ worker leader (leader.py) gọi upstream và ghi tỷ giá vào document
+# {_id: "eth_rate"} của collection service_state; các worker khác đọc lại document đó
+# mỗi ETH_RATE_RETRY_SECONDS (giữ nguyên fetched_at nên giới hạn độ cũ vẫn đúng).
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+ETH_RATE_PROVIDER = os.getenv("ETH_RATE_PROVIDER", "coinbase")  # coinbase | static
+ETH_RATE_URL = os.getenv("ETH_RATE_URL", "https://api.coinbase.com/v2/exchange-rates?currency=ETH")
+ETH_RATE_STATIC_USD = float(os.getenv("ETH_RATE_STATIC_USD", "3000"))
+ETH_RATE_REFRESH_SECONDS = float(os.getenv("ETH_RATE_REFRESH_SECONDS", "60"))
+ETH_RATE_RETRY_SECONDS = float(os.getenv("ETH_RATE_RETRY_SECONDS", "10"))
+# Tỷ giá cũ hơn mức này không được dùng (endpoint trả 503, giao dịch giữ price_usd của client)
+ETH_RATE_MAX_AGE_SECONDS = float(os.getenv("ETH_RATE_MAX_AGE_SECONDS", "600"))
+ETH_RATE_TIMEOUT_SECONDS = float(os.getenv("ETH_RATE_TIMEOUT_SECONDS", "5"))
+
+SHARED_RATE_ID = "eth_rate"
+
+Fetcher = Callable[[], Awaitable[float]]
+
+
+class RateQuote(NamedTuple):
+    usd_per_eth: float
+    fetched_at: datetime
+    fetched_monotonic: float
+    source: str
+
+
+class CoinbaseFetcher:
+    """Đọc tỷ giá từ API exchange-rates của Coinbase (hoặc server có cùng định dạng)."""
+
+    name = "coinbase"
+
+    def __init__(self, url: str = ETH_RATE_URL, timeout: float = ETH_RATE_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+
+    async def __call__(self) -> float:
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self._session.get(self.url) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        return float(data["data"]["rates"]["USD"])
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class StaticFetcher:
+    """Tỷ giá cố định, dùng cho môi trường dev / test không có mạng."""
+
+    name = "static"
+
+    def __init__(self, usd_per_eth: float = ETH_RATE_STATIC_USD):
+        self.usd_per_eth = usd_per_eth
+
+    async def __call__(self) -> float:
+        return self.usd_per_eth
+
+    async def close(self):
+        pass
+
+
+def create_fetcher(provider: str = ETH_RATE_PROVIDER):
+    if provider == "static":
+        return StaticFetcher()
+    return CoinbaseFetcher()
+
+
+class EthRateService:
+    def __init__(
+        self,
+        fetcher,
+        refresh_seconds: float = ETH_RATE_REFRESH_SECONDS,
+        max_age_seconds: float = ETH_RATE_MAX_AGE_SECONDS,
+        retry_seconds: float = ETH_RATE_RETRY_SECONDS,
+        get_shared: Optional[Callable[[], Any]] = None,
+    ):
+        self.fetcher = fetcher
+        # Collection chia sẻ tỷ giá giữa các worker (None: chỉ dùng upstream)
+        self._get_shared = get_shared
+        # Follower đọc tỷ giá leader đã ghi thay vì gọi upstream
+        self.leader = True
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.retry_seconds = retry_seconds
+        self.quote: Optional[RateQuote] = None
+        self.refreshes = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def start(self):
+        # Lock / task tạo trong event loop đang chạy
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def refresh(self) -> RateQuote:
+        """Gọi upstream và cập nhật cache; các lời gọi đồng thời dùng chung một lần fetch."""
+        started = time.monotonic()
+        async with self._lock:
+            if self.quote is not None and self.quote.fetched_monotonic >= started:
+                return self.quote
+            usd_per_eth = float(await self.fetcher())
+            if not usd_per_eth > 0:
+                raise ValueError(f"Tỷ giá ETH/USD không hợp lệ: {usd_per_eth}")
+            self.quote = RateQuote(usd_per_eth, datetime.utcnow(), time.monotonic(), self.fetcher.name)
+            self.refreshes += 1
+            self.last_error = None
+            await self._publish(self.quote)
+            return self.quote
+
+    async def _publish(self, quote: RateQuote):
+        collection = self._get_shared() if self._get_shared is not None else None
+        if collection is None:
+            return
+        try:
+            await collection.replace_one(
+                {"_id": SHARED_RATE_ID},
+                {"usd_per_eth": quote.usd_per_eth, "fetched_at": quote.fetched_at, "source": quote.source},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"⚠️ Warning: Could not share ETH/USD rate: {e}")
+
+    async def sync(self) -> Optional[RateQuote]:
+        """Đọc tỷ giá leader đã ghi (nếu mới hơn tỷ giá đang có)."""
+        collection = self._get_shared() if self._get_shared is not None else None
+        if collection is None:
+            return self.quote
+        doc = await collection.find_one({"_id": SHARED_RATE_ID})
+        if doc is None or (self.quote is not None and doc["fetched_at"] <= self.quote.fetched_at):
+            return self.quote
+        age = max(0.0, (datetime.utcnow() - doc["fetched_at"]).total_seconds())
+        self.quote = RateQuote(float(doc["usd_per_eth"]), doc["fetched_at"], time.monotonic() - age, doc["source"])
+        self.last_error = None
+        return self.quote
+
+    async def _run(self):
+        while True:
+            if not self.leader:
+                try:
+                    await self.sync()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+                await asyncio.sleep(self.retry_seconds)
+                continue
+            try:
+                await self.refresh()
+                delay = self.refresh_seconds
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                if self.last_error is None:
+                    print(f"⚠️ Warning: Could not refresh ETH/USD rate: {e}")
+                self.last_error = str(e)
+                delay = min(self.retry_seconds, self.refresh_seconds)
+            await asyncio.sleep(delay)
+
+    def age_seconds(self) -> Optional[float]:
+        if self.quote is None:
+            return None
+        return time.monotonic() - self.quote.fetched_monotonic
+
+    def fresh_quote(self) -> Optional[RateQuote]:
+        """Tỷ giá hiện tại nếu chưa quá ETH_RATE_MAX_AGE_SECONDS, ngược lại None."""
+        age = self.age_seconds()
+        if age is None or age > self.max_age_seconds:
+            return None
+        return self.quote
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.fetcher.close()
+
+    def stats(self) -> dict:
+        age = self.age_seconds()
+        return {
+            "source": self.quote.source if self.quote else self.fetcher.name,
+            "leader": self.leader,
+            "usd_per_eth": self.quote.usd_per_eth if self.quote else None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": self.fresh_quote() is None,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
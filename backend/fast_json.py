@@ -0,0 +1,65 @@
+# =====================================================================================
+# ⚡ Serialize JSON nhanh cho response (orjson nếu có, fallback json chuẩn)
+# =====================================================================================
+#
+# Endpoint nóng trả thẳng FastJSONResponse (bỏ qua jsonable_encoder của FastAPI).
+# Các phần tử đã serialize sẵn (vd. item của chỉ mục tìm kiếm) được ghép trực tiếp
+# bằng object_with_array() thay vì decode lại rồi encode lần nữa.
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable
+
+from bson.objectid import ObjectId
+from fastapi.responses import JSONResponse
+
+from profiling import span
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Không serialize được {type(value).__name__}")
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize thành JSON (UTF-8 bytes)."""
+    with span("serialize"):
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=_default)
+            except orjson.JSONEncodeError:
+                # vd. số nguyên vượt 64 bit: json chuẩn xử lý được
+                pass
+        return _stdlib_dumps(obj)
+
+
+def object_with_array(key: str, fragments: Iterable[bytes], fields: Dict[str, Any]) -> bytes:
+    """
+    Tạo JSON object {key: [fragments...], **fields} từ các phần tử đã serialize sẵn.
+    """
+    rest = dumps(fields)
+    head = b'{"' + key.encode("utf-8") + b'":[' + b",".join(fragments) + b"]"
+    if rest == b"{}":
+        return head + b"}"
+    return head + b"," + rest[1:]
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse dùng dumps() ở trên; nội dung kiểu bytes được coi là JSON đã serialize."""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
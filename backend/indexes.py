@@ -0,0 +1,181 @@
+# =====================================================================================
+# 🗂️ Quản lý index MongoDB (khai báo tập trung) + kiểm tra query plan (explain audit)
+# =====================================================================================
+#
+# Chạy tự động khi ứng dụng khởi động (INDEXES_ON_STARTUP=true), hoặc bằng CLI:
+#   python indexes.py ensure   # tạo các index còn thiếu
+#   python indexes.py audit    # explain từng dạng query của các endpoint, báo COLLSCAN
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from rollups import ROLLUP_INDEX_NAME, ROLLUP_KEY
+
+# Khai báo index theo collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True),
+        # User tạo qua luồng OTP không có username nên dùng sparse
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True, sparse=True),
+    ],
+    "temp_sessions": [
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True),
+        # MongoDB tự xóa phiên OTP khi quá expires_at
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "transactions": [
+        IndexModel([("timestamp", ASCENDING), ("_id", ASCENDING)], name="timestamp_id"),
+        IndexModel([("customer", ASCENDING), ("timestamp", ASCENDING)], name="customer_timestamp"),
+        # Chỉ index các giao dịch chờ xác minh on-chain (tx_verifier)
+        IndexModel([("next_check_at", ASCENDING)], name="pending_next_check",
+                   partialFilterExpression={"status": "pending"}),
+        # Snapshot phân tích đồng bộ các giao dịch vừa bị xác minh thất bại (analytics.sync_failed)
+        IndexModel([("verified_at", ASCENDING)], name="failed_verified_at",
+                   partialFilterExpression={"status": "failed"}),
+    ],
+    "login_history": [
+        IndexModel([("user_id", ASCENDING), ("login_time", DESCENDING)], name="user_id_login_time"),
+    ],
+    "rate_limits": [
+        # Bucket của rate limiter dùng chung (RATE_LIMIT_BACKEND=mongo) tự xóa khi hết hạn
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "revenue_rollups": [
+        IndexModel(ROLLUP_KEY, name=ROLLUP_INDEX_NAME, unique=True),
+    ],
+}
+
+
+def query_shapes() -> List[Dict[str, Any]]:
+    """Các dạng query mà endpoint thực sự chạy (giá trị mẫu, chỉ dùng cho explain)."""
+    now = datetime.utcnow()
+    month_start = datetime(now.year, now.month, 1)
+    return [
+        {"name": "login / start_auth / set_password", "collection": "users",
+         "filter": {"phone": "0900000000"}},
+        {"name": "register (username)", "collection": "users",
+         "filter": {"username": "sample"}},
+        {"name": "get_current_user", "collection": "users",
+         "filter": {"_id": ObjectId()}},
+        {"name": "verify_otp", "collection": "temp_sessions",
+         "filter": {"phone": "0900000000"}},
+        {"name": "revenue (month page)", "collection": "transactions",
+         "filter": {"timestamp": {"$gte": month_start, "$lt": month_start + timedelta(days=31)}},
+         "sort": {"timestamp": 1, "_id": 1}},
+        {"name": "export (customer)", "collection": "transactions",
+         "filter": {"timestamp": {"$gte": month_start, "$lt": now}, "customer": {"$in": ["0xAbC", "0xabc"]}},
+         "sort": {"timestamp": 1, "_id": 1}},
+        {"name": "export (customer + medicine)", "collection": "transactions",
+         "filter": {"timestamp": {"$gte": month_start, "$lt": now}, "customer": {"$in": ["0xAbC", "0xabc"]},
+                    "$or": [{"medicine.name": "sample"}, {"medicine": "sample"}]},
+         "sort": {"timestamp": 1, "_id": 1}},
+        {"name": "tx verifier (pending due)", "collection": "transactions",
+         "filter": {"status": "pending", "next_check_at": {"$lte": now}}, "sort": {"next_check_at": 1}},
+        {"name": "analytics (failed since checkpoint)", "collection": "transactions",
+         "filter": {"status": "failed", "verified_at": {"$gte": now - timedelta(minutes=2)}}},
+        {"name": "login history", "collection": "login_history",
+         "filter": {"user_id": str(ObjectId())}, "sort": {"login_time": -1}},
+        {"name": "revenue total (rollups)", "collection": "revenue_rollups",
+         "filter": {"granularity": "month", "bucket": month_start.strftime("%Y-%m")}},
+    ]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Tạo các index đã khai báo (idempotent). Lỗi ở một collection không chặn các collection khác."""
+    created = {}
+    for collection_name, models in INDEXES.items():
+        try:
+            created[collection_name] = await db[collection_name].create_indexes(models)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not create indexes on {collection_name}: {e}")
+    return created
+
+
+def _find_stages(plan: Any, stages: Optional[List[str]] = None) -> List[str]:
+    """Liệt kê tất cả stage trong một cây query plan."""
+    if stages is None:
+        stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            _find_stages(value, stages)
+    elif isinstance(plan, list):
+        for value in plan:
+            _find_stages(value, stages)
+    return stages
+
+
+async def explain_audit(db) -> List[Dict[str, Any]]:
+    """Chạy explain (queryPlanner) cho từng dạng query và đánh dấu plan có COLLSCAN."""
+    report = []
+    for shape in query_shapes():
+        command = {"find": shape["collection"], "filter": shape["filter"]}
+        if shape.get("sort"):
+            command["sort"] = shape["sort"]
+        try:
+            explained = await db.command({"explain": command, "verbosity": "queryPlanner"})
+            stages = _find_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+            report.append({
+                "name": shape["name"],
+                "collection": shape["collection"],
+                "stages": stages,
+                "collscan": "COLLSCAN" in stages,
+            })
+        except Exception as e:
+            report.append({
+                "name": shape["name"],
+                "collection": shape["collection"],
+                "stages": [],
+                "collscan": None,
+                "error": str(e),
+            })
+    return report
+
+
+# -----------------------------------------------------------------------------------
+# CLI:  python indexes.py ensure | audit
+# -----------------------------------------------------------------------------------
+async def _main(argv: List[str]) -> int:
+    if len(argv) != 2 or argv[1] not in ("ensure", "audit"):
+        print("Usage: python indexes.py ensure | audit")
+        return 2
+
+    import main
+
+    try:
+        await main.connect_mongo()
+    except Exception as e:
+        print(f"⚠️ Warning: MongoDB connection error: {e}")
+    if main.db is None:
+        print("❌ MongoDB không kết nối được")
+        return 1
+
+    if argv[1] == "ensure":
+        created = await ensure_indexes(main.db)
+        for collection_name, names in created.items():
+            print(f"✅ {collection_name}: {', '.join(names)}")
+        return 0
+
+    report = await explain_audit(main.db)
+    failed = False
+    for row in report:
+        if row.get("error"):
+            status = f"ERROR ({row['error']})"
+            failed = True
+        elif row["collscan"]:
+            status = "COLLSCAN"
+            failed = True
+        else:
+            status = "OK"
+        print(f"{status:>10}  {row['collection']:<16} {row['name']}  [{' > '.join(row['stages'])}]")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv)))
@@ -0,0 +1,130 @@
+# =====================================================================================
+# 👑 Bầu một worker "leader" chạy các job dùng chung (lease trong MongoDB)
+# =====================================================================================
+#
+# Khi chạy nhiều worker (serve.py --workers N, có thể trên nhiều máy), các job có tác dụng
+# ra ngoài process (tx_verifier ghi trạng thái giao dịch, gọi RPC; lấy tỷ giá ETH từ
+# upstream) chỉ nên chạy ở một nơi. Mỗi worker định kỳ thử giữ document
+# {_id: name, owner, expires_at} trong collection service_state:
+#   - chưa có ai giữ / lease đã hết hạn / chính mình đang giữ -> gia hạn, là leader
+#   - worker khác đang giữ -> follower
+# Leader chết thì sau tối đa LEADER_LEASE_SECONDS một worker khác nhận thay. Leader mất
+# kết nối MongoDB quá hạn lease thì tự hạ xuống follower (worker khác có thể đã nhận).
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "30"))
+
+
+class LeaderLease:
+    """
+    Giữ lease `name` trong collection (lấy qua `get_collection` vì collection chỉ có khi
+    MongoDB sẵn sàng). `on_acquired` / `on_lost` được gọi khi worker này trở thành /
+    thôi là leader.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable[[], Any],
+        name: str,
+        on_acquired: Callable[[], Awaitable[None]],
+        on_lost: Callable[[], Awaitable[None]],
+        lease_seconds: float = LEADER_LEASE_SECONDS,
+    ):
+        self._get_collection = get_collection
+        self.name = name
+        self._on_acquired = on_acquired
+        self._on_lost = on_lost
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.elections = 0
+        self.errors = 0
+        self._expires = 0.0  # time.monotonic() khi lease đang giữ hết hạn
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _try_acquire(self, collection) -> bool:
+        now = datetime.utcnow()
+        try:
+            doc = await collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Document đã tồn tại và worker khác còn giữ lease (upsert không khớp filter)
+            return False
+        return doc is not None and doc.get("owner") == self.owner
+
+    async def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            self.elections += 1
+            print(f"👑 Worker {self.owner} is now the {self.name} leader")
+            await self._on_acquired()
+        else:
+            print(f"ℹ️  Worker {self.owner} is no longer the {self.name} leader")
+            await self._on_lost()
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            collection = self._get_collection()
+            leader = False
+            if collection is not None:
+                try:
+                    leader = await self._try_acquire(collection)
+                    if leader:
+                        self._expires = started + self.lease_seconds
+                except Exception as e:
+                    self.errors += 1
+                    if self.errors == 1:
+                        print(f"⚠️ Warning: Could not renew {self.name} lease: {e}")
+                    # Chưa chắc đã mất lease: giữ vai trò tới khi lease hết hạn
+                    leader = self.is_leader and time.monotonic() < self._expires
+            try:
+                await self._set_leader(leader)
+            except Exception as e:
+                print(f"⚠️ Warning: {self.name} leader callback failed: {e}")
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            # Nhả lease để worker khác nhận ngay thay vì chờ hết hạn
+            collection = self._get_collection()
+            if collection is not None:
+                try:
+                    await collection.update_one(
+                        {"_id": self.name, "owner": self.owner}, {"$set": {"expires_at": datetime.utcnow()}}
+                    )
+                except Exception:
+                    pass
+            await self._set_leader(False)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "leader": self.is_leader,
+            "elections": self.elections,
+            "errors": self.errors,
+        }
@@ -0,0 +1,91 @@
+# =====================================================================================
+# 🕒 Lịch sử đăng nhập: time-series collection + ghi nền theo lô
+# =====================================================================================
+#
+# login_user chỉ đưa sự kiện vào bộ đệm trong bộ nhớ (WriteBehindBuffer) rồi trả token
+# ngay; task nền gom lô và ghi bằng insert_many. Khi hàng đợi đầy (MongoDB chậm / mất
+# kết nối), sự kiện mới bị bỏ và được đếm ở `rejected`.
+
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import Request
+from pymongo.errors import BulkWriteError
+
+LOGIN_HISTORY_RETENTION_DAYS = int(os.getenv("LOGIN_HISTORY_RETENTION_DAYS", "90"))
+
+# Chỉ tin X-Forwarded-For khi backend chạy sau reverse proxy / load balancer
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() == "true"
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """Địa chỉ IP của client (ưu tiên X-Forwarded-For nếu được cấu hình tin proxy)."""
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+def build_login_event(user: Dict[str, Any], request: Request) -> Dict[str, Any]:
+    return {
+        "user_id": str(user["_id"]),
+        "phone": user.get("phone"),
+        "login_time": datetime.utcnow(),
+        "ip_address": client_ip(request),
+        "user_agent": request.headers.get("user-agent"),
+    }
+
+
+async def ensure_login_history_store(db, name: str = "login_history"):
+    """
+    Tạo `login_history` dạng time-series (timeField=login_time, metaField=user_id)
+    với thời hạn lưu LOGIN_HISTORY_RETENTION_DAYS ngày.
+
+    Nếu collection đã tồn tại dạng thường (dữ liệu cũ) thì giữ nguyên và chỉ thêm
+    TTL index trên login_time để áp dụng cùng thời hạn lưu. Khi thời hạn lưu thay đổi,
+    collection / index đã có được cập nhật bằng collMod (create_index với TTL khác sẽ
+    báo IndexOptionsConflict).
+    """
+    retention_seconds = LOGIN_HISTORY_RETENTION_DAYS * 24 * 3600
+    existing = await db.list_collections(filter={"name": name}).to_list(length=1)
+    if not existing:
+        try:
+            await db.create_collection(
+                name,
+                timeseries={"timeField": "login_time", "metaField": "user_id", "granularity": "seconds"},
+                expireAfterSeconds=retention_seconds,
+            )
+            return
+        except Exception as e:
+            # MongoDB < 5.0 không hỗ trợ time-series
+            print(f"ℹ️  login_history time-series not available, using TTL index: {e}")
+    elif existing[0].get("type") == "timeseries":
+        if existing[0].get("options", {}).get("expireAfterSeconds") != retention_seconds:
+            await db.command("collMod", name, expireAfterSeconds=retention_seconds)
+            print(f"ℹ️  login_history retention set to {LOGIN_HISTORY_RETENTION_DAYS} days")
+        return
+
+    await ensure_ttl_index(db, name, retention_seconds)
+
+
+async def ensure_ttl_index(db, name: str, retention_seconds: int):
+    """TTL index trên login_time; index đã có (TTL khác / không TTL) được sửa bằng collMod."""
+    indexes = await db[name].index_information()
+    for index_name, info in indexes.items():
+        if info.get("key") == [("login_time", 1)]:
+            if info.get("expireAfterSeconds") != retention_seconds:
+                await db.command("collMod", name, index={"name": index_name, "expireAfterSeconds": retention_seconds})
+                print(f"ℹ️  login_history TTL index {index_name} set to {LOGIN_HISTORY_RETENTION_DAYS} days")
+            return
+    await db[name].create_index("login_time", name="login_time_ttl", expireAfterSeconds=retention_seconds)
+
+
+async def store_login_events(collection, events: List[Dict[str, Any]]):
+    """Ghi một lô sự kiện đăng nhập (bỏ qua lỗi trùng khóa khi ghi lại)."""
+    try:
+        await collection.insert_many(events, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
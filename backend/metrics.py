@@ -0,0 +1,275 @@
+# =====================================================================================
+# 📊 Metrics dạng Prometheus (text exposition format 0.0.4), không cần thư viện ngoài
+# ✅ Đếm request / histogram độ trễ theo route, request đang xử lý, thời gian lệnh MongoDB
+# =====================================================================================
+#
+# Mỗi worker giữ metrics riêng trong bộ nhớ; Prometheus scrape từng worker (hoặc dùng
+# label instance) rồi cộng dồn. Cập nhật metric được khóa bằng threading.Lock vì
+# CommandListener của pymongo chạy trên thread của executor.
+#
+# Pool thực sự có việc được theo dõi qua track_executor: executor của Motor (mọi lệnh
+# MongoDB chạy trên đó) và executor mặc định của event loop (run_in_executor(None, ...)).
+
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+# Bucket (giây) cho độ trễ request HTTP và lệnh MongoDB
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [đếm theo bucket (không cộng dồn)..., đếm +Inf, tổng]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, *labels: str, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, list(row)) for labels, row in self._values.items())
+        lines = self.header()
+        for labels, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {row[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Tập hợp các metric; `collectors` là các hàm cập nhật gauge ngay trước khi render."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, fn: Callable[[], None]) -> Callable[[], None]:
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"⚠️ Warning: metrics collector failed: {e}")
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "Số request HTTP đã xử lý", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "Độ trễ request HTTP (giây)", ("method", "route")
+)
+http_in_flight = registry.gauge(
+    "http_requests_in_flight", "Số request HTTP đang xử lý", ("method", "route")
+)
+mongo_commands = registry.histogram(
+    "mongodb_command_duration_seconds", "Thời gian thực thi lệnh MongoDB (giây)", ("command", "outcome")
+)
+
+
+# -----------------------------------------------------------------------------------
+# HTTP middleware
+# -----------------------------------------------------------------------------------
+class MetricsMiddleware:
+    """
+    ASGI middleware đo từng request theo route template (vd. /api/drugs/search),
+    không theo path thực tế, để số lượng label không tăng vô hạn.
+    """
+
+    def __init__(self, app, skip_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+        self._router = None
+
+    def _route_template(self, scope) -> str:
+        if self._router is None:
+            return "unmatched"
+        for route in self._router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        if self._router is None:
+            app = scope.get("app")
+            self._router = getattr(app, "router", None)
+        method = scope["method"]
+        route = self._route_template(scope)
+        status_code = "500"
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = str(message["status"])
+            await send(message)
+
+        http_in_flight.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(method, route)
+            http_latency.observe(method, route, value=time.perf_counter() - start)
+            http_requests.inc(method, route, status_code)
+
+
+# -----------------------------------------------------------------------------------
+# MongoDB command listener (truyền vào AsyncIOMotorClient qua event_listeners)
+# -----------------------------------------------------------------------------------
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_commands.observe(event.command_name, "success", value=event.duration_micros / 1e6)
+
+    def failed(self, event):
+        mongo_commands.observe(event.command_name, "failure", value=event.duration_micros / 1e6)
+
+
+executor_threads = registry.gauge(
+    "executor_threads",
+    "Thread pool (Motor, executor mặc định của event loop): số luồng tối đa / đã tạo / đang chạy / task đang chờ",
+    ("executor", "state"),
+)
+
+# Tên -> hàm lấy ThreadPoolExecutor (executor có thể được tạo / thay sau khi đăng ký)
+_executors: Dict[str, Callable[[], Optional[ThreadPoolExecutor]]] = {}
+
+
+def track_executor(name: str, get_executor: Callable[[], Optional[ThreadPoolExecutor]]):
+    _executors[name] = get_executor
+
+
+def thread_pool_state(executor: ThreadPoolExecutor) -> Dict[str, int]:
+    # ThreadPoolExecutor không có API công khai cho số liệu này; các thuộc tính nội bộ
+    # dưới đây có từ Python 3.8. `_idle_semaphore` đếm số luồng đang rảnh.
+    threads = len(executor._threads)
+    idle = executor._idle_semaphore._value
+    return {
+        "max": executor._max_workers,
+        "threads": threads,
+        "active": max(0, threads - idle),
+        "queued": executor._work_queue.qsize(),
+    }
+
+
+@registry.collector
+def _collect_executors():
+    for name, get_executor in _executors.items():
+        executor = get_executor()
+        if executor is None:
+            continue
+        for state, value in thread_pool_state(executor).items():
+            executor_threads.set(name, state, value=value)
@@ -0,0 +1,132 @@
+# =====================================================================================
+# 🔑 Lưu phiên OTP (temp_sessions) với thao tác verify-and-consume nguyên tử
+# ✅ Backend MongoDB (mặc định) hoặc bộ nhớ trong process (1 node / test)
+# =====================================================================================
+
+import os
+import time
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict
+
+from pymongo import ReturnDocument
+
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "300"))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "3"))
+# Số phiên tối đa của MemorySessionStore; vượt quá thì bỏ phiên cũ nhất
+OTP_MEMORY_MAX_SESSIONS = int(os.getenv("OTP_MEMORY_MAX_SESSIONS", "10000"))
+
+
+class VerifyResult(Enum):
+    OK = "ok"
+    NOT_FOUND = "not_found"
+    EXPIRED = "expired"
+    TOO_MANY_ATTEMPTS = "too_many_attempts"
+    WRONG_CODE = "wrong_code"
+
+
+class MongoSessionStore:
+    """
+    Phiên OTP trong collection `temp_sessions` (một document mỗi số điện thoại).
+
+    verify() đúng mã chỉ tốn một round-trip: find_one_and_delete với điều kiện
+    mã khớp, chưa hết hạn và chưa vượt số lần thử. Nhiều request đồng thời cùng
+    mã đúng thì chỉ một request xóa được phiên. Khi sai, một find_one_and_update
+    ($inc attempts) vừa đếm lần thử vừa cho biết lý do thất bại.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def issue(self, phone: str, otp_code: str, ttl_seconds: int = OTP_TTL_SECONDS):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"phone": phone},
+            {
+                "$set": {
+                    "otp_code": otp_code,
+                    "attempts": 0,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=ttl_seconds),
+                }
+            },
+            upsert=True,
+        )
+
+    async def verify(self, phone: str, otp_code: str, max_attempts: int = OTP_MAX_ATTEMPTS) -> VerifyResult:
+        now = datetime.utcnow()
+        consumed = await self.collection.find_one_and_delete({
+            "phone": phone,
+            "otp_code": otp_code,
+            "expires_at": {"$gt": now},
+            "attempts": {"$lt": max_attempts},
+        })
+        if consumed is not None:
+            return VerifyResult.OK
+
+        # Thất bại: tăng số lần thử và lấy trạng thái trước khi tăng để biết lý do
+        session = await self.collection.find_one_and_update(
+            {"phone": phone},
+            {"$inc": {"attempts": 1}},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if session is None:
+            return VerifyResult.NOT_FOUND
+
+        expires_at = session.get("expires_at")
+        if not isinstance(expires_at, datetime) or expires_at <= now:
+            await self.collection.delete_one({"_id": session["_id"]})
+            return VerifyResult.EXPIRED
+        if session.get("attempts", 0) >= max_attempts:
+            await self.collection.delete_one({"_id": session["_id"]})
+            return VerifyResult.TOO_MANY_ATTEMPTS
+        return VerifyResult.WRONG_CODE
+
+
+class MemorySessionStore:
+    """
+    Phiên OTP trong dict của process (TTL map). Mọi thao tác chạy đồng bộ trong
+    event loop nên verify-and-consume là nguyên tử. Chỉ dùng khi chạy 1 worker hoặc test.
+
+    Khi đầy `max_sessions` thì bỏ phiên được cấp sớm nhất (dict giữ thứ tự cấp,
+    thường cũng là phiên hết hạn sớm nhất) để bộ nhớ không tăng vô hạn.
+    """
+
+    def __init__(self, max_sessions: int = OTP_MEMORY_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.evicted = 0
+        self._sessions: Dict[str, dict] = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def issue(self, phone: str, otp_code: str, ttl_seconds: int = OTP_TTL_SECONDS):
+        # Cấp lại mã: đưa phiên xuống cuối thứ tự
+        self._sessions.pop(phone, None)
+        now = time.monotonic()
+        while len(self._sessions) >= self.max_sessions:
+            oldest = next(iter(self._sessions))
+            if self._sessions.pop(oldest)["expires_at"] > now:
+                self.evicted += 1
+        self._sessions[phone] = {
+            "otp_code": otp_code,
+            "attempts": 0,
+            "expires_at": now + ttl_seconds,
+        }
+
+    async def verify(self, phone: str, otp_code: str, max_attempts: int = OTP_MAX_ATTEMPTS) -> VerifyResult:
+        session = self._sessions.get(phone)
+        if session is None:
+            return VerifyResult.NOT_FOUND
+        if session["expires_at"] <= time.monotonic():
+            del self._sessions[phone]
+            return VerifyResult.EXPIRED
+        if session["attempts"] >= max_attempts:
+            del self._sessions[phone]
+            return VerifyResult.TOO_MANY_ATTEMPTS
+        if session["otp_code"] != otp_code:
+            session["attempts"] += 1
+            return VerifyResult.WRONG_CODE
+        del self._sessions[phone]
+        return VerifyResult.OK
+
@@ -0,0 +1,79 @@
+# =====================================================================================
+# 📄 Phân trang keyset (cursor) dùng chung cho các API trả về danh sách
+# =====================================================================================
+
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from bson.objectid import ObjectId
+
+# Kích thước trang tối đa server cho phép (client xin nhiều hơn sẽ bị cắt)
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+# Các chế độ tính tổng: exact (đếm chính xác), estimate (ước lượng), none (bỏ qua)
+TOTAL_MODES = ("exact", "estimate", "none")
+
+
+class CursorError(ValueError):
+    """Cursor không giải mã được hoặc sai định dạng."""
+
+
+def clamp_limit(limit: int) -> int:
+    """Giới hạn kích thước trang trong khoảng [1, MAX_PAGE_SIZE]."""
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Mã hóa vị trí cuối trang thành chuỗi opaque (base64 url-safe)."""
+    raw = json.dumps(position, separators=(",", ":"), default=_encode_value)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Giải mã cursor do encode_cursor tạo ra. Cursor rỗng trả về None."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise CursorError(f"Cursor không hợp lệ: {e}")
+    if not isinstance(position, dict):
+        raise CursorError("Cursor không hợp lệ")
+    return position
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Không mã hóa được {type(value).__name__} vào cursor")
+
+
+def timestamp_keyset_filter(
+    position: Optional[Dict[str, Any]],
+    field: str = "timestamp",
+    descending: bool = False,
+) -> Dict[str, Any]:
+    """
+    Điều kiện MongoDB để lấy các document đứng sau vị trí (field, _id) của cursor,
+    theo thứ tự sắp xếp [(field, 1), ("_id", 1)] (hoặc -1 nếu `descending`).
+    """
+    if position is None:
+        return {}
+    try:
+        ts = datetime.fromisoformat(position["ts"])
+        last_id = ObjectId(position["id"])
+    except Exception as e:
+        raise CursorError(f"Cursor không hợp lệ: {e}")
+    op = "$lt" if descending else "$gt"
+    return {
+        "$or": [
+            {field: {op: ts}},
+            {field: ts, "_id": {op: last_id}},
+        ]
+    }
@@ -0,0 +1,138 @@
+# =====================================================================================
+# 🔐 Băm / kiểm tra mật khẩu bcrypt trên process pool riêng
+# ✅ Giới hạn hàng đợi + từ chối nhanh (503) khi pool quá tải + rehash khi đổi cost
+# =====================================================================================
+
+import asyncio
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional
+
+from bcrypt import checkpw, gensalt, hashpw
+
+from profiling import span
+
+# Cost factor của bcrypt (số vòng log2), đổi giá trị này sẽ rehash dần khi user đăng nhập
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Số process băm mật khẩu và số yêu cầu được phép xếp hàng thêm khi tất cả đang bận
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", str(PASSWORD_POOL_WORKERS * 4)))
+# Số mật khẩu mỗi lần gửi sang process con khi băm hàng loạt (hash_many)
+PASSWORD_BATCH_CHUNK = int(os.getenv("PASSWORD_BATCH_CHUNK", "16"))
+
+_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class PasswordPoolSaturated(Exception):
+    """Pool băm mật khẩu đã đầy, yêu cầu bị từ chối thay vì xếp hàng vô hạn."""
+
+
+# Các hàm chạy trong process con (phải ở top-level để pickle được)
+def _hash(password: str, rounds: int) -> str:
+    return hashpw(password.encode("utf-8"), gensalt(rounds)).decode("utf-8")
+
+
+def _hash_many(passwords: List[str], rounds: int) -> List[str]:
+    return [_hash(password, rounds) for password in passwords]
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def _noop() -> None:
+    return None
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """Đọc cost factor từ chuỗi hash bcrypt ($2b$12$...)."""
+    match = _COST_RE.match(hashed or "")
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """
+    Chạy bcrypt trên ProcessPoolExecutor để không chiếm threadpool / event loop.
+
+    Tối đa `workers + max_queue` yêu cầu được nhận cùng lúc; vượt quá sẽ raise
+    PasswordPoolSaturated ngay lập tức để endpoint trả 503.
+    """
+
+    def __init__(self, workers: int = PASSWORD_POOL_WORKERS, max_queue: int = PASSWORD_POOL_MAX_QUEUE,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.rounds = rounds
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def start(self):
+        """Khởi tạo sẵn các process con (gọi lúc startup để login đầu tiên không phải chờ)."""
+        await asyncio.get_running_loop().run_in_executor(self._get_executor(), _noop)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, fn, *args):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise PasswordPoolSaturated()
+        self.in_flight += 1
+        try:
+            with span("bcrypt"):
+                return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password, self.rounds)
+
+    async def hash_many(self, passwords: List[str], return_exceptions: bool = False) -> List[Any]:
+        """
+        Băm nhiều mật khẩu song song trên tất cả process (đăng ký hàng loạt).
+        Mỗi lần gửi một lô nhỏ và chỉ giữ tối đa `workers` lô cùng lúc, nên login /
+        đăng ký thường vẫn được xen vào giữa các lô thay vì chờ cả đợt.
+
+        `return_exceptions=True`: lô bị từ chối vì pool đầy không làm mất các lô đã băm
+        xong - vị trí tương ứng trong kết quả là exception PasswordPoolSaturated.
+        """
+        chunks = [passwords[i:i + PASSWORD_BATCH_CHUNK] for i in range(0, len(passwords), PASSWORD_BATCH_CHUNK)]
+        window = asyncio.Semaphore(self.workers)
+
+        async def run(chunk: List[str]) -> List[Any]:
+            async with window:
+                try:
+                    return await self._submit(_hash_many, chunk, self.rounds)
+                except PasswordPoolSaturated as e:
+                    if not return_exceptions:
+                        raise
+                    return [e] * len(chunk)
+
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        return [hashed for chunk in results for hashed in chunk]
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._submit(_verify, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Hash được tạo với cost khác cấu hình hiện tại."""
+        return hash_cost(hashed) != self.rounds
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "rounds": self.rounds,
+        }
@@ -0,0 +1,343 @@
+# =====================================================================================
+# 🔬 Profiling theo từng request: Server-Timing, log request chậm, lấy mẫu stack
+# =====================================================================================
+#
+# - ProfilingMiddleware gắn một RequestTrace vào contextvar cho mỗi request. Thời gian
+#   được cộng theo nhóm (mongo, bcrypt, jwt, serialize...) bằng span("tên"), trả về trong
+#   header Server-Timing (xem trong tab Network của DevTools).
+# - MongoTraceListener (CommandListener của pymongo) cộng thời gian, số lệnh, số document
+#   trả về và hình dạng truy vấn (query shape, không chứa giá trị) vào request hiện tại.
+#   Motor chạy lệnh trên executor với bản sao context nên contextvar vẫn thấy được trace.
+# - Request chậm hơn SLOW_REQUEST_MS được in ra log kèm các query shape tốn thời gian nhất.
+# - PROFILE_SAMPLE_RATE > 0 bật luồng lấy mẫu stack của event loop mỗi
+#   PROFILE_INTERVAL_MS cho một phần request; PROFILE_KEEP request chậm nhất được ghi ra
+#   PROFILE_DIR dạng "folded stacks" (flamegraph.pl, speedscope, inferno...).
+#   Luồng lấy mẫu chỉ đọc sys._current_frames(), không chèn hook vào từng lời gọi hàm
+#   như cProfile, nên chi phí thấp và không phụ thuộc tải.
+
+import heapq
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Số query shape tối đa giữ lại cho một request
+MAX_SHAPES_PER_REQUEST = 50
+
+
+class RequestTrace:
+    def __init__(self, method: str, path: str, sampled: bool = False):
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        # tên nhóm -> [tổng giây, số lần]
+        self.spans: Dict[str, List[float]] = {}
+        self.mongo_commands = 0
+        self.mongo_docs = 0
+        # request_id của lệnh Mongo đang chạy -> query shape
+        self._pending: Dict[int, str] = {}
+        self.shapes: List[Tuple[float, str]] = []
+        self.stacks: Dict[str, int] = {}
+        # CommandListener chạy trên thread của executor
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            total = self.spans.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        parts = []
+        for name, (seconds, count) in self.spans.items():
+            desc = f"{count} cmd, {self.mongo_docs} docs" if name == "mongo" else f"{count}x"
+            parts.append(f'{name};dur={seconds * 1000:.2f};desc="{desc}"')
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Cộng thời gian của khối lệnh vào nhóm `name` của request hiện tại (nếu có)."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+# -----------------------------------------------------------------------------------
+# MongoDB: query shape + thời gian theo request
+# -----------------------------------------------------------------------------------
+_SHAPE_ARGUMENTS = ("filter", "sort", "projection", "q", "query")
+
+
+def _shape(value: Any) -> Any:
+    """Thay giá trị bằng 1, giữ tên trường / toán tử."""
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{key}:{_shape(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return "[" + ",".join(_shape(item) for item in value) + "]"
+    return "1"
+
+
+def query_shape(event) -> str:
+    command = event.command
+    name = event.command_name
+    collection = command.get(name)
+    parts = [name, str(collection) if isinstance(collection, str) else ""]
+    if name == "aggregate":
+        stages = [next(iter(stage), "?") for stage in command.get("pipeline", []) if isinstance(stage, dict)]
+        parts.append(">".join(stages))
+        for stage in command.get("pipeline", []):
+            if isinstance(stage, dict) and "$match" in stage:
+                parts.append(_shape(stage["$match"]))
+                break
+    elif name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        if statements:
+            parts.append(f"q={_shape(statements[0].get('q', {}))} x{len(statements)}")
+    elif name == "insert":
+        parts.append(f"x{len(command.get('documents', []))}")
+    else:
+        for argument in _SHAPE_ARGUMENTS:
+            if argument in command:
+                parts.append(f"{argument}={_shape(command[argument])}")
+    return " ".join(part for part in parts if part)
+
+
+def _returned_documents(reply) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    value = reply.get("value")
+    if value is not None:  # findAndModify
+        return 1
+    return 0
+
+
+class MongoTraceListener(monitoring.CommandListener):
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is not None:
+            with trace._lock:
+                trace._pending[event.request_id] = query_shape(event)
+
+    def _finished(self, event, docs: int):
+        trace = current_trace.get()
+        if trace is None:
+            return
+        seconds = event.duration_micros / 1e6
+        with trace._lock:
+            shape = trace._pending.pop(event.request_id, event.command_name)
+            trace.mongo_commands += 1
+            trace.mongo_docs += docs
+            if len(trace.shapes) < MAX_SHAPES_PER_REQUEST:
+                trace.shapes.append((seconds, shape))
+        trace.add("mongo", seconds)
+
+    def succeeded(self, event):
+        self._finished(event, _returned_documents(event.reply))
+
+    def failed(self, event):
+        self._finished(event, 0)
+
+
+# -----------------------------------------------------------------------------------
+# Lấy mẫu stack của event loop
+# -----------------------------------------------------------------------------------
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Luồng nền đọc stack của thread event loop. Frame coroutine của middleware cho mỗi
+    request được đăng ký kèm trace, nên mẫu được gán cho request đang thực sự chạy trên
+    loop tại thời điểm lấy mẫu (thời gian chờ I/O không xuất hiện trong stack).
+    """
+
+    def __init__(self, interval: float, keep: int, directory: str):
+        self.interval = interval
+        self.keep = keep
+        self.directory = directory
+        self.active: Dict[Any, RequestTrace] = {}
+        self.samples = 0
+        self.written = 0
+        self._slowest: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._file_lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is None:
+            self._thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                trace = self.active.get(frame)
+                if trace is not None:
+                    folded = ";".join(reversed(stack))
+                    with trace._lock:
+                        trace.stacks[folded] = trace.stacks.get(folded, 0) + 1
+                    self.samples += 1
+                    break
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+
+    def finish(self, trace: RequestTrace, elapsed: float, status: str):
+        """Ghi profile nếu request thuộc nhóm PROFILE_KEEP request chậm nhất."""
+        if not trace.stacks:
+            return
+        with self._file_lock:
+            if len(self._slowest) >= self.keep and elapsed <= self._slowest[0][0]:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", trace.path).strip("_") or "root"
+            path = os.path.join(
+                self.directory, f"{int(elapsed * 1000)}ms_{trace.method}_{slug}_{int(time.time())}.folded"
+            )
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"# {trace.method} {trace.path} status={status} elapsed_ms={elapsed * 1000:.1f}\n")
+                for stack, count in sorted(trace.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            self.written += 1
+            heapq.heappush(self._slowest, (elapsed, next(self._sequence), path))
+            if len(self._slowest) > self.keep:
+                _, _, evicted = heapq.heappop(self._slowest)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "profiles_written": self.written,
+            "slowest_ms": [round(elapsed * 1000, 1) for elapsed, _, _ in sorted(self._slowest, reverse=True)],
+        }
+
+
+# -----------------------------------------------------------------------------------
+# Middleware
+# -----------------------------------------------------------------------------------
+class Profiler:
+    """Cấu hình + thống kê dùng chung của middleware (đọc từ /health)."""
+
+    def __init__(
+        self,
+        slow_request_ms: float = SLOW_REQUEST_MS,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+        keep: int = PROFILE_KEEP,
+        directory: str = PROFILE_DIR,
+    ):
+        self.slow_request = slow_request_ms / 1000
+        self.sample_rate = sample_rate
+        self.sampler = StackSampler(interval_ms / 1000, keep, directory) if sample_rate > 0 else None
+        self.slow_requests = 0
+
+    def should_sample(self) -> bool:
+        return self.sampler is not None and random.random() < self.sample_rate
+
+    def finish(self, trace: RequestTrace, status: str):
+        elapsed = trace.elapsed()
+        if elapsed >= self.slow_request:
+            self.slow_requests += 1
+            self._log_slow(trace, elapsed, status)
+        if trace.sampled:
+            self.sampler.finish(trace, elapsed, status)
+
+    def _log_slow(self, trace: RequestTrace, elapsed: float, status: str):
+        spans = " ".join(f"{name}={seconds * 1000:.1f}ms/{count}" for name, (seconds, count) in trace.spans.items())
+        print(f"🐢 Slow request {trace.method} {trace.path} {status} {elapsed * 1000:.1f}ms | {spans or '-'} "
+              f"| mongo_docs={trace.mongo_docs}")
+        for seconds, shape in sorted(trace.shapes, reverse=True)[:5]:
+            print(f"    {seconds * 1000:8.1f}ms  {shape}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PROFILING_ENABLED,
+            "slow_request_ms": self.slow_request * 1000,
+            "slow_requests": self.slow_requests,
+            "sample_rate": self.sample_rate,
+            **(self.sampler.stats() if self.sampler is not None else {}),
+        }
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: tạo RequestTrace cho mỗi request và thêm header Server-Timing."""
+
+    def __init__(self, app, skip_paths=("/metrics", "/health/live", "/health/ready")):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILING_ENABLED or scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"], profiler.should_sample())
+        token = current_trace.set(trace)
+        status_code = "500"
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = str(message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        # Frame coroutine này nằm trong stack mỗi khi request đang chạy trên event loop
+        frame = sys._getframe()
+        if trace.sampled:
+            profiler.sampler.ensure_started()
+            profiler.sampler.active[frame] = trace
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if trace.sampled:
+                profiler.sampler.active.pop(frame, None)
+            current_trace.reset(token)
+            profiler.finish(trace, status_code)
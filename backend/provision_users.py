@@ -0,0 +1,128 @@
+# =====================================================================================
+# 👥 CLI đăng ký user hàng loạt từ file CSV / NDJSON
+# =====================================================================================
+#
+#   python provision_users.py staff.csv                       # cột: username,phone,password
+#   python provision_users.py staff.ndjson --output results.csv --batch-size 2000
+#   python provision_users.py --grant 0900000000             # cho phép gọi POST /api/users/bulk
+#   python provision_users.py --revoke 0900000000
+#
+# Dùng chung logic với POST /api/users/bulk (main.provision_users): kiểm tra trùng bằng
+# một truy vấn $in mỗi lô, băm mật khẩu song song trên mọi core, insert_many unordered.
+# Kết quả từng dòng được ghi ra --output (CSV), mặc định chỉ in các dòng lỗi.
+#
+# Quyền gọi endpoint bulk là cờ can_provision_users trên user, không luồng đăng ký nào cấp
+# cờ này; chỉ người có quyền truy cập MongoDB cấp / thu hồi được qua --grant / --revoke.
+
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+RESULT_FIELDS = ["index", "phone", "username", "status", "error"]
+
+
+def read_rows(path: str) -> Iterator[Dict[str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.endswith((".ndjson", ".jsonl", ".json")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def parse_args(argv: List[str]):
+    parser = argparse.ArgumentParser(description="Đăng ký user hàng loạt")
+    parser.add_argument("input", nargs="?", help="file CSV (username,phone,password) hoặc NDJSON")
+    parser.add_argument("--grant", metavar="PHONE", help="cấp quyền đăng ký hàng loạt cho user")
+    parser.add_argument("--revoke", metavar="PHONE", help="thu hồi quyền đăng ký hàng loạt của user")
+    parser.add_argument("--batch-size", type=int, default=1000, help="số user mỗi lô")
+    parser.add_argument("--output", help="ghi kết quả từng dòng ra file CSV")
+    args = parser.parse_args(argv)
+    if not (args.input or args.grant or args.revoke):
+        parser.error("cần file input hoặc --grant / --revoke")
+    return args
+
+
+async def set_provisioner(main, phone: str, allowed: bool) -> bool:
+    """Cấp / thu hồi cờ quyền đăng ký hàng loạt. Trả về False nếu không có user này."""
+    user = await main.users_collection.find_one_and_update(
+        {"phone": phone}, {"$set": {main.PROVISIONER_FIELD: allowed}}, projection={"_id": 1}
+    )
+    if user is None:
+        return False
+    # Worker đang chạy có thể còn giữ user trong cache xác thực
+    await main.invalidate_user_cache(user["_id"])
+    return True
+
+
+async def _main(argv: List[str]) -> Optional[int]:
+    args = parse_args(argv)
+
+    import main
+
+    try:
+        await main.connect_mongo()
+    except Exception as e:
+        print(f"⚠️ Warning: MongoDB connection error: {e}")
+    if main.users_collection is None:
+        print("❌ MongoDB không kết nối được")
+        return 1
+
+    for phone, allowed in ((args.grant, True), (args.revoke, False)):
+        if phone is None:
+            continue
+        if not await set_provisioner(main, phone, allowed):
+            print(f"❌ Không tìm thấy user {phone}")
+            return 1
+        print(f"✅ {'Granted' if allowed else 'Revoked'} bulk provisioning for {phone}")
+    if not args.input:
+        main.client.close()
+        return 0
+
+    rows = [
+        main.RegisterRequest(
+            username=str(row.get("username") or ""),
+            phone=str(row.get("phone") or ""),
+            password=str(row.get("password") or ""),
+        )
+        for row in read_rows(args.input)
+    ]
+    batch_size = max(1, args.batch_size)
+
+    started = time.perf_counter()
+    results = []
+    created = 0
+    try:
+        await main.password_hasher.start()
+        for offset in range(0, len(rows), batch_size):
+            summary = await main.provision_users(rows[offset:offset + batch_size])
+            for result in summary["results"]:
+                result["index"] += offset
+            results.extend(summary["results"])
+            created += summary["created"]
+            print(f"   {min(offset + batch_size, len(rows))}/{len(rows)} rows, {created} created")
+    finally:
+        main.password_hasher.shutdown()
+        main.client.close()
+
+    failed = [result for result in results if result["status"] != "created"]
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        for result in failed:
+            print(f"   ❌ row {result['index']} ({result['phone']}, {result['username']}): {result['error']}")
+
+    print(f"✅ Provisioned {created} users, {len(failed)} failed in {time.perf_counter() - started:.1f}s")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
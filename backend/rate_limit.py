@@ -0,0 +1,190 @@
+# =====================================================================================
+# 🚦 Giới hạn tần suất (token bucket) theo số điện thoại / IP + giới hạn đồng thời
+# ✅ Backend trong bộ nhớ (mặc định) hoặc MongoDB (dùng chung giữa nhiều worker)
+# =====================================================================================
+#
+# Mỗi policy gồm `burst` (số request tối đa liên tiếp) và `rate` (token hồi lại mỗi giây),
+# cấu hình dạng "số_request/số_giây", vd. "5/60" = tối đa 5 request, hồi 5 token mỗi 60s.
+# Bị giới hạn thì trả về số giây cần chờ để endpoint gửi 429 + Retry-After.
+#
+# Backend bộ nhớ là riêng của từng worker: với N worker (serve.py --workers N) mỗi key
+# thực tế được tối đa N x burst request, và N x rate khi load balancer chia đều. Cần giới
+# hạn chính xác khi chạy nhiều worker thì dùng RATE_LIMIT_BACKEND=mongo.
+
+import asyncio
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+
+class Policy(NamedTuple):
+    name: str
+    burst: float
+    rate: float  # token mỗi giây
+
+
+def parse_policy(name: str, spec: str) -> Policy:
+    """Đọc policy dạng "count/seconds" (vd. "5/60")."""
+    count, seconds = spec.split("/")
+    count, seconds = float(count), float(seconds)
+    if count <= 0 or seconds <= 0:
+        raise ValueError(f"Rate limit không hợp lệ cho {name}: {spec}")
+    return Policy(name, count, count / seconds)
+
+
+def retry_after_seconds(wait: float) -> str:
+    """Giá trị header Retry-After (số nguyên giây, tối thiểu 1)."""
+    return str(max(1, math.ceil(wait)))
+
+
+class MemoryBuckets:
+    """
+    Bucket trong dict của process; chạy trong event loop nên không cần khóa.
+    Chỉ đếm request của worker hiện tại (xem ghi chú đầu file).
+    """
+
+    # Dọn các bucket đã đầy lại (không còn ý nghĩa) khi số bucket vượt ngưỡng này
+    SWEEP_THRESHOLD = 50000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _sweep(self, now: float, policies: Dict[str, Policy]):
+        for key, (tokens, updated) in list(self._buckets.items()):
+            policy = policies.get(key.split(":", 1)[0])
+            if policy is None or tokens + (now - updated) * policy.rate >= policy.burst:
+                del self._buckets[key]
+
+    def take(self, policy: Policy, key: str, policies: Dict[str, Policy]) -> float:
+        """Lấy một token. Trả về 0 nếu được phép, ngược lại số giây cần chờ."""
+        now = time.monotonic()
+        if len(self._buckets) >= self.SWEEP_THRESHOLD:
+            self._sweep(now, policies)
+        bucket_key = f"{policy.name}:{key}"
+        tokens, updated = self._buckets.get(bucket_key, (policy.burst, now))
+        tokens = min(policy.burst, tokens + (now - updated) * policy.rate)
+        if tokens >= 1:
+            self._buckets[bucket_key] = (tokens - 1, now)
+            return 0.0
+        self._buckets[bucket_key] = (tokens, now)
+        return (1 - tokens) / policy.rate
+
+
+class MongoBuckets:
+    """
+    Bucket trong collection `rate_limits` (một document mỗi key), cập nhật nguyên tử bằng
+    một find_one_and_update với aggregation pipeline (MongoDB 4.2+): hồi token theo thời
+    gian, trừ 1 nếu còn, ghi lại. Document hết hạn nhờ TTL index trên expires_at.
+    """
+
+    def __init__(self, get_collection: Callable[[], object]):
+        self._get_collection = get_collection
+
+    async def take(self, policy: Policy, key: str) -> Optional[float]:
+        """Như MemoryBuckets.take; trả về None nếu MongoDB không sẵn sàng."""
+        collection = self._get_collection()
+        if collection is None:
+            return None
+        now = datetime.utcnow()
+        # Bucket rỗng hồi đầy sau burst / rate giây, sau đó document không còn cần thiết
+        ttl = timedelta(seconds=policy.burst / policy.rate + 60)
+        refilled = {"$min": [policy.burst, {"$add": [
+            {"$ifNull": ["$tokens", policy.burst]},
+            {"$multiply": [policy.rate, {"$divide": [
+                {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}]},
+        ]}]}
+        doc = await collection.find_one_and_update(
+            {"_id": f"{policy.name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now, "expires_at": now + ttl}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return 0.0
+        return (1 - doc["tokens"]) / policy.rate
+
+
+class RateLimiter:
+    """
+    Kiểm tra nhiều key (vd. số điện thoại và IP) theo các policy đã đăng ký. Khi dùng
+    backend MongoDB mà MongoDB lỗi / mất kết nối thì tạm dùng bucket trong bộ nhớ.
+    """
+
+    def __init__(self, shared: Optional[MongoBuckets] = None):
+        self.policies: Dict[str, Policy] = {}
+        self.local = MemoryBuckets()
+        self.shared = shared
+        self.limited: Dict[str, int] = {}
+        self.shared_errors = 0
+
+    def add_policy(self, policy: Policy) -> Policy:
+        self.policies[policy.name] = policy
+        self.limited.setdefault(policy.name, 0)
+        return policy
+
+    async def _take(self, policy: Policy, key: str) -> float:
+        if self.shared is not None:
+            try:
+                wait = await self.shared.take(policy, key)
+                if wait is not None:
+                    return wait
+            except Exception as e:
+                self.shared_errors += 1
+                if self.shared_errors == 1:
+                    print(f"⚠️ Warning: Shared rate limiter unavailable, using local buckets: {e}")
+        return self.local.take(policy, key, self.policies)
+
+    async def check(self, *checks: Tuple[Policy, Optional[str]]) -> float:
+        """
+        Lấy token từ từng (policy, key); key None được bỏ qua.
+        Trả về 0 nếu tất cả được phép, ngược lại số giây chờ lớn nhất.
+        """
+        active = [(policy, key) for policy, key in checks if key]
+        waits = await asyncio.gather(*(self._take(policy, key) for policy, key in active))
+        wait = 0.0
+        for (policy, _), policy_wait in zip(active, waits):
+            if policy_wait > 0:
+                self.limited[policy.name] += 1
+                wait = max(wait, policy_wait)
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "backend": "mongo" if self.shared is not None else "memory",
+            "local_buckets": len(self.local),
+            "limited": dict(self.limited),
+            "shared_errors": self.shared_errors,
+        }
+
+
+class ConcurrencyLimit:
+    """Giới hạn số request đồng thời của một nhóm route; vượt giới hạn thì từ chối ngay (không xếp hàng)."""
+
+    def __init__(self, limit: int, name: str):
+        self.limit = limit
+        self.name = name
+        self.active = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.active >= self.limit:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {"active": self.active, "limit": self.limit, "rejected": self.rejected}
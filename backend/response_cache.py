@@ -0,0 +1,76 @@
+# =====================================================================================
+# 🗃️ Cache response (body đã serialize) + ETag / If-None-Match -> 304
+# =====================================================================================
+#
+# Mỗi entry gắn với một hoặc nhiều "tag" (vd. catalog, transactions). Khi dữ liệu của tag
+# thay đổi, invalidate(tag) tăng số thế hệ của tag; các key cũ không còn được tra tới và
+# tự bị đẩy ra khỏi LRU. Cache nằm trong từng worker nên ghi ở worker khác chỉ được
+# thấy sau khi entry hết hạn (TTL).
+
+import hashlib
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+
+from cache import TTLCache
+from fast_json import FastJSONResponse
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    cache_control: str
+
+
+def make_etag(body: bytes) -> str:
+    """ETag mạnh tính từ nội dung: cùng dữ liệu thì cùng ETag, kể cả sau khi cache bị xóa."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match dùng so sánh yếu: bỏ tiền tố W/
+    candidates = (tag.strip() for tag in header.split(","))
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int, ttl: float, name: str = "responses"):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, name=name)
+        self._generations: Dict[str, int] = defaultdict(int)
+        self.not_modified = 0
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self._generations[tag] += 1
+
+    def key(self, route: str, params: Iterable[Tuple[str, Any]], tags: Iterable[str]) -> Hashable:
+        return (route, tuple(params), tuple((tag, self._generations[tag]) for tag in tags))
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        return self.cache.get(key)
+
+    def put(self, key: Hashable, body: bytes, cache_control: str, ttl: Optional[float] = None) -> CachedResponse:
+        entry = CachedResponse(body, make_etag(body), cache_control)
+        self.cache.set(key, entry, ttl)
+        return entry
+
+    def respond(self, request: Request, entry: CachedResponse, hit: bool) -> Response:
+        """Trả 304 nếu client đã có đúng phiên bản, ngược lại trả body kèm ETag."""
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": entry.cache_control,
+            "X-Cache": "HIT" if hit else "MISS",
+        }
+        if etag_matches(request, entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return FastJSONResponse(content=entry.body, headers=headers)
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "not_modified": self.not_modified}
@@ -0,0 +1,481 @@
+# =====================================================================================
+# 📊 Bảng tổng hợp doanh thu (rollup) theo ngày / tháng
+# ✅ Cập nhật tăng dần khi có giao dịch mới + lệnh rebuild từ dữ liệu cũ
+# =====================================================================================
+#
+# Mỗi document trong `revenue_rollups` là một bucket của một tên thuốc:
+#   {granularity: "day" | "month", bucket: "2025-01-31" | "2025-01",
+#    medicine, chain_id, count, transactions, qty, sum_eth, sum_usd}
+#
+# Giỏ hàng (medicine là danh sách dòng thuốc) được tách thành từng dòng (medicine_lines):
+# - count: số giao dịch có thuốc này; qty: tổng số lượng
+# - sum_eth / sum_usd: phần tiền của dòng (theo tỷ lệ), cộng các dòng = tiền giao dịch
+# - transactions: 1 ở dòng đầu tiên của giao dịch, 0 ở các dòng còn lại, nên tổng
+#   `transactions` của một tháng là số giao dịch (month_summary)
+#
+# add_purchase tăng bucket bằng $inc (atomic trên từng document, không đọc-sửa-ghi).
+# RollupMaintainer giữ cho tổng luôn đúng khi rollup bị lệch:
+# - $inc lỗi -> rollup "stale" (cờ cục bộ + document {_id: "revenue_rollups"} trong
+#   service_state để các worker khác cũng biết); trong lúc stale, month_summary tính thẳng
+#   từ collection transactions
+# - worker leader kiểm tra khi nhận lease (rollup rỗng / thiếu giao dịch so với
+#   transactions, vd. DB có sẵn dữ liệu trước khi có rollup) và khi có cờ stale -> rebuild
+# Rebuild thủ công:  python rollups.py rebuild
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+GRANULARITIES = {
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+
+# Khóa duy nhất của một bucket
+ROLLUP_KEY = [
+    ("granularity", ASCENDING),
+    ("bucket", ASCENDING),
+    ("medicine", ASCENDING),
+    ("chain_id", ASCENDING),
+]
+ROLLUP_INDEX_NAME = "rollup_key_unique"
+UNKNOWN_MEDICINE = "unknown"
+# Giao dịch bị tx_verifier xác minh thất bại: không tính vào doanh thu
+FAILED_STATUS = "failed"
+# Các giao dịch được tính vào rollup (cùng quy tắc với counts_as_revenue)
+REVENUE_FILTER = {"timestamp": {"$type": "date"}, "status": {"$ne": FAILED_STATUS}}
+
+ROLLUP_CHECK_SECONDS = float(os.getenv("ROLLUP_CHECK_SECONDS", "60"))
+SHARED_ROLLUP_ID = "revenue_rollups"
+
+
+def month_bucket(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}"
+
+
+def _number(value: Any, default: float) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def medicine_lines(tx: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+    """
+    Các dòng thuốc của một giao dịch: (tên, số lượng, tỷ lệ trên tổng tiền giao dịch).
+    Tỷ lệ tính theo giá từng dòng client gửi (hoặc theo số lượng nếu không có giá),
+    để doanh thu theo thuốc cộng lại đúng bằng price_eth / price_usd của giao dịch.
+    """
+    medicine = tx.get("medicine")
+    if medicine is None:
+        return []
+    if not isinstance(medicine, list):
+        return [(str(medicine), 1.0, 1.0)]
+
+    lines = []
+    for item in medicine:
+        if isinstance(item, dict):
+            name = str(item.get("name") or item.get("id") or UNKNOWN_MEDICINE)
+            qty = _number(item.get("qty"), 1.0)
+            lines.append((name, qty, qty * _number(item.get("price_usd"), 0.0)))
+    weights = [value for _, _, value in lines]
+    total = sum(weights)
+    if total <= 0:
+        weights = [qty for _, qty, _ in lines]
+        total = sum(weights)
+    return [(name, qty, weight / total if total else 0.0) for (name, qty, _), weight in zip(lines, weights)]
+
+
+def counts_as_revenue(tx: Dict[str, Any]) -> bool:
+    """Quy tắc chung cho cộng dồn ($inc), rebuild và snapshot phân tích."""
+    return tx.get("status") != FAILED_STATUS
+
+
+def rollup_lines(tx: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+    """medicine_lines, giao dịch không có dòng thuốc nào được tính vào "unknown"."""
+    return medicine_lines(tx) or [(UNKNOWN_MEDICINE, 1.0, 1.0)]
+
+
+def rollup_updates(transactions: Iterable[Dict[str, Any]], sign: int = 1) -> List[UpdateOne]:
+    """
+    Tạo danh sách lệnh $inc (upsert) cho các bucket ngày và tháng của từng dòng thuốc.
+    `sign=-1` để trừ các giao dịch đã cộng trước đó (vd. giao dịch bị xác minh thất bại,
+    truyền document trước khi đổi trạng thái). Giao dịch đang "failed" không được tính.
+    """
+    increments: Dict[tuple, Dict[str, float]] = {}
+    for tx in transactions:
+        ts = tx.get("timestamp")
+        if not isinstance(ts, datetime) or not counts_as_revenue(tx):
+            continue
+        price_eth = float(tx.get("price_eth") or 0)
+        price_usd = float(tx.get("price_usd") or 0)
+        for granularity, fmt in GRANULARITIES.items():
+            bucket = ts.strftime(fmt)
+            for i, (name, qty, share) in enumerate(rollup_lines(tx)):
+                key = (granularity, bucket, name, tx.get("chain_id"))
+                inc = increments.setdefault(
+                    key, {"count": 0, "transactions": 0, "qty": 0.0, "sum_eth": 0.0, "sum_usd": 0.0}
+                )
+                inc["count"] += sign
+                inc["transactions"] += sign if i == 0 else 0
+                inc["qty"] += sign * qty
+                inc["sum_eth"] += sign * price_eth * share
+                inc["sum_usd"] += sign * price_usd * share
+
+    return [
+        UpdateOne(
+            {"granularity": granularity, "bucket": bucket, "medicine": medicine, "chain_id": chain_id},
+            {"$inc": inc},
+            upsert=True,
+        )
+        for (granularity, bucket, medicine, chain_id), inc in increments.items()
+    ]
+
+
+async def apply_transactions(rollups_collection, transactions: Iterable[Dict[str, Any]], sign: int = 1):
+    """Cộng dồn các giao dịch mới vào bảng rollup (hoặc trừ ra nếu `sign=-1`)."""
+    updates = rollup_updates(transactions, sign)
+    if updates:
+        await rollups_collection.bulk_write(updates, ordered=False)
+
+
+async def month_summary(rollups_collection, year: int, month: int) -> Dict[str, Any]:
+    """Tổng doanh thu của một tháng, tính trên các bucket tháng (O(số bucket))."""
+    summary = await rollups_collection.aggregate([
+        {"$match": {"granularity": "month", "bucket": month_bucket(year, month)}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": "$transactions"},
+            "sum_eth": {"$sum": "$sum_eth"},
+            "sum_usd": {"$sum": "$sum_usd"},
+        }},
+    ]).to_list(length=1)
+    if not summary:
+        return {"count": 0, "sum_eth": 0, "sum_usd": 0}
+    return {"count": summary[0]["count"], "sum_eth": summary[0]["sum_eth"], "sum_usd": summary[0]["sum_usd"]}
+
+
+async def transactions_month_summary(transactions_collection, year: int, month: int) -> Dict[str, Any]:
+    """Tổng doanh thu của một tháng tính thẳng từ transactions (O(số giao dịch trong tháng))."""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    summary = await transactions_collection.aggregate([
+        {"$match": {"timestamp": {"$gte": start, "$lt": end}, "status": {"$ne": FAILED_STATUS}}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "sum_eth": {"$sum": {"$ifNull": ["$price_eth", 0]}},
+            "sum_usd": {"$sum": {"$ifNull": ["$price_usd", 0]}},
+        }},
+    ]).to_list(length=1)
+    if not summary:
+        return {"count": 0, "sum_eth": 0, "sum_usd": 0}
+    return {"count": summary[0]["count"], "sum_eth": summary[0]["sum_eth"], "sum_usd": summary[0]["sum_usd"]}
+
+
+async def rolled_up_transactions(rollups_collection) -> int:
+    """Số giao dịch đã được cộng vào rollup (tổng `transactions` của các bucket tháng)."""
+    summary = await rollups_collection.aggregate([
+        {"$match": {"granularity": "month"}},
+        {"$group": {"_id": None, "transactions": {"$sum": "$transactions"}}},
+    ]).to_list(length=1)
+    return int(summary[0]["transactions"]) if summary else 0
+
+
+def _to_double(value: Any, default: float) -> Dict[str, Any]:
+    return {"$convert": {"input": value, "to": "double", "onError": default, "onNull": default}}
+
+
+def _to_name(value: Any) -> Dict[str, Any]:
+    return {"$convert": {"input": value, "to": "string", "onError": UNKNOWN_MEDICINE, "onNull": UNKNOWN_MEDICINE}}
+
+
+# Tách giao dịch thành từng dòng thuốc giống medicine_lines / rollup_lines:
+# medicine -> {name, qty, value}, sau $unwind mỗi document là một dòng, kèm `line`
+# (vị trí dòng trong giỏ) và `share` (tỷ lệ trên tổng tiền giao dịch)
+_LINES_STAGES = [
+    {"$project": {
+        "timestamp": 1, "chain_id": 1, "price_eth": 1, "price_usd": 1,
+        "medicine": {"$switch": {
+            "branches": [
+                {"case": {"$isArray": "$medicine"}, "then": {"$map": {
+                    "input": {"$filter": {"input": "$medicine", "cond": {"$eq": [{"$type": "$$this"}, "object"]}}},
+                    "as": "item",
+                    "in": {
+                        "name": _to_name({"$ifNull": ["$$item.name", "$$item.id"]}),
+                        "qty": _to_double("$$item.qty", 1.0),
+                        "value": {"$multiply": [_to_double("$$item.qty", 1.0), _to_double("$$item.price_usd", 0.0)]},
+                    },
+                }}},
+                {"case": {"$eq": [{"$ifNull": ["$medicine", None]}, None]}, "then": []},
+            ],
+            "default": [{"name": _to_name("$medicine"), "qty": 1.0, "value": 1.0}],
+        }},
+    }},
+    {"$addFields": {"medicine": {"$cond": [
+        {"$eq": [{"$size": "$medicine"}, 0]},
+        [{"name": UNKNOWN_MEDICINE, "qty": 1.0, "value": 1.0}],
+        "$medicine",
+    ]}}},
+    {"$addFields": {"total_value": {"$sum": "$medicine.value"}, "total_qty": {"$sum": "$medicine.qty"}}},
+    {"$unwind": {"path": "$medicine", "includeArrayIndex": "line"}},
+    {"$addFields": {"share": {"$switch": {
+        "branches": [
+            {"case": {"$gt": ["$total_value", 0]}, "then": {"$divide": ["$medicine.value", "$total_value"]}},
+            {"case": {"$ne": ["$total_qty", 0]}, "then": {"$divide": ["$medicine.qty", "$total_qty"]}},
+        ],
+        "default": 0,
+    }}}},
+]
+
+
+async def rebuild(transactions_collection, rollups_collection, batch_size: int = 1000) -> int:
+    """
+    Dựng lại toàn bộ rollup từ collection transactions.
+
+    Kết quả được ghi vào collection tạm rồi đổi tên đè lên collection rollup
+    (renameCollection dropTarget), nên API đọc không thấy trạng thái nửa chừng.
+    Giao dịch ghi vào trong lúc rebuild có thể bị thiếu - nên chạy khi ít tải.
+    """
+    db = rollups_collection.database
+    temp = db[f"{rollups_collection.name}_rebuild"]
+    await temp.drop()
+
+    written = 0
+    for granularity, fmt in GRANULARITIES.items():
+        pipeline = [
+            # Cùng quy tắc với counts_as_revenue
+            {"$match": {"timestamp": {"$type": "date"}, "status": {"$ne": FAILED_STATUS}}},
+            *_LINES_STAGES,
+            {"$group": {
+                "_id": {
+                    "bucket": {"$dateToString": {"format": fmt, "date": "$timestamp"}},
+                    "medicine": "$medicine.name",
+                    "chain_id": "$chain_id",
+                },
+                "count": {"$sum": 1},
+                "transactions": {"$sum": {"$cond": [{"$eq": ["$line", 0]}, 1, 0]}},
+                "qty": {"$sum": "$medicine.qty"},
+                "sum_eth": {"$sum": {"$multiply": [{"$ifNull": ["$price_eth", 0]}, "$share"]}},
+                "sum_usd": {"$sum": {"$multiply": [{"$ifNull": ["$price_usd", 0]}, "$share"]}},
+            }},
+        ]
+        batch = []
+        async for row in transactions_collection.aggregate(pipeline, allowDiskUse=True):
+            batch.append({
+                "granularity": granularity,
+                "bucket": row["_id"]["bucket"],
+                "medicine": row["_id"].get("medicine"),
+                "chain_id": row["_id"].get("chain_id"),
+                "count": row["count"],
+                "transactions": row["transactions"],
+                "qty": row["qty"],
+                "sum_eth": row["sum_eth"],
+                "sum_usd": row["sum_usd"],
+            })
+            if len(batch) >= batch_size:
+                await temp.insert_many(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        if batch:
+            await temp.insert_many(batch, ordered=False)
+            written += len(batch)
+
+    await temp.create_index(ROLLUP_KEY, name=ROLLUP_INDEX_NAME, unique=True)
+    if written:
+        await temp.rename(rollups_collection.name, dropTarget=True)
+    else:
+        await rollups_collection.delete_many({})
+        await temp.drop()
+    return written
+
+
+class RollupMaintainer:
+    """
+    Cập nhật rollup và theo dõi khi nào không còn tin được bảng rollup (xem đầu file).
+    Collection lấy qua getter vì chỉ có khi MongoDB sẵn sàng; `get_shared` là collection
+    service_state (None: cờ stale chỉ có hiệu lực trong process này).
+    """
+
+    def __init__(
+        self,
+        get_transactions: Callable[[], Any],
+        get_rollups: Callable[[], Any],
+        get_shared: Optional[Callable[[], Any]] = None,
+        check_seconds: float = ROLLUP_CHECK_SECONDS,
+    ):
+        self._get_transactions = get_transactions
+        self._get_rollups = get_rollups
+        self._get_shared = get_shared
+        self.check_seconds = check_seconds
+        # Chỉ leader kiểm tra / rebuild (LEADER_ELECTION=mongo), follower chỉ đọc cờ stale
+        self.leader = True
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.rebuilds = 0
+        self._stale_since: Optional[datetime] = None  # $inc lỗi ở process này
+        self._shared_stale_since: Optional[datetime] = None  # worker khác báo lỗi
+        self._checked = False
+        self._rebuilding: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def stale(self) -> bool:
+        return self._stale_since is not None or self._shared_stale_since is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def request_check(self):
+        """Kiểm tra lại rollup ở vòng kế tiếp (vd. khi vừa trở thành leader)."""
+        self._checked = False
+
+    def _shared(self):
+        return self._get_shared() if self._get_shared is not None else None
+
+    async def apply(self, transactions: Iterable[Dict[str, Any]], sign: int = 1):
+        """apply_transactions; lỗi không raise (giao dịch đã ghi) mà đánh dấu rollup stale."""
+        try:
+            await apply_transactions(self._get_rollups(), transactions, sign)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print(f"⚠️ Warning: Could not update revenue rollups, totals are read from transactions until rebuilt: {e}")
+            await self.mark_stale()
+
+    async def mark_stale(self):
+        now = datetime.utcnow()
+        if self._stale_since is None:
+            self._stale_since = now
+        collection = self._shared()
+        if collection is None:
+            return
+        try:
+            await collection.update_one(
+                {"_id": SHARED_ROLLUP_ID, "stale_since": None}, {"$set": {"stale_since": now}}, upsert=True
+            )
+        except Exception:
+            # Đã có cờ (DuplicateKeyError) hoặc MongoDB lỗi: cờ cục bộ vẫn giữ tổng đúng ở worker này
+            pass
+
+    async def sync(self):
+        """Đọc cờ stale chung; bỏ cờ cục bộ khi đã có rebuild bắt đầu sau lần lỗi."""
+        collection = self._shared()
+        if collection is None:
+            return
+        doc = await collection.find_one({"_id": SHARED_ROLLUP_ID}) or {}
+        rebuilt_at = doc.get("rebuilt_at")
+        if self._stale_since is not None and rebuilt_at is not None and rebuilt_at >= self._stale_since:
+            self._stale_since = None
+        self._shared_stale_since = doc.get("stale_since")
+
+    async def check(self) -> bool:
+        """Rebuild khi rollup đang stale, rỗng hoặc số giao dịch lệch so với transactions."""
+        reason = "stale" if self.stale else None
+        if reason is None:
+            expected = await self._get_transactions().count_documents(REVENUE_FILTER)
+            counted = await rolled_up_transactions(self._get_rollups())
+            if counted != expected:
+                reason = "empty" if counted == 0 else f"{counted}/{expected} transactions"
+        self._checked = True
+        if reason is None:
+            return False
+        print(f"🔄 Rebuilding revenue rollups ({reason})")
+        await self.rebuild()
+        return True
+
+    async def _rebuild(self) -> int:
+        started = datetime.utcnow()
+        written = await rebuild(self._get_transactions(), self._get_rollups())
+        self.rebuilds += 1
+        # Giao dịch ghi trong lúc rebuild có thể bị thiếu: còn lệch thì vẫn stale, thử lại sau
+        expected = await self._get_transactions().count_documents(REVENUE_FILTER)
+        if await rolled_up_transactions(self._get_rollups()) != expected:
+            self.last_error = "rollups changed during rebuild"
+            await self.mark_stale()
+            return written
+        if self._stale_since is not None and self._stale_since <= started:
+            self._stale_since = None
+        collection = self._shared()
+        if collection is not None:
+            await collection.update_one(
+                {"_id": SHARED_ROLLUP_ID}, {"$set": {"rebuilt_at": started}}, upsert=True
+            )
+            await collection.update_one(
+                {"_id": SHARED_ROLLUP_ID, "stale_since": {"$lte": started}}, {"$set": {"stale_since": None}}
+            )
+            self._shared_stale_since = None
+        return written
+
+    async def rebuild(self) -> int:
+        """Dựng lại rollup; các lời gọi đồng thời dùng chung một lần (giống SalesAnalytics)."""
+        if self._rebuilding is None or self._rebuilding.done():
+            self._rebuilding = asyncio.ensure_future(self._rebuild())
+        return await asyncio.shield(self._rebuilding)
+
+    async def month_summary(self, year: int, month: int) -> Dict[str, Any]:
+        if self.stale:
+            return await transactions_month_summary(self._get_transactions(), year, month)
+        return await month_summary(self._get_rollups(), year, month)
+
+    async def _run(self):
+        while True:
+            try:
+                if self._get_transactions() is not None and self._get_rollups() is not None:
+                    await self.sync()
+                    if self.leader and (not self._checked or self.stale):
+                        await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"⚠️ Warning: Revenue rollup check failed: {e}")
+            await asyncio.sleep(self.check_seconds)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "stale": self.stale,
+            "leader": self.leader,
+            "rebuilds": self.rebuilds,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+# -----------------------------------------------------------------------------------
+# CLI:  python rollups.py rebuild
+# -----------------------------------------------------------------------------------
+async def _main(argv: List[str]) -> Optional[int]:
+    if argv[1:] != ["rebuild"]:
+        print("Usage: python rollups.py rebuild")
+        return 2
+
+    import main
+
+    try:
+        await main.connect_mongo()
+    except Exception as e:
+        print(f"⚠️ Warning: MongoDB connection error: {e}")
+    if main.transactions_collection is None or main.revenue_rollups_collection is None:
+        print("❌ MongoDB không kết nối được")
+        return 1
+    # Qua RollupMaintainer để xóa luôn cờ stale chung
+    written = await main.rollup_maintainer.rebuild()
+    print(f"✅ Rebuilt revenue rollups: {written} buckets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv)))
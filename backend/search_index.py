@@ -0,0 +1,300 @@
+# =====================================================================================
+# 🔎 Chỉ mục tìm kiếm thuốc (drugs + products) trong bộ nhớ
+# ✅ Trigram + bỏ dấu tiếng Việt + xếp hạng theo độ liên quan + chịu lỗi chính tả
+# =====================================================================================
+
+import bisect
+import heapq
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fast_json import dumps
+
+# Các trường lấy từ MongoDB để dựng chỉ mục (projection)
+INDEX_FIELDS = {"name": 1, "batch": 1, "owner": 1, "price": 1, "stage": 1, "description": 1}
+
+# Ngưỡng tương đồng trigram tối thiểu để coi là khớp (cho phép gõ sai vài ký tự)
+MIN_SIMILARITY = 0.3
+
+
+def fold_text(text: Any) -> str:
+    """
+    Chuẩn hóa chuỗi để so khớp: chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d),
+    thay ký tự không phải chữ/số bằng khoảng trắng.
+    """
+    if not text:
+        return ""
+    text = str(text).lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    chars = []
+    for ch in decomposed:
+        if unicodedata.combining(ch):
+            continue
+        chars.append(ch if ch.isalnum() else " ")
+    return " ".join("".join(chars).split())
+
+
+def trigrams(folded: str) -> set:
+    """Tách chuỗi đã chuẩn hóa thành tập trigram (có đệm đầu/cuối mỗi từ)."""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def short_substrings(term: str) -> set:
+    """Các chuỗi con 1-2 ký tự của một từ (từ khóa ngắn hơn trigram được tra theo đây)."""
+    return {term[i:i + n] for n in (1, 2) for i in range(len(term) - n + 1)}
+
+
+def format_item(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Định dạng document thuốc thành item trả về cho frontend."""
+    return {
+        "id": str(doc.get("_id", "")),
+        "name": doc.get("name", ""),
+        "batch": doc.get("batch", ""),
+        "owner": doc.get("owner", ""),
+        "price": doc.get("price", 0),
+        "stage": doc.get("stage", 0),
+        "description": doc.get("description", ""),
+    }
+
+
+class SearchIndex:
+    """
+    Chỉ mục từ khóa trên một view hợp nhất của `drugs` và `products`.
+
+    Mỗi tên thuốc được tách thành các từ (đã bỏ dấu). Từ khóa tìm kiếm được
+    mở rộng thành các từ trong từ điển (khớp chính xác, khớp tiền tố hoặc gần
+    giống theo trigram), sau đó giao các posting list để lấy ứng viên. Chi phí
+    truy vấn phụ thuộc vào kích thước từ điển và số ứng viên, không quét collection.
+    """
+
+    def __init__(self):
+        self._keys: Dict[Tuple[str, str], int] = {}
+        self._items: Dict[int, Dict[str, Any]] = {}
+        # JSON của từng item, serialize một lần khi thêm vào chỉ mục
+        self._encoded: Dict[int, bytes] = {}
+        self._folded: Dict[int, str] = {}
+        self._postings: Dict[str, set] = defaultdict(set)
+        self._term_grams: Dict[str, set] = defaultdict(set)
+        # Chuỗi con 1-2 ký tự -> các từ chứa nó (tiền tố hoặc ở giữa từ)
+        self._short_terms: Dict[str, set] = defaultdict(set)
+        self._next_id = 0
+        self._sorted: Optional[Tuple[List[int], List[str]]] = None
+        self.ready = False
+
+    def __len__(self):
+        return len(self._items)
+
+    # -------------------------------------------------------------------------------
+    # Cập nhật chỉ mục
+    # -------------------------------------------------------------------------------
+    def _add(self, source: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+        key = (source, str(doc.get("_id", "")))
+        doc_id = self._next_id
+        self._next_id += 1
+        folded = fold_text(doc.get("name", ""))
+        self._keys[key] = doc_id
+        item = format_item(doc)
+        self._items[doc_id] = item
+        self._encoded[doc_id] = dumps(item)
+        self._folded[doc_id] = folded
+        for term in set(folded.split()):
+            if term not in self._postings:
+                for gram in trigrams(term):
+                    self._term_grams[gram].add(term)
+                for part in short_substrings(term):
+                    self._short_terms[part].add(term)
+            self._postings[term].add(doc_id)
+        self._sorted = None
+        return item
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, Dict[str, Any]]]) -> "SearchIndex":
+        """Dựng một chỉ mục mới từ danh sách (source, document). Có thể chạy ngoài event loop."""
+        fresh = cls()
+        for source, doc in docs:
+            fresh._add(source, doc)
+        fresh.ready = True
+        return fresh
+
+    def replace_with(self, other: "SearchIndex"):
+        """Hoán đổi toàn bộ nội dung bằng chỉ mục khác trong một lần gán."""
+        self.__dict__ = other.__dict__
+
+    def upsert(self, source: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Thêm hoặc cập nhật một document, trả về item đã định dạng."""
+        self.remove(source, doc.get("_id", ""))
+        return self._add(source, doc)
+
+    def remove(self, source: str, doc_id: Any) -> bool:
+        """Xóa một document khỏi chỉ mục. Trả về False nếu không có trong chỉ mục."""
+        internal_id = self._keys.pop((source, str(doc_id)), None)
+        if internal_id is None:
+            return False
+        for term in set(self._folded.pop(internal_id, "").split()):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.discard(internal_id)
+            if not posting:
+                del self._postings[term]
+                for lookup, keys in ((self._term_grams, trigrams(term)),
+                                     (self._short_terms, short_substrings(term))):
+                    for key in keys:
+                        terms = lookup.get(key)
+                        if terms is not None:
+                            terms.discard(term)
+                            if not terms:
+                                del lookup[key]
+        self._items.pop(internal_id, None)
+        self._encoded.pop(internal_id, None)
+        self._sorted = None
+        return True
+
+    def diff(self, other: "SearchIndex") -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Thay đổi từ chỉ mục này sang `other`: (item thêm mới / thay đổi, id item bị xóa)."""
+        upserts = []
+        for key, doc_id in other._keys.items():
+            old_id = self._keys.get(key)
+            if old_id is None or self._encoded[old_id] != other._encoded[doc_id]:
+                upserts.append(other._items[doc_id])
+        removed = [item_id for source, item_id in self._keys if (source, item_id) not in other._keys]
+        return upserts, removed
+
+    # -------------------------------------------------------------------------------
+    # Truy vấn
+    # -------------------------------------------------------------------------------
+    def _expand(self, word: str) -> List[Tuple[str, float]]:
+        """Mở rộng một từ khóa thành các từ trong từ điển kèm điểm khớp, điểm cao trước."""
+        if len(word) < 3:
+            # Từ khóa 1-2 ký tự không có trigram đặc trưng: chỉ xét các từ chứa nó (tiền tố /
+            # chuỗi con như $regex cũ), tra trong _short_terms thay vì quét cả từ điển
+            candidates = ((term, 0) for term in self._short_terms.get(word, ()))
+        else:
+            grams = trigrams(word)
+            counts: Counter = Counter()
+            for gram in grams:
+                terms = self._term_grams.get(gram)
+                if terms:
+                    counts.update(terms)
+            candidates = counts.items()
+
+        matches = []
+        for term, shared in candidates:
+            if term == word:
+                score = 1.0
+            elif term.startswith(word):
+                score = 0.7 + 0.3 * len(word) / len(term)
+            elif word in term:
+                score = 0.4 + 0.2 * len(word) / len(term)
+            elif len(word) < 3:
+                continue
+            else:
+                similarity = shared / (len(grams) + len(trigrams(term)) - shared)
+                if similarity < MIN_SIMILARITY:
+                    continue
+                score = 0.6 * similarity
+            matches.append((term, score))
+        matches.sort(key=lambda pair: -pair[1])
+        return matches
+
+    def _ranked(self, query: str) -> List[Tuple[float, int]]:
+        words = query.split()
+        per_word: List[Dict[int, float]] = []
+        candidates: Optional[set] = None
+        for word in words:
+            best: Dict[int, float] = {}
+            for term, score in self._expand(word):
+                for doc_id in self._postings[term]:
+                    if doc_id not in best:
+                        best[doc_id] = score
+            if not best:
+                return []
+            per_word.append(best)
+            candidates = set(best) if candidates is None else candidates.intersection(best)
+            if not candidates:
+                return []
+
+        ranked = []
+        folded_map = self._folded
+        for doc_id in candidates:
+            score = sum(best[doc_id] for best in per_word) / len(per_word)
+            folded = folded_map[doc_id]
+            if folded == query:
+                score += 1.0
+            elif folded.startswith(query):
+                score += 0.5
+            ranked.append((round(score, 6), doc_id))
+        return ranked
+
+    def _search_ids(
+        self,
+        q: str,
+        limit: Optional[int],
+        after: Optional[Tuple[float, str]],
+    ) -> Tuple[List[Tuple[float, int]], int]:
+        query = fold_text(q)
+        if not query:
+            if self._sorted is None:
+                ordered = sorted(self._items, key=lambda doc_id: self._items[doc_id]["id"])
+                self._sorted = (ordered, [self._items[doc_id]["id"] for doc_id in ordered])
+            ordered, ordered_ids = self._sorted
+            start = bisect.bisect_right(ordered_ids, after[1]) if after else 0
+            end = len(ordered) if limit is None else start + limit
+            return [(0.0, doc_id) for doc_id in ordered[start:end]], len(ordered)
+
+        ranked = self._ranked(query)
+        total = len(ranked)
+        sort_key = lambda pair: (-pair[0], self._items[pair[1]]["id"])
+        if after is not None:
+            after_key = (-after[0], after[1])
+            ranked = [pair for pair in ranked if sort_key(pair) > after_key]
+        if limit is not None and limit < len(ranked):
+            ranked = heapq.nsmallest(limit, ranked, key=sort_key)
+        else:
+            ranked.sort(key=sort_key)
+        return ranked, total
+
+    def search(
+        self,
+        q: str,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> Tuple[List[Tuple[float, Dict[str, Any]]], int]:
+        """
+        Tìm kiếm theo tên, trả về (danh sách (score, item), tổng số kết quả khớp).
+
+        Kết quả sắp xếp theo độ liên quan giảm dần, cùng điểm thì theo id; query rỗng
+        trả về toàn bộ catalog theo id. `after` là (score, id) của item cuối trang
+        trước để lấy trang kế tiếp (keyset).
+        """
+        ranked, total = self._search_ids(q, limit, after)
+        return [(score, self._items[doc_id]) for score, doc_id in ranked], total
+
+    def search_encoded(
+        self,
+        q: str,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> Tuple[List[Tuple[float, str, bytes]], int]:
+        """Như search() nhưng trả về (score, id, JSON của item) để ghép thẳng vào response."""
+        ranked, total = self._search_ids(q, limit, after)
+        return [
+            (score, self._items[doc_id]["id"], self._encoded[doc_id]) for score, doc_id in ranked
+        ], total
+
+
+async def load_catalog_docs(drugs_collection, products_collection) -> List[Tuple[str, Dict[str, Any]]]:
+    """Đọc toàn bộ drugs + products (chỉ các trường cần thiết) để dựng chỉ mục."""
+    docs = []
+    for source, collection in (("drugs", drugs_collection), ("products", products_collection)):
+        if collection is None:
+            continue
+        async for doc in collection.find({}, INDEX_FIELDS):
+            docs.append((source, doc))
+    return docs
@@ -0,0 +1,106 @@
+# =====================================================================================
+# 🚀 Chạy backend ở chế độ production: nhiều worker uvicorn, uvloop + httptools
+# =====================================================================================
+#
+#   python serve.py                      # số worker = số CPU
+#   WEB_CONCURRENCY=4 python serve.py --port 8000
+#
+# - Mỗi worker là một process riêng (event loop, pool MongoDB, cache, bộ đệm ghi riêng).
+# - Tổng số kết nối MongoDB (MONGO_MAX_POOL_TOTAL) được chia đều cho các worker để không
+#   vượt giới hạn connection của cluster; pool bcrypt cũng được chia theo số CPU. Nếu mỗi
+#   worker không đủ MONGO_MIN_POOL_PER_WORKER kết nối thì số worker bị giảm xuống.
+# - Nhiều worker: các job dùng chung (tx_verifier, lấy tỷ giá ETH upstream) chỉ chạy ở một
+#   worker được bầu qua lease trong MongoDB (LEADER_ELECTION=mongo, xem leader.py).
+# - SIGTERM / SIGINT: uvicorn ngừng nhận kết nối mới, chờ request đang xử lý tối đa
+#   GRACEFUL_TIMEOUT giây, rồi chạy lifespan shutdown (flush bộ đệm giao dịch / lịch sử
+#   đăng nhập, đóng pool) trước khi process thoát.
+
+import argparse
+import importlib.util
+import os
+import sys
+from typing import List
+
+import uvicorn
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def parse_args(argv: List[str]):
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Chạy backend production (nhiều worker)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8000))
+    parser.add_argument("--workers", type=int, default=_env_int("WEB_CONCURRENCY", cpus))
+    parser.add_argument("--backlog", type=int, default=_env_int("BACKLOG", 2048),
+                        help="hàng đợi kết nối TCP chưa accept")
+    parser.add_argument("--keep-alive", type=int, default=_env_int("KEEP_ALIVE_SECONDS", 15),
+                        help="giữ kết nối HTTP idle (nên lớn hơn idle timeout của load balancer phía trước)")
+    parser.add_argument("--graceful-timeout", type=int, default=_env_int("GRACEFUL_TIMEOUT", 30),
+                        help="thời gian tối đa chờ request đang xử lý khi tắt")
+    parser.add_argument("--limit-concurrency", type=int, default=_env_int("LIMIT_CONCURRENCY", 0),
+                        help="số kết nối đồng thời tối đa mỗi worker, vượt thì trả 503 (0 = không giới hạn)")
+    parser.add_argument("--mongo-pool-total", type=int, default=_env_int("MONGO_MAX_POOL_TOTAL", 200),
+                        help="tổng số kết nối MongoDB cho tất cả worker")
+    return parser.parse_args(argv)
+
+
+def configure_workers(args):
+    """Đặt biến môi trường cho các worker (được kế thừa khi uvicorn spawn process)."""
+    cpus = os.cpu_count() or 1
+    workers = max(1, args.workers)
+
+    # Pool MongoDB mỗi worker: chia đều tổng số kết nối, tối thiểu MONGO_MIN_POOL_PER_WORKER.
+    # Không đủ tổng cho mức tối thiểu thì giảm số worker thay vì vượt --mongo-pool-total.
+    min_per_worker = max(1, _env_int("MONGO_MIN_POOL_PER_WORKER", 10))
+    max_workers = max(1, args.mongo_pool_total // min_per_worker)
+    if workers > max_workers:
+        print(f"⚠️ Warning: {workers} workers x {min_per_worker} MongoDB connections exceeds "
+              f"--mongo-pool-total={args.mongo_pool_total}; using {max_workers} worker(s)")
+        workers = max_workers
+    per_worker = max(1, args.mongo_pool_total // workers)
+    os.environ["MONGO_MAX_POOL_SIZE"] = str(per_worker)
+
+    # Nhiều worker: bầu một leader chạy các job dùng chung
+    if workers > 1:
+        os.environ.setdefault("LEADER_ELECTION", "mongo")
+        if os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "memory":
+            print(f"⚠️ Warning: RATE_LIMIT_BACKEND=memory counts per worker; OTP / login limits "
+                  f"are effectively x{workers}. Set RATE_LIMIT_BACKEND=mongo to share them")
+
+    # bcrypt: tổng số process băm trên máy không vượt số CPU
+    os.environ.setdefault("PASSWORD_POOL_WORKERS", str(max(1, cpus // workers)))
+    return workers, per_worker
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    workers, pool_size = configure_workers(args)
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    print(f"🚀 Starting {workers} worker(s) on {args.host}:{args.port} | loop={loop} http={http} "
+          f"| MongoDB pool/worker={pool_size}")
+
+    uvicorn.run(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency or None,
+        access_log=os.getenv("ACCESS_LOG", "false").lower() == "true",
+        reload=False,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Backend dùng import phẳng (chạy từ thư mục backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mongo_db():
+    """Database MongoDB giả lập (mongomock-motor, xem requirements-bench.txt)."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from benchmark import patch_mongomock
+
+    patch_mongomock()
+    return mongomock_motor.AsyncMongoMockClient()["pharma_test"]
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+import cache
+from cache import SharedInvalidations, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", fake)
+    return fake
+
+
+def test_hit_and_miss_counters(clock):
+    users = TTLCache(maxsize=10, ttl=60)
+    assert users.get("a") is None
+    users.set("a", {"name": "An"})
+    assert users.get("a") == {"name": "An"}
+    assert users.get("a") == {"name": "An"}
+    assert "a" in users and "b" not in users  # `in` không tính vào hit / miss
+
+    stats = users.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["hit_ratio"] == round(2 / 3, 4)
+
+
+def test_entries_expire_after_ttl(clock):
+    users = TTLCache(maxsize=10, ttl=60)
+    users.set("a", 1)
+    users.set("b", 2, ttl=10)  # ttl riêng ngắn hơn
+    users.set("c", 3, ttl=600)  # không vượt ttl của cache
+    clock.now += 11
+    assert users.get("b") is None and users.get("a") == 1
+    clock.now += 50
+    assert users.get("a") is None and users.get("c") is None
+    assert len(users) == 0
+    users.set("d", 4, ttl=0)  # hết hạn ngay: không lưu
+    assert "d" not in users
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    users = TTLCache(maxsize=2, ttl=60)
+    users.set("a", 1)
+    users.set("b", 2)
+    users.get("a")  # a mới được dùng, b là cũ nhất
+    users.set("c", 3)
+    assert "b" not in users
+    assert users.get("a") == 1 and users.get("c") == 3
+    assert users.stats()["evictions"] == 1
+
+
+def test_invalidation_reaches_other_workers(mongo_db):
+    async def scenario():
+        worker_a, worker_b = TTLCache(), TTLCache()
+        channel_a = SharedInvalidations(worker_a, lambda: mongo_db.service_state, "user_cache")
+        channel_b = SharedInvalidations(worker_b, lambda: mongo_db.service_state, "user_cache")
+        await channel_a.sync()
+        await channel_b.sync()
+        for worker in (worker_a, worker_b):
+            worker.set("u1", {"role": "admin"})
+            worker.set("u2", {"role": "staff"})
+
+        await channel_a.publish("u1")
+        assert "u1" not in worker_a  # xóa ngay ở process phát
+        assert "u1" in worker_b
+        await channel_b.sync()
+        return worker_b, channel_b
+
+    worker_b, channel_b = asyncio.run(scenario())
+    assert "u1" not in worker_b and "u2" in worker_b
+    assert channel_b.stats()["received"] == 1
+
+
+def test_missed_invalidations_clear_whole_cache(mongo_db):
+    async def scenario():
+        worker = TTLCache()
+        channel = SharedInvalidations(worker, lambda: mongo_db.service_state, "user_cache", keep=2)
+        publisher = SharedInvalidations(TTLCache(), lambda: mongo_db.service_state, "user_cache", keep=2)
+        await channel.sync()
+        worker.set("u1", 1)
+        worker.set("u9", 9)
+        for key in ("u1", "u2", "u3"):
+            await publisher.publish(key)
+        await channel.sync()
+        return worker, channel
+
+    worker, channel = asyncio.run(scenario())
+    # u1 đã bị đẩy khỏi danh sách (keep=2): không biết key nào đổi nên xóa hết
+    assert len(worker) == 0
+    assert channel.stats()["cleared"] == 1
+
+
+def test_grant_and_revoke_invalidate_cached_user(mongo_db, monkeypatch):
+    main = pytest.importorskip("main")
+    provision_users = pytest.importorskip("provision_users")
+    monkeypatch.setattr(main, "users_collection", mongo_db.users)
+    monkeypatch.setattr(main, "service_state_collection", mongo_db.service_state)
+
+    async def scenario():
+        result = await mongo_db.users.insert_one({"phone": "0900000000", "username": "admin"})
+        user_id = str(result.inserted_id)
+        main.user_cache.set(user_id, {"_id": result.inserted_id, "phone": "0900000000"})
+        assert await provision_users.set_provisioner(main, "0900000000", True)
+        cached_after_grant = main.user_cache.get(user_id)
+        missing = await provision_users.set_provisioner(main, "0999999999", False)
+        doc = await mongo_db.service_state.find_one({"_id": "user_cache"})
+        return cached_after_grant, missing, doc, user_id
+
+    cached, missing, doc, user_id = asyncio.run(scenario())
+    assert cached is None
+    assert missing is False
+    assert doc["events"] == [user_id] and doc["total"] == 1
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+main = pytest.importorskip("main")
+
+from catalog_feed import watch_catalog  # noqa: E402
+from pymongo.errors import OperationFailure, PyMongoError  # noqa: E402
+
+
+def drug(doc_id, name):
+    return {"_id": doc_id, "name": name, "price": 1.0}
+
+
+def change(operation, doc_id, name=None):
+    event = {"operationType": operation, "ns": {"coll": "drugs"}, "documentKey": {"_id": doc_id}}
+    if name is not None:
+        event["fullDocument"] = drug(doc_id, name)
+    return event
+
+
+def names(index):
+    results, _ = index.search("")
+    return sorted(item["name"] for _, item in results)
+
+
+@pytest.fixture
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(main, "search_index", main.SearchIndex())
+    monkeypatch.setattr(main, "search_refresh_task", None)
+    monkeypatch.setattr(main, "drugs_collection", object())
+    monkeypatch.setattr(main, "products_collection", object())
+    return main
+
+
+def test_changes_during_rebuild_are_replayed_onto_new_index(fresh_index, monkeypatch):
+    async def scenario():
+        loading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_load(drugs_collection, products_collection):
+            # Catalog đọc trước khi các thay đổi bên dưới được ghi
+            docs = [("drugs", drug("1", "Paracetamol")), ("drugs", drug("2", "Aspirin"))]
+            loading.set()
+            await release.wait()
+            return docs
+
+        monkeypatch.setattr(main, "load_catalog_docs", slow_load)
+        rebuild = main.start_search_refresh()
+        await loading.wait()
+        await main.apply_catalog_change(change("update", "1", "Paracetamol Extra"))
+        await main.apply_catalog_change(change("delete", "2"))
+        await main.apply_catalog_change(change("insert", "3", "Vitamin C"))
+        release.set()
+        await rebuild
+        return names(main.search_index), main.search_rebuild_changes
+
+    found, pending = asyncio.run(scenario())
+    assert found == ["Paracetamol Extra", "Vitamin C"]
+    assert pending is None
+
+
+def test_refresher_reloads_only_without_a_working_change_stream(fresh_index, monkeypatch):
+    reloads = []
+
+    async def counting_refresh(after_change=False):
+        reloads.append(main.catalog_feed.watcher)
+
+    monkeypatch.setattr(main, "refresh_search_index", counting_refresh)
+    monkeypatch.setattr(main, "SEARCH_INDEX_REFRESH_SECONDS", 0.01)
+    monkeypatch.setattr(main, "CATALOG_POLL_SECONDS", 0.01)
+
+    async def scenario():
+        task = asyncio.create_task(main.search_index_refresher())
+        for state in ("watching", "error", "watching", "polling"):
+            main.catalog_feed.set_watcher(state)
+            await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    monkeypatch.setattr(main.catalog_feed, "watcher", "starting")
+    asyncio.run(scenario())
+    assert reloads and set(reloads) == {"error", "polling"}
+
+
+class FakeStream:
+    def __init__(self, error):
+        self.error = error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise self.error
+
+
+class FakeDb:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+
+    def watch(self, pipeline, **kwargs):
+        if not self.errors:
+            raise OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+        return FakeStream(self.errors.pop(0))
+
+
+def test_watch_catalog_reports_state():
+    states = []
+
+    async def noop(*args):
+        pass
+
+    db = FakeDb(PyMongoError("connection reset"))
+    asyncio.run(watch_catalog(lambda: db, ("drugs",), noop, noop, retry_seconds=0, on_state=states.append))
+    assert states == ["watching", "error", "polling"]
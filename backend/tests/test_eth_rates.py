@@ -0,0 +1,106 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from eth_rates import SHARED_RATE_ID, EthRateService, RateQuote
+
+
+class ScriptedFetcher:
+    """Upstream giả: trả lần lượt các giá trị, phần tử là Exception thì ném ra."""
+
+    name = "scripted"
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+
+    async def __call__(self):
+        value = self.values[min(self.calls, len(self.values) - 1)]
+        self.calls += 1
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    async def close(self):
+        pass
+
+
+def test_quote_goes_stale_after_max_age():
+    async def scenario():
+        service = EthRateService(ScriptedFetcher(3000.0), max_age_seconds=60)
+        service.start()
+        quote = await service.refresh()
+        fresh = service.fresh_quote()
+        # Giả lập tỷ giá đã lấy từ 61 giây trước
+        service.quote = quote._replace(fetched_monotonic=time.monotonic() - 61)
+        stale = service.fresh_quote()
+        await service.close()
+        return fresh, stale, service.stats()
+
+    fresh, stale, stats = asyncio.run(scenario())
+    assert fresh is not None and fresh.usd_per_eth == 3000.0
+    assert stale is None
+    assert stats["stale"] is True
+    assert stats["usd_per_eth"] == 3000.0
+
+
+def test_failed_refresh_keeps_last_good_quote():
+    fetcher = ScriptedFetcher(3000.0, ConnectionError("upstream down"), 0.0)
+
+    async def scenario():
+        service = EthRateService(fetcher, refresh_seconds=0.01, retry_seconds=0.01)
+        service.start()
+        while fetcher.calls < 3:
+            await asyncio.sleep(0.01)
+        quote = service.fresh_quote()
+        stats = service.stats()
+        await service.close()
+        return quote, stats
+
+    quote, stats = asyncio.run(scenario())
+    # Lỗi mạng và tỷ giá không hợp lệ (0) đều không ghi đè tỷ giá tốt gần nhất
+    assert quote is not None and quote.usd_per_eth == 3000.0
+    assert stats["errors"] >= 2
+    assert stats["last_error"]
+    assert stats["refreshes"] == 1
+
+
+def test_follower_reads_rate_published_by_leader(mongo_db):
+    collection = mongo_db.service_state
+
+    async def scenario():
+        leader = EthRateService(ScriptedFetcher(2500.0), get_shared=lambda: collection)
+        leader.start()
+        await leader.refresh()
+        await collection.update_one(
+            {"_id": SHARED_RATE_ID}, {"$set": {"fetched_at": datetime.utcnow() - timedelta(seconds=30)}}
+        )
+        follower = EthRateService(ScriptedFetcher(ConnectionError("not called")), get_shared=lambda: collection)
+        follower.leader = False
+        quote = await follower.sync()
+        await leader.close()
+        return quote, follower.age_seconds()
+
+    quote, age = asyncio.run(scenario())
+    assert quote.usd_per_eth == 2500.0 and quote.source == "scripted"
+    # Tuổi tính từ fetched_at của leader, không phải lúc follower đọc
+    assert 29 <= age <= 35
+
+
+def test_build_transaction_uses_server_rate(monkeypatch):
+    main = pytest.importorskip("main")
+    payload = {"medicine": "Paracetamol", "price_eth": 0.01, "price_usd": 99999.0}
+
+    monkeypatch.setattr(main.eth_rates, "quote", RateQuote(3000.0, datetime.utcnow(), time.monotonic(), "static"))
+    transaction = main.build_transaction(payload)
+    assert transaction["price_usd"] == 30.0
+    assert transaction["usd_per_eth"] == 3000.0
+
+    # Tỷ giá đã cũ: không dùng, giữ giá client gửi
+    stale = RateQuote(3000.0, datetime.utcnow(), time.monotonic() - main.eth_rates.max_age_seconds - 1, "static")
+    monkeypatch.setattr(main.eth_rates, "quote", stale)
+    transaction = main.build_transaction(payload)
+    assert transaction["price_usd"] == 99999.0
+    assert transaction["usd_per_eth"] is None
@@ -0,0 +1,116 @@
+import asyncio
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import metrics
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """Đọc text exposition format thành {(tên, frozenset(label)): giá trị}."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"dòng không hợp lệ: {line!r}"
+        name, labels, value = match.groups()
+        samples[(name, frozenset(LABEL.findall(labels or "")))] = float(value)
+    return samples
+
+
+def sample(samples, name, **labels):
+    return samples.get((name, frozenset(labels.items())))
+
+
+def make_app():
+    app = FastAPI()
+    app.state.release = None
+
+    @app.get("/api/test-items/{item_id}")
+    async def get_item(item_id: str):
+        if app.state.release is not None:
+            await app.state.release.wait()
+        return {"id": item_id}
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        return metrics.registry.render()
+
+    app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+def test_route_template_labels_histogram_and_in_flight():
+    app = make_app()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for item_id in ("a", "b", "c"):
+                assert (await client.get(f"/api/test-items/{item_id}")).status_code == 200
+            await client.get("/no-such-route/42")
+
+            app.state.release = asyncio.Event()
+            pending = asyncio.create_task(client.get("/api/test-items/slow"))
+            while sample(parse(metrics.registry.render()), "http_requests_in_flight",
+                         method="GET", route="/api/test-items/{item_id}") != 1:
+                await asyncio.sleep(0.01)
+            app.state.release.set()
+            await pending
+        return parse(metrics.registry.render())
+
+    samples = asyncio.run(scenario())
+    route = "/api/test-items/{item_id}"
+
+    assert sample(samples, "http_requests_total", method="GET", route=route, status="200") == 4
+    assert sample(samples, "http_requests_total", method="GET", route="unmatched", status="404") == 1
+    # Không có label theo path thực tế
+    assert not any(("route", "/api/test-items/a") in labels for _, labels in samples)
+    assert sample(samples, "http_requests_in_flight", method="GET", route=route) == 0
+
+    buckets = sorted(
+        (float(dict(labels)["le"]), value)
+        for (name, labels), value in samples.items()
+        if name == "http_request_duration_seconds_bucket" and dict(labels).get("route") == route
+    )
+    assert [bound for bound, _ in buckets] == list(metrics.LATENCY_BUCKETS) + [float("inf")]
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)  # bucket cộng dồn
+    assert counts[-1] == sample(samples, "http_request_duration_seconds_count", method="GET", route=route) == 4
+    assert sample(samples, "http_request_duration_seconds_sum", method="GET", route=route) > 0
+
+
+def test_executor_gauges_follow_real_pool():
+    executor = ThreadPoolExecutor(max_workers=2)
+    metrics.track_executor("test", lambda: executor)
+    release = threading.Event()
+    try:
+        futures = [executor.submit(release.wait) for _ in range(3)]
+        samples = parse(metrics.registry.render())
+        assert sample(samples, "executor_threads", executor="test", state="max") == 2
+        assert sample(samples, "executor_threads", executor="test", state="active") == 2
+        assert sample(samples, "executor_threads", executor="test", state="queued") == 1
+        release.set()
+        for future in futures:
+            future.result()
+    finally:
+        release.set()
+        metrics._executors.pop("test")
+        executor.shutdown()
+
+
+def test_app_metrics_include_motor_and_password_pools():
+    main = pytest.importorskip("main")
+    samples = parse(main.metrics.registry.render())
+    assert sample(samples, "executor_threads", executor="default", state="max") > 0
+    assert sample(samples, "executor_threads", executor="motor", state="max") > 0
+    assert sample(samples, "password_pool", state="capacity") == main.password_hasher.capacity
+    assert not any(name.startswith("threadpool_tokens") for name, _ in samples)
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from otp_store import MemorySessionStore, MongoSessionStore, VerifyResult
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def store(request):
+    if request.param == "memory":
+        return MemorySessionStore()
+    return MongoSessionStore(request.getfixturevalue("mongo_db").temp_sessions)
+
+
+def test_correct_code_is_single_use(store):
+    async def scenario():
+        await store.issue("0900000000", "123456")
+        return [await store.verify("0900000000", "123456") for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [VerifyResult.OK, VerifyResult.NOT_FOUND]
+
+
+def test_concurrent_verifies_consume_once(store):
+    async def scenario():
+        await store.issue("0900000000", "123456")
+        return await asyncio.gather(*(store.verify("0900000000", "123456") for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert results.count(VerifyResult.OK) == 1
+
+
+def test_wrong_codes_are_counted_until_locked(store):
+    async def scenario():
+        await store.issue("0900000000", "123456")
+        results = [await store.verify("0900000000", "000000", max_attempts=3) for _ in range(3)]
+        # Đã hết lượt: mã đúng cũng bị từ chối và phiên bị xóa
+        results.append(await store.verify("0900000000", "123456", max_attempts=3))
+        results.append(await store.verify("0900000000", "123456", max_attempts=3))
+        return results
+
+    assert asyncio.run(scenario()) == [VerifyResult.WRONG_CODE] * 3 + [
+        VerifyResult.TOO_MANY_ATTEMPTS, VerifyResult.NOT_FOUND,
+    ]
+
+
+def test_reissue_resets_attempts(store):
+    async def scenario():
+        await store.issue("0900000000", "111111")
+        await store.verify("0900000000", "000000", max_attempts=2)
+        await store.verify("0900000000", "000000", max_attempts=2)
+        await store.issue("0900000000", "222222")
+        return await store.verify("0900000000", "222222", max_attempts=2)
+
+    assert asyncio.run(scenario()) == VerifyResult.OK
+
+
+def test_expired_session_is_rejected(store):
+    async def scenario():
+        await store.issue("0900000000", "123456", ttl_seconds=-1)
+        return [await store.verify("0900000000", "123456") for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [VerifyResult.EXPIRED, VerifyResult.NOT_FOUND]
+
+
+def test_memory_store_evicts_oldest_sessions_past_cap():
+    store = MemorySessionStore(max_sessions=3)
+
+    async def scenario():
+        await store.issue("expired", "0", ttl_seconds=-1)
+        for phone in ("a", "b", "c", "d"):
+            await store.issue(phone, "1")
+        await store.issue("b", "2")  # cấp lại: b thành mới nhất
+        await store.issue("e", "1")
+        return {phone: await store.verify(phone, "1") for phone in ("a", "c", "d", "e")}
+
+    results = asyncio.run(scenario())
+    assert results == {
+        "a": VerifyResult.NOT_FOUND, "c": VerifyResult.NOT_FOUND,
+        "d": VerifyResult.OK, "e": VerifyResult.OK,
+    }
+    # Phiên đã hết hạn bị dọn không tính là bị đẩy ra
+    assert store.evicted == 2
+    assert len(store) == 1
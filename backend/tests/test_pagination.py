@@ -0,0 +1,85 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+from bson.objectid import ObjectId
+
+from pagination import CursorError, clamp_limit, decode_cursor, encode_cursor, timestamp_keyset_filter
+
+
+def test_cursor_round_trip():
+    position = {"ts": datetime(2025, 3, 14, 9, 30, 1, 123000), "id": ObjectId()}
+    decoded = decode_cursor(encode_cursor(position))
+    assert decoded == {"ts": position["ts"].isoformat(), "id": str(position["id"])}
+    assert "=" not in encode_cursor(position)  # an toàn trong query string
+    assert decode_cursor(None) is None and decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    encode_cursor({"ts": "2025-03-14T09:30:00", "id": "x"})[:-6],  # bị cắt
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),  # không phải object
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(CursorError):
+        timestamp_keyset_filter(decode_cursor(cursor))
+
+
+@pytest.mark.parametrize("position", [
+    {"ts": "2025-03-14T09:30:00", "id": "not-an-object-id"},
+    {"ts": "yesterday", "id": str(ObjectId())},
+    {"ts": {"$gt": ""}, "id": str(ObjectId())},  # chèn toán tử MongoDB
+    {"id": str(ObjectId())},
+])
+def test_tampered_cursor_is_rejected(position):
+    with pytest.raises(CursorError):
+        timestamp_keyset_filter(decode_cursor(encode_cursor(position)))
+
+
+def test_clamp_limit():
+    assert clamp_limit(0) == 1
+    assert clamp_limit(10_000_000) == 200
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_pages_visit_each_document_once(mongo_db, descending):
+    collection = mongo_db.transactions
+    start = datetime(2025, 3, 1)
+    # Nhiều document trùng timestamp: thứ tự phụ phân biệt bằng _id
+    docs = [{"_id": ObjectId(), "timestamp": start + timedelta(minutes=i // 3), "n": i} for i in range(25)]
+    direction = -1 if descending else 1
+
+    async def scenario():
+        await collection.insert_many(docs)
+        seen = []
+        cursor = None
+        while True:
+            keyset = timestamp_keyset_filter(decode_cursor(cursor), descending=descending)
+            page = await collection.find(keyset).sort(
+                [("timestamp", direction), ("_id", direction)]
+            ).limit(7).to_list(length=7)
+            if not page:
+                return seen
+            seen.extend(doc["n"] for doc in page)
+            cursor = encode_cursor({"ts": page[-1]["timestamp"], "id": page[-1]["_id"]})
+
+    seen = asyncio.run(scenario())
+    expected = sorted(docs, key=lambda doc: (doc["timestamp"], doc["_id"]), reverse=descending)
+    assert seen == [doc["n"] for doc in expected]
+
+
+def test_revenue_rejects_tampered_cursor(mongo_db, monkeypatch):
+    main = pytest.importorskip("main")
+    httpx = pytest.importorskip("httpx")
+    monkeypatch.setattr(main, "transactions_collection", mongo_db.transactions)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            cursor = encode_cursor({"ts": "2025-03-14T09:30:00", "id": "forged"})
+            return await client.get("/api/revenue", params={"month": 3, "year": 2025, "cursor": cursor})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor không hợp lệ"
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from passwords import PasswordHasher, PasswordPoolSaturated, hash_cost
+
+
+@pytest.fixture
+def hasher():
+    # Cost thấp để test chạy nhanh
+    hasher = PasswordHasher(workers=1, max_queue=0, rounds=4)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hash_and_verify(hasher):
+    async def scenario():
+        hashed = await hasher.hash("mat-khau")
+        return hashed, await hasher.verify("mat-khau", hashed), await hasher.verify("sai", hashed)
+
+    hashed, ok, wrong = asyncio.run(scenario())
+    assert hash_cost(hashed) == 4
+    assert ok is True and wrong is False
+    assert hasher.in_flight == 0
+
+
+def test_requests_beyond_capacity_are_rejected(hasher):
+    async def scenario():
+        return await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+    assert hash_cost(first) == 4
+    assert isinstance(second, PasswordPoolSaturated)
+    assert hasher.stats()["rejected"] == 1 and hasher.in_flight == 0
+
+
+def test_hash_many_keeps_finished_chunks_when_saturated(hasher, monkeypatch):
+    monkeypatch.setattr("passwords.PASSWORD_BATCH_CHUNK", 2)
+
+    async def scenario():
+        batch = asyncio.create_task(hasher.hash_many(["a", "b", "c", "d"], return_exceptions=True))
+        while hasher.in_flight == 0:
+            await asyncio.sleep(0)
+        # Một login chiếm slot trong lúc lô đầu đang băm: lô sau bị từ chối, lô đầu vẫn giữ
+        hasher.in_flight += 1
+        try:
+            return await batch
+        finally:
+            hasher.in_flight -= 1
+
+    results = asyncio.run(scenario())
+    assert all(hash_cost(value) == 4 for value in results[:2])
+    assert all(isinstance(value, PasswordPoolSaturated) for value in results[2:])
+
+
+def test_needs_rehash_when_cost_changes(hasher):
+    old = asyncio.run(hasher.hash("mat-khau"))
+    assert not hasher.needs_rehash(old)
+    stronger = PasswordHasher(workers=1, max_queue=0, rounds=5)
+    assert stronger.needs_rehash(old)
+    assert stronger.needs_rehash("không-phải-bcrypt")
+    assert hash_cost("$2b$12$" + "x" * 53) == 12 and hash_cost("") is None
+
+
+@pytest.mark.parametrize("call", ["hash_password", "verify_password"])
+def test_saturated_pool_returns_503(monkeypatch, call):
+    main = pytest.importorskip("main")
+    saturated = PasswordHasher(workers=1, max_queue=0, rounds=4)
+    saturated.in_flight = saturated.capacity
+    monkeypatch.setattr(main, "password_hasher", saturated)
+
+    args = ("mat-khau",) if call == "hash_password" else ("mat-khau", "$2b$04$" + "x" * 53)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(getattr(main, call)(*args))
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.headers == {"Retry-After": "1"}
+    assert saturated.rejected == 1
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import rate_limit
+from rate_limit import MemoryBuckets, MongoBuckets, Policy, RateLimiter, parse_policy
+
+# 3 request liên tiếp, hồi 1 token mỗi 20 giây
+POLICY = parse_policy("otp_phone", "3/60")
+
+
+class FakeClock:
+    def __init__(self):
+        self.seconds = 0.0
+
+    def monotonic(self):
+        return 1000.0 + self.seconds
+
+    def utcnow(self):
+        return datetime(2025, 3, 14) + timedelta(seconds=self.seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limit, "datetime", type("FakeDatetime", (datetime,), {"utcnow": staticmethod(fake.utcnow)}))
+    return fake
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def take(request, clock):
+    if request.param == "memory":
+        buckets = MemoryBuckets()
+        return lambda key: buckets.take(POLICY, key, {POLICY.name: POLICY})
+    buckets = MongoBuckets(lambda: request.getfixturevalue("mongo_db").rate_limits)
+    return lambda key: asyncio.run(buckets.take(POLICY, key))
+
+
+def test_parse_policy():
+    assert POLICY == Policy("otp_phone", 3.0, 0.05)
+    with pytest.raises(ValueError):
+        parse_policy("bad", "0/60")
+
+
+def test_burst_then_wait(take):
+    assert [take("0900000000") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert take("0900000000") == pytest.approx(20)
+    # Key khác có bucket riêng
+    assert take("0911111111") == 0.0
+
+
+def test_tokens_refill_over_time(take, clock):
+    for _ in range(3):
+        take("0900000000")
+    clock.seconds += 10
+    assert take("0900000000") == pytest.approx(10)  # mới hồi nửa token
+    clock.seconds += 10
+    assert take("0900000000") == 0.0
+    assert take("0900000000") == pytest.approx(20)
+
+
+def test_refill_is_capped_at_burst(take, clock):
+    take("0900000000")
+    clock.seconds += 3600
+    assert [take("0900000000") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert take("0900000000") > 0
+
+
+def test_memory_sweep_drops_only_full_buckets(clock, monkeypatch):
+    monkeypatch.setattr(MemoryBuckets, "SWEEP_THRESHOLD", 2)
+    buckets = MemoryBuckets()
+    policies = {POLICY.name: POLICY}
+    buckets.take(POLICY, "a", policies)
+    for _ in range(3):
+        buckets.take(POLICY, "b", policies)
+    clock.seconds += 30  # a đã đầy lại, b vẫn còn thiếu
+    buckets.take(POLICY, "c", policies)
+    assert len(buckets) == 2
+    assert buckets.take(POLICY, "b", policies) == 0.0
+    assert buckets.take(POLICY, "b", policies) > 0
+
+
+class BrokenBuckets:
+    async def take(self, policy, key):
+        raise ConnectionError("mongo down")
+
+
+def test_limiter_falls_back_to_local_buckets(clock):
+    limiter = RateLimiter(BrokenBuckets())
+    ip_policy = limiter.add_policy(parse_policy("otp_ip", "1/60"))
+    phone_policy = limiter.add_policy(POLICY)
+
+    async def scenario():
+        first = await limiter.check((phone_policy, "0900000000"), (ip_policy, "1.2.3.4"), (ip_policy, None))
+        second = await limiter.check((phone_policy, "0900000000"), (ip_policy, "1.2.3.4"))
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == 0.0
+    assert second == pytest.approx(60)  # chờ lâu nhất trong các policy
+    stats = limiter.stats()
+    assert stats["shared_errors"] == 4 and stats["local_buckets"] == 2
+    assert stats["limited"] == {"otp_ip": 1, "otp_phone": 0}
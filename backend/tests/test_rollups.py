@@ -0,0 +1,199 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+import rollups
+
+
+def cart(*lines, price_eth, price_usd, chain_id=11155111):
+    """Giao dịch như frontend gửi lên: medicine là danh sách dòng thuốc."""
+    return {
+        "medicine": [{"id": name, "name": name, "qty": qty, "price_usd": price} for name, qty, price in lines],
+        "price_eth": price_eth,
+        "price_usd": price_usd,
+        "chain_id": chain_id,
+        "timestamp": datetime(2025, 3, 14, 9, 30),
+    }
+
+
+def by_key(updates):
+    result = {}
+    for update in updates:
+        key = update._filter
+        result[(key["granularity"], key["medicine"])] = update._doc["$inc"]
+    return result
+
+
+def test_two_carts_sharing_a_line_item_roll_up_per_medicine():
+    first = cart(("Paracetamol", 2, 5.0), ("Vitamin C", 1, 10.0), price_eth=0.01, price_usd=20.0)
+    second = cart(("Paracetamol", 1, 5.0), price_eth=0.005, price_usd=5.0)
+
+    updates = rollups.rollup_updates([first, second])
+
+    # Khóa bucket là tên thuốc (chuỗi), không phải cả giỏ hàng
+    for update in updates:
+        assert isinstance(update._filter["medicine"], str)
+    incs = by_key(updates)
+    assert len(updates) == 4  # (day, month) x (Paracetamol, Vitamin C)
+
+    paracetamol = incs[("day", "Paracetamol")]
+    assert paracetamol["count"] == 2
+    assert paracetamol["qty"] == 3
+    assert paracetamol["sum_usd"] == 10.0 + 5.0
+    vitamin_c = incs[("month", "Vitamin C")]
+    assert vitamin_c["count"] == 1
+    assert vitamin_c["sum_usd"] == 10.0
+
+    # Cộng các dòng của một bucket ra đúng tổng tiền và số giao dịch
+    month = [inc for (granularity, _), inc in incs.items() if granularity == "month"]
+    assert sum(inc["transactions"] for inc in month) == 2
+    assert abs(sum(inc["sum_eth"] for inc in month) - 0.015) < 1e-12
+    assert abs(sum(inc["sum_usd"] for inc in month) - 25.0) < 1e-9
+
+
+def test_subtracting_a_cart_reverses_its_increments():
+    tx = cart(("Paracetamol", 2, 5.0), ("Vitamin C", 1, 10.0), price_eth=0.01, price_usd=20.0)
+    added = by_key(rollups.rollup_updates([tx]))
+    removed = by_key(rollups.rollup_updates([tx], sign=-1))
+    assert added.keys() == removed.keys()
+    for key, inc in added.items():
+        assert all(removed[key][field] == -value for field, value in inc.items())
+
+
+def test_legacy_and_empty_medicine():
+    legacy = {"medicine": "Aspirin", "price_eth": 0.1, "price_usd": 300.0, "timestamp": datetime(2025, 3, 1)}
+    empty = {"medicine": [], "price_eth": 0.2, "price_usd": 600.0, "timestamp": datetime(2025, 3, 1)}
+    incs = by_key(rollups.rollup_updates([legacy, empty]))
+    assert incs[("month", "Aspirin")]["sum_usd"] == 300.0
+    assert incs[("month", rollups.UNKNOWN_MEDICINE)]["sum_usd"] == 600.0
+
+
+def test_failed_transactions_are_not_counted():
+    ok = cart(("Paracetamol", 1, 5.0), price_eth=0.005, price_usd=5.0)
+    failed = dict(cart(("Paracetamol", 1, 5.0), price_eth=0.5, price_usd=500.0), status=rollups.FAILED_STATUS)
+    incs = by_key(rollups.rollup_updates([ok, failed]))
+    assert incs[("month", "Paracetamol")]["sum_usd"] == 5.0
+    assert incs[("month", "Paracetamol")]["transactions"] == 1
+
+
+def stored(*txs, status="completed"):
+    return [dict(tx, status=tx.get("status", status)) for tx in txs]
+
+
+def march_carts():
+    return stored(
+        cart(("Paracetamol", 2, 5.0), ("Vitamin C", 1, 10.0), price_eth=0.01, price_usd=20.0),
+        cart(("Paracetamol", 1, 5.0), price_eth=0.005, price_usd=5.0),
+        dict(cart(("Aspirin", 1, 1.0), price_eth=1.0, price_usd=3000.0), status=rollups.FAILED_STATUS),
+    )
+
+
+def test_month_summary_matches_transactions(mongo_db):
+    async def scenario():
+        txs = march_carts()
+        await mongo_db.transactions.insert_many(txs)
+        await rollups.apply_transactions(mongo_db.revenue_rollups, txs)
+        return (
+            await rollups.month_summary(mongo_db.revenue_rollups, 2025, 3),
+            await rollups.transactions_month_summary(mongo_db.transactions, 2025, 3),
+            await rollups.month_summary(mongo_db.revenue_rollups, 2025, 4),
+        )
+
+    from_rollups, from_transactions, empty = asyncio.run(scenario())
+    assert from_rollups["count"] == from_transactions["count"] == 2
+    assert abs(from_rollups["sum_eth"] - 0.015) < 1e-12
+    assert abs(from_rollups["sum_usd"] - from_transactions["sum_usd"]) < 1e-9
+    assert empty == {"count": 0, "sum_eth": 0, "sum_usd": 0}
+
+
+class BrokenRollups:
+    name = "revenue_rollups"
+
+    async def bulk_write(self, updates, ordered=True):
+        raise RuntimeError("write concern timeout")
+
+
+def test_failed_increment_marks_rollups_stale_and_falls_back(mongo_db):
+    async def scenario():
+        txs = march_carts()
+        await mongo_db.transactions.insert_many(txs)
+        writer = rollups.RollupMaintainer(
+            lambda: mongo_db.transactions, lambda: BrokenRollups(), get_shared=lambda: mongo_db.service_state
+        )
+        await writer.apply(txs)
+        # Worker khác (chưa từng lỗi) đọc cờ stale chung
+        reader = rollups.RollupMaintainer(
+            lambda: mongo_db.transactions, lambda: mongo_db.revenue_rollups, get_shared=lambda: mongo_db.service_state
+        )
+        await reader.sync()
+        return writer, reader, await reader.month_summary(2025, 3)
+
+    writer, reader, summary = asyncio.run(scenario())
+    assert writer.stale and writer.stats()["errors"] == 1
+    assert reader.stale
+    # Rollup rỗng nhưng tổng vẫn đúng nhờ tính từ transactions
+    assert summary["count"] == 2 and summary["sum_usd"] == 25.0
+
+
+def test_leader_rebuilds_empty_rollups_and_clears_stale_flag(mongo_db, monkeypatch):
+    async def fake_rebuild(transactions_collection, rollups_collection, batch_size=1000):
+        # mongomock không hỗ trợ $convert của pipeline thật (xem test_rebuild_against_mongodb)
+        await rollups_collection.delete_many({})
+        txs = await transactions_collection.find({}).to_list(length=None)
+        await rollups.apply_transactions(rollups_collection, txs)
+        return len(txs)
+
+    monkeypatch.setattr(rollups, "rebuild", fake_rebuild)
+
+    async def scenario():
+        # DB đã có giao dịch từ trước khi có bảng rollup
+        await mongo_db.transactions.insert_many(march_carts())
+        maintainer = rollups.RollupMaintainer(
+            lambda: mongo_db.transactions, lambda: mongo_db.revenue_rollups, get_shared=lambda: mongo_db.service_state
+        )
+        await maintainer.mark_stale()
+        rebuilt = await maintainer.check()
+        in_sync = await maintainer.check()
+        await maintainer.sync()
+        return rebuilt, in_sync, maintainer, await maintainer.month_summary(2025, 3)
+
+    rebuilt, in_sync, maintainer, summary = asyncio.run(scenario())
+    assert rebuilt and not in_sync
+    assert not maintainer.stale
+    assert maintainer.rebuilds == 1
+    assert summary["count"] == 2 and abs(summary["sum_usd"] - 25.0) < 1e-9
+
+
+@pytest.mark.skipif(not os.getenv("MONGO_TEST_URI"), reason="cần MongoDB thật (MONGO_TEST_URI)")
+def test_rebuild_against_mongodb():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def scenario():
+        client = AsyncIOMotorClient(os.environ["MONGO_TEST_URI"])
+        db = client[f"rollups_test_{os.getpid()}"]
+        try:
+            txs = march_carts()
+            await db.transactions.insert_many([dict(tx) for tx in txs])
+            await rollups.apply_transactions(db.incremental, txs)
+            await rollups.rebuild(db.transactions, db.revenue_rollups)
+            rebuilt = {
+                (doc["granularity"], doc["medicine"]): doc
+                async for doc in db.revenue_rollups.find({})
+            }
+            incremental = {
+                (doc["granularity"], doc["medicine"]): doc
+                async for doc in db.incremental.find({})
+            }
+            return rebuilt, incremental
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    rebuilt, incremental = asyncio.run(scenario())
+    # Rebuild ra cùng kết quả với cộng dồn $inc
+    assert rebuilt.keys() == incremental.keys()
+    for key, doc in rebuilt.items():
+        for field in ("count", "transactions", "qty", "sum_eth", "sum_usd"):
+            assert abs(doc[field] - incremental[key][field]) < 1e-9
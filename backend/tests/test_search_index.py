@@ -0,0 +1,87 @@
+from search_index import SearchIndex, fold_text, short_substrings
+
+CATALOG = [
+    ("drugs", {"_id": "1", "name": "Paracetamol 500mg"}),
+    ("drugs", {"_id": "2", "name": "Hoạt huyết dưỡng não"}),
+    ("drugs", {"_id": "3", "name": "Amoxicillin"}),
+    ("products", {"_id": "4", "name": "Vitamin C Đông dược"}),
+    ("products", {"_id": "5", "name": "Siro ho Bảo Thanh"}),
+]
+
+
+def names(index, q, **kwargs):
+    results, _ = index.search(q, **kwargs)
+    return [item["name"] for _, item in results]
+
+
+def build():
+    return SearchIndex.build(CATALOG)
+
+
+def test_fold_text_removes_vietnamese_diacritics():
+    assert fold_text("Hoạt huyết DƯỠNG não") == "hoat huyet duong nao"
+    assert fold_text("Đông-dược") == "dong duoc"
+
+
+def test_diacritic_insensitive_search():
+    index = build()
+    assert names(index, "hoat huyet") == ["Hoạt huyết dưỡng não"]
+    assert names(index, "dong duoc")[0] == "Vitamin C Đông dược"
+    assert names(index, "Bảo thanh") == ["Siro ho Bảo Thanh"]
+
+
+def test_trigram_search_tolerates_typos():
+    index = build()
+    assert names(index, "paracetmol") == ["Paracetamol 500mg"]
+    assert names(index, "amoxilin") == ["Amoxicillin"]
+    assert names(index, "xyzzy") == []
+
+
+def test_exact_and_prefix_matches_rank_first():
+    index = SearchIndex.build([
+        ("drugs", {"_id": "1", "name": "Vitamin C"}),
+        ("drugs", {"_id": "2", "name": "Vitamin"}),
+        ("drugs", {"_id": "3", "name": "Multivitamin"}),
+    ])
+    assert names(index, "vitamin") == ["Vitamin", "Vitamin C", "Multivitamin"]
+
+
+def test_short_terms_match_prefix_and_infix():
+    index = build()
+    assert sorted(names(index, "ho")) == ["Hoạt huyết dưỡng não", "Siro ho Bảo Thanh"]
+    # "mo" nằm giữa từ paracetamol / amoxicillin
+    assert sorted(names(index, "mo")) == ["Amoxicillin", "Paracetamol 500mg"]
+    assert sorted(names(index, "c")) == ["Amoxicillin", "Paracetamol 500mg", "Vitamin C Đông dược"]
+    assert names(index, "qq") == []
+
+
+def test_short_term_lookup_only_visits_matching_terms():
+    index = build()
+    assert index._short_terms["mo"] == {"paracetamol", "amoxicillin"}
+    assert short_substrings("ho") == {"h", "o", "ho"}
+
+
+def test_removed_terms_leave_no_lookup_entries():
+    index = build()
+    index.upsert("drugs", {"_id": "1", "name": "Ibuprofen"})
+    assert names(index, "para") == []
+    assert names(index, "mo") == ["Amoxicillin"]
+    assert "paracetamol" not in index._short_terms.get("mo", set())
+    assert not any("paracetamol" in terms for terms in index._term_grams.values())
+    assert index.remove("drugs", "1") and not index.remove("drugs", "1")
+    assert "ib" not in index._short_terms
+
+
+def test_keyset_pages_cover_all_results_once():
+    index = SearchIndex.build([("drugs", {"_id": f"{i:03d}", "name": f"Paracetamol {i}"}) for i in range(25)])
+    seen = []
+    after = None
+    while True:
+        page, total = index.search("para", limit=10, after=after)
+        if not page:
+            break
+        seen.extend(item["id"] for _, item in page)
+        score, item = page[-1]
+        after = (score, item["id"])
+    assert total == 25
+    assert seen == sorted(seen) and len(set(seen)) == 25
@@ -0,0 +1,246 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import tx_verifier
+from tx_verifier import ProviderTransport, TxVerifier, backoff_delay, parse_rpc_urls
+
+SEPOLIA = 11155111
+
+
+class FakeChain:
+    """Stand-in cho node JSON-RPC (kiểu anvil): trả receipt theo tx_hash, hỗ trợ batch."""
+
+    def __init__(self, receipts=None, errors=()):
+        self.receipts = receipts or {}
+        self.errors = set(errors)
+        self.batches = []
+        self.before_reply = None
+
+    def make_request(self, method, params):
+        assert method == "eth_getTransactionReceipt"
+        tx_hash = params[0]
+        if tx_hash in self.errors:
+            return {"jsonrpc": "2.0", "error": {"code": -32000, "message": "header not found"}}
+        return {"jsonrpc": "2.0", "result": self.receipts.get(tx_hash)}
+
+    async def __call__(self, requests):
+        self.batches.append([request["params"][0] for request in requests])
+        if self.before_reply is not None:
+            await self.before_reply()
+        return [{"id": request["id"], **self.make_request(request["method"], request["params"])}
+                for request in requests]
+
+
+def pending(tx_hash, chain_id="0xaa36a7", **fields):
+    return {
+        "tx_hash": tx_hash, "chain_id": chain_id, "status": "pending", "verify_attempts": 0,
+        "next_check_at": datetime.utcnow() - timedelta(seconds=1),
+        "timestamp": datetime.utcnow(), "medicine": "Paracetamol", "price_eth": 0.01, "price_usd": 30.0,
+        **fields,
+    }
+
+
+def make_verifier(collection, chain, failed_log, **kwargs):
+    async def on_failed(failed):
+        failed_log.extend(tx["tx_hash"] for tx in failed)
+
+    return TxVerifier(lambda: collection, {SEPOLIA: chain}, on_failed=on_failed, **kwargs)
+
+
+def test_confirmed_reverted_and_not_yet_mined(mongo_db):
+    collection = mongo_db.transactions
+    chain = FakeChain({
+        "0xok": {"status": "0x1", "blockNumber": "0x10"},
+        "0xreverted": {"status": "0x0", "blockNumber": "0x11"},
+    })
+    failed = []
+    updated = []
+
+    async def scenario():
+        await collection.insert_many([pending("0xok"), pending("0xreverted"), pending("0xmissing")])
+        verifier = make_verifier(collection, chain, failed)
+        verifier._on_updated = lambda: updated.append(1)
+        processed = await verifier.run_once()
+        docs = {doc["tx_hash"]: doc async for doc in collection.find({})}
+        return processed, docs, verifier.stats()
+
+    started = datetime.utcnow()
+    processed, docs, stats = asyncio.run(scenario())
+
+    assert processed == 3
+    assert chain.batches == [["0xok", "0xreverted", "0xmissing"]]  # một HTTP request cho cả lô
+    assert docs["0xok"]["status"] == "confirmed"
+    assert docs["0xok"]["block_number"] == 16
+    assert "next_check_at" not in docs["0xok"] and "verify_lease" not in docs["0xok"]
+
+    assert docs["0xreverted"]["status"] == "failed"
+    assert docs["0xreverted"]["failure_reason"] == "reverted"
+    assert failed == ["0xreverted"]
+
+    # Chưa có receipt: vẫn pending, kiểm tra lại sau backoff
+    missing = docs["0xmissing"]
+    assert missing["status"] == "pending"
+    assert missing["verify_attempts"] == 1
+    assert "verify_lease" not in missing
+    delay = (missing["next_check_at"] - started).total_seconds()
+    assert backoff_delay(1) - 1 <= delay <= backoff_delay(1) + 1
+
+    assert stats["confirmed"] == 1 and stats["failed"] == 1 and stats["checked"] == 3
+    assert updated
+
+
+def test_not_found_after_max_attempts_fails_once(mongo_db):
+    collection = mongo_db.transactions
+    failed = []
+
+    async def scenario():
+        await collection.insert_one(pending("0xgone", verify_attempts=2))
+        verifier = make_verifier(collection, FakeChain(), failed, max_attempts=3)
+        await verifier.run_once()
+        return await collection.find_one({"tx_hash": "0xgone"})
+
+    doc = asyncio.run(scenario())
+    assert doc["status"] == "failed"
+    assert doc["failure_reason"] == "not_found"
+    assert failed == ["0xgone"]
+
+
+def test_partial_batch_error_keeps_transaction_pending(mongo_db):
+    collection = mongo_db.transactions
+    chain = FakeChain({"0xok": {"status": "0x1", "blockNumber": "0x1"}}, errors={"0xflaky"})
+    failed = []
+
+    async def scenario():
+        # Lỗi của riêng một request trong batch không được tính là "không tìm thấy"
+        await collection.insert_many([pending("0xok"), pending("0xflaky", verify_attempts=5)])
+        verifier = make_verifier(collection, chain, failed, max_attempts=3)
+        await verifier.run_once()
+        return {doc["tx_hash"]: doc async for doc in collection.find({})}
+
+    docs = asyncio.run(scenario())
+    assert docs["0xok"]["status"] == "confirmed"
+    assert docs["0xflaky"]["status"] == "pending"
+    assert docs["0xflaky"]["verify_attempts"] == 6
+    assert failed == []
+
+
+def test_transport_failure_leaves_lease_to_expire(mongo_db):
+    collection = mongo_db.transactions
+
+    async def broken(requests):
+        raise ConnectionError("RPC down")
+
+    async def scenario():
+        await collection.insert_one(pending("0xok"))
+        verifier = TxVerifier(lambda: collection, {SEPOLIA: broken}, lease_seconds=60)
+        try:
+            await verifier.run_once()
+        except ConnectionError:
+            pass
+        return await collection.find_one({}), verifier.stats()
+
+    doc, stats = asyncio.run(scenario())
+    assert stats["rpc_errors"] == 1
+    assert doc["status"] == "pending"
+    assert doc["verify_attempts"] == 0
+    # Đang được giữ: worker khác không nhận lại trước khi lease hết hạn
+    assert doc["next_check_at"] > datetime.utcnow() + timedelta(seconds=30)
+
+
+def test_leased_transaction_is_not_claimed_by_another_worker(mongo_db):
+    collection = mongo_db.transactions
+    chain = FakeChain({"0xok": {"status": "0x1", "blockNumber": "0x1"}})
+
+    async def scenario():
+        await collection.insert_one(pending("0xok"))
+        first = make_verifier(collection, chain, [])
+        second = make_verifier(collection, chain, [])
+
+        async def second_worker_runs():
+            # Worker thứ hai chạy trong lúc worker đầu đang chờ RPC
+            chain.before_reply = None
+            assert await second.run_once() == 0
+
+        chain.before_reply = second_worker_runs
+        await first.run_once()
+
+    asyncio.run(scenario())
+    assert chain.batches == [["0xok"]]
+
+
+def test_expired_lease_is_reclaimed_and_failure_applied_once(mongo_db):
+    collection = mongo_db.transactions
+    chain = FakeChain({"0xbad": {"status": "0x0", "blockNumber": "0x1"}})
+    failed = []
+
+    async def scenario():
+        await collection.insert_one(pending("0xbad"))
+        slow = make_verifier(collection, chain, failed)
+        other = make_verifier(collection, chain, failed)
+
+        async def lease_expires_then_other_worker_reclaims():
+            chain.before_reply = None
+            await collection.update_many({}, {"$set": {"next_check_at": datetime.utcnow() - timedelta(seconds=1)}})
+            assert await other.run_once() == 1
+
+        chain.before_reply = lease_expires_then_other_worker_reclaims
+        await slow.run_once()
+        return slow.stats(), other.stats(), await collection.find_one({})
+
+    slow_stats, other_stats, doc = asyncio.run(scenario())
+    assert doc["status"] == "failed"
+    # Chỉ worker còn giữ lease chuyển trạng thái: rollup chỉ bị trừ một lần
+    assert failed == ["0xbad"]
+    assert other_stats["failed"] == 1
+    assert slow_stats["failed"] == 0
+
+
+def test_unknown_chain_is_deferred_without_rpc(mongo_db):
+    collection = mongo_db.transactions
+    chain = FakeChain()
+
+    async def scenario():
+        await collection.insert_one(pending("0xmainnet", chain_id="0x1"))
+        verifier = make_verifier(collection, chain, [])
+        await verifier.run_once()
+        return await collection.find_one({}), verifier.stats()
+
+    doc, stats = asyncio.run(scenario())
+    assert chain.batches == []
+    assert doc["status"] == "pending"
+    assert doc["verify_attempts"] == 0
+    assert "verify_lease" not in doc
+    assert doc["next_check_at"] > datetime.utcnow() + timedelta(seconds=tx_verifier.TX_VERIFY_BACKOFF_MAX_SECONDS - 5)
+    assert stats["unknown_chain"] == 1
+
+
+def test_provider_transport_wraps_non_batching_provider():
+    chain = FakeChain({"0xok": {"status": "0x1", "blockNumber": "0x2"}})
+    transport = ProviderTransport(chain)
+    requests = [
+        {"jsonrpc": "2.0", "id": 0, "method": "eth_getTransactionReceipt", "params": ["0xok"]},
+        {"jsonrpc": "2.0", "id": 1, "method": "eth_getTransactionReceipt", "params": ["0xnone"]},
+    ]
+    responses = asyncio.run(transport(requests))
+    assert responses[0]["id"] == 0 and responses[0]["result"]["blockNumber"] == "0x2"
+    assert responses[1]["id"] == 1 and responses[1]["result"] is None
+
+
+def test_parse_rpc_urls():
+    assert parse_rpc_urls("11155111=https://a, 0x539=http://b") == {SEPOLIA: "https://a", 1337: "http://b"}
+    assert parse_rpc_urls("") == {}
+
+
+def test_build_transaction_ignores_client_status(monkeypatch):
+    main = pytest.importorskip("main")
+    payload = {"medicine": "Paracetamol", "price_eth": 0.01, "price_usd": 30.0, "status": "confirmed"}
+
+    monkeypatch.setattr(main, "TX_VERIFY_ENABLED", True)
+    assert main.build_transaction({**payload, "tx_hash": "0xabc"})["status"] == "pending"
+    assert main.build_transaction(payload)["status"] == "completed"
+    assert main.build_transaction({**payload, "status": "failed"})["status"] == "completed"
+
+    monkeypatch.setattr(main, "TX_VERIFY_ENABLED", False)
+    assert main.build_transaction({**payload, "tx_hash": "0xabc"})["status"] == "completed"
@@ -0,0 +1,115 @@
+import asyncio
+
+from write_buffer import RetryDocuments, WriteBehindBuffer
+
+
+def docs(count, start=0):
+    return [{"n": i} for i in range(start, start + count)]
+
+
+def test_close_waits_for_running_flush_instead_of_cancelling_it():
+    async def scenario():
+        written = []
+        started = asyncio.Event()
+
+        async def slow_flush(batch):
+            started.set()
+            await asyncio.sleep(0.05)
+            written.extend(batch)
+
+        buffer = WriteBehindBuffer(slow_flush, max_size=2, max_delay=0.01)
+        buffer.start()
+        for doc in docs(5):
+            buffer.add(doc)
+        await started.wait()
+        # close() đúng lúc flush_fn đang chạy: lô đó vẫn phải được ghi trọn vẹn
+        await buffer.close()
+        return written, buffer
+
+    written, buffer = asyncio.run(scenario())
+    assert [doc["n"] for doc in written] == [0, 1, 2, 3, 4]
+    assert len(buffer) == 0
+    assert buffer.stats()["flushed"] == 5
+
+
+def test_cancelled_flush_puts_batch_back():
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hanging_flush(batch):
+            started.set()
+            await asyncio.sleep(10)
+
+        buffer = WriteBehindBuffer(hanging_flush, max_size=10)
+        for doc in docs(3):
+            buffer.add(doc)
+        task = asyncio.create_task(buffer.flush())
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return buffer
+
+    buffer = asyncio.run(scenario())
+    assert len(buffer) == 3
+
+
+def test_retry_documents_requeues_only_failed_documents():
+    calls = []
+
+    async def partial_flush(batch):
+        calls.append([doc["n"] for doc in batch])
+        if len(calls) == 1:
+            raise RetryDocuments([batch[1]], RuntimeError("write error"))
+
+    async def scenario():
+        buffer = WriteBehindBuffer(partial_flush, max_size=10, max_delay=0.01)
+        for doc in docs(3):
+            buffer.add(doc)
+        await buffer.flush()
+        after_error = (len(buffer), buffer.stats())
+        await buffer.flush()
+        return after_error, buffer
+
+    (pending, stats), buffer = asyncio.run(scenario())
+    assert pending == 1
+    assert stats["flushed"] == 2
+    assert stats["flush_errors"] == 1
+    assert stats["backoff_seconds"] == 0.01
+    assert calls == [[0, 1, 2], [1]]
+    assert len(buffer) == 0
+    assert buffer.stats()["backoff_seconds"] == 0.0
+
+
+def test_backoff_doubles_up_to_max_and_resets_on_success():
+    failing = True
+
+    async def flaky_flush(batch):
+        if failing:
+            raise RuntimeError("MongoDB down")
+
+    async def scenario():
+        nonlocal failing
+        buffer = WriteBehindBuffer(flaky_flush, max_size=10, max_delay=0.1, max_backoff=0.5)
+        buffer.add({"n": 0})
+        backoffs = []
+        for _ in range(5):
+            await buffer.flush()
+            backoffs.append(buffer.stats()["backoff_seconds"])
+        failing = False
+        await buffer.flush()
+        return backoffs, buffer
+
+    backoffs, buffer = asyncio.run(scenario())
+    assert backoffs == [0.1, 0.2, 0.4, 0.5, 0.5]
+    assert len(buffer) == 0
+    assert buffer.stats()["backoff_seconds"] == 0.0
+
+
+def test_add_rejects_when_full():
+    async def noop(batch):
+        pass
+
+    buffer = WriteBehindBuffer(noop, max_pending=2)
+    assert buffer.add({"n": 0}) and buffer.add({"n": 1})
+    assert not buffer.add({"n": 2})
+    assert buffer.stats()["rejected"] == 1
@@ -0,0 +1,347 @@
+# =====================================================================================
+# ⛓️ Xác minh tx_hash của giao dịch mua hàng trên blockchain (chạy nền, theo lô)
+# ✅ JSON-RPC batch eth_getTransactionReceipt, giới hạn đồng thời, backoff theo từng giao dịch
+# =====================================================================================
+#
+# add_purchase lưu giao dịch có tx_hash với status "pending" và trả về ngay. Task nền
+# định kỳ lấy các giao dịch pending đến hạn kiểm tra (next_check_at), gửi nhiều
+# eth_getTransactionReceipt trong một HTTP request và cập nhật:
+#   - receipt.status = 0x1  -> "confirmed", block_number lấy từ receipt
+#   - receipt.status = 0x0  -> "failed" (giao dịch bị revert)
+#   - chưa có receipt       -> giữ "pending", kiểm tra lại sau (backoff tăng dần);
+#                              quá TX_VERIFY_MAX_ATTEMPTS lần -> "failed" (not_found)
+#
+# Nhiều worker (uvicorn --workers N) có thể cùng chạy verifier: mỗi lượt giao dịch được
+# "giữ chỗ" (verify_lease + đẩy next_check_at thêm TX_VERIFY_LEASE_SECONDS) trước khi gọi
+# RPC, và mọi cập nhật sau đó chỉ khớp khi còn giữ lease - một giao dịch chỉ được một
+# worker chuyển sang "failed" và chỉ bị trừ khỏi rollup một lần.
+#
+# Mỗi chain_id dùng provider riêng (TX_VERIFY_RPC_URLS). Giao dịch thuộc chain chưa cấu
+# hình không được kiểm tra, chỉ hoãn lại TX_VERIFY_BACKOFF_MAX_SECONDS.
+#
+# Transport là một coroutine nhận list request JSON-RPC và trả list response, nên có thể
+# thay bằng provider giả lập (eth-tester, anvil...) khi test.
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+TX_VERIFY_BATCH_SIZE = int(os.getenv("TX_VERIFY_BATCH_SIZE", "100"))
+TX_VERIFY_CONCURRENCY = int(os.getenv("TX_VERIFY_CONCURRENCY", "4"))
+TX_VERIFY_INTERVAL_SECONDS = float(os.getenv("TX_VERIFY_INTERVAL_SECONDS", "2"))
+TX_VERIFY_MAX_ATTEMPTS = int(os.getenv("TX_VERIFY_MAX_ATTEMPTS", "20"))
+# Backoff giữa các lần kiểm tra một giao dịch chưa có receipt: 2s, 4s, 8s... tối đa 5 phút
+TX_VERIFY_BACKOFF_SECONDS = float(os.getenv("TX_VERIFY_BACKOFF_SECONDS", "2"))
+TX_VERIFY_BACKOFF_MAX_SECONDS = float(os.getenv("TX_VERIFY_BACKOFF_MAX_SECONDS", "300"))
+TX_VERIFY_RPC_TIMEOUT_SECONDS = float(os.getenv("TX_VERIFY_RPC_TIMEOUT_SECONDS", "10"))
+# Thời gian một worker giữ giao dịch đã nhận để kiểm tra; phải lớn hơn thời gian một lượt RPC
+TX_VERIFY_LEASE_SECONDS = float(os.getenv("TX_VERIFY_LEASE_SECONDS", "60"))
+
+Transport = Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]]
+
+
+class HTTPBatchTransport:
+    """Gửi một mảng request JSON-RPC trong một HTTP POST (dùng aiohttp, đi kèm web3)."""
+
+    def __init__(self, url: str, timeout: float = TX_VERIFY_RPC_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+
+    async def __call__(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self._session.post(self.url, json=requests) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class ProviderTransport:
+    """
+    Transport cho provider của web3 không hỗ trợ batch (vd. EthereumTesterProvider):
+    gọi make_request từng request trên executor.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    async def __call__(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        responses = []
+        for request in requests:
+            response = await loop.run_in_executor(
+                None, self.provider.make_request, request["method"], request["params"]
+            )
+            responses.append({"id": request["id"], **dict(response)})
+        return responses
+
+    async def close(self):
+        pass
+
+
+def _to_int(value) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return int(value, 16) if value.startswith("0x") else int(value)
+    return int(value)
+
+
+def chain_key(value) -> Optional[int]:
+    """chain_id của giao dịch ("0xaa36a7", "11155111" hoặc 11155111) -> int, None nếu không hợp lệ."""
+    try:
+        return _to_int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rpc_urls(value: str) -> Dict[int, str]:
+    """Đọc cấu hình "chain_id=url,chain_id=url" (chain_id thập phân hoặc hex) thành dict."""
+    urls = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        chain_id, sep, url = item.partition("=")
+        key = chain_key(chain_id.strip())
+        if not sep or key is None or not url.strip():
+            raise ValueError(f"Invalid TX_VERIFY_RPC_URLS entry: {item!r}")
+        urls[key] = url.strip()
+    return urls
+
+
+def backoff_delay(attempts: int) -> float:
+    return min(TX_VERIFY_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)), TX_VERIFY_BACKOFF_MAX_SECONDS)
+
+
+class TxVerifier:
+    """
+    Xác minh các giao dịch pending của collection (lấy qua `get_collection` vì collection
+    chỉ có khi MongoDB sẵn sàng). `transports` ánh xạ chain_id -> transport. `on_failed`
+    được gọi với các giao dịch mà chính worker này chuyển sang "failed" (vd. để trừ khỏi
+    rollup doanh thu), `on_updated` sau mỗi lô có giao dịch đổi trạng thái.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable[[], Any],
+        transports: Dict[int, Transport],
+        on_failed: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+        on_updated: Optional[Callable[[], None]] = None,
+        batch_size: int = TX_VERIFY_BATCH_SIZE,
+        concurrency: int = TX_VERIFY_CONCURRENCY,
+        interval: float = TX_VERIFY_INTERVAL_SECONDS,
+        max_attempts: int = TX_VERIFY_MAX_ATTEMPTS,
+        lease_seconds: float = TX_VERIFY_LEASE_SECONDS,
+    ):
+        self._get_collection = get_collection
+        self.transports = dict(transports)
+        self._on_failed = on_failed
+        self._on_updated = on_updated
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.checked = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.rpc_errors = 0
+        self.unknown_chain = 0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def notify(self):
+        """Báo có giao dịch pending mới để kiểm tra ngay thay vì chờ hết chu kỳ."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Dừng task nền (có thể start lại, vd. khi worker được bầu lại làm leader)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def close(self):
+        await self.stop()
+        for transport in self.transports.values():
+            close = getattr(transport, "close", None)
+            if close is not None:
+                await close()
+
+    async def _run(self):
+        delay = self.interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                processed = await self.run_once()
+                # Còn nhiều giao dịch đến hạn: chạy tiếp ngay để theo kịp tải
+                delay = 0 if processed >= self.batch_size * self.concurrency else self.interval
+            except Exception as e:
+                print(f"⚠️ Warning: Transaction verifier failed: {e}")
+                delay = min(max(delay, self.interval) * 2, TX_VERIFY_BACKOFF_MAX_SECONDS)
+
+    async def run_once(self) -> int:
+        """Kiểm tra một lượt các giao dịch pending đến hạn. Trả về số giao dịch đã xử lý."""
+        collection = self._get_collection()
+        if collection is None:
+            return 0
+
+        now = datetime.utcnow()
+        due_filter = {"status": "pending", "next_check_at": {"$lte": now}}
+        candidates = await collection.find(due_filter, {"_id": 1}).sort(
+            "next_check_at", ASCENDING
+        ).limit(self.batch_size * self.concurrency).to_list(length=None)
+        if not candidates:
+            return 0
+
+        # Giữ chỗ: chỉ các giao dịch vẫn còn đến hạn (chưa bị worker khác nhận) được gắn
+        # lease của lượt này; đọc lại theo lease để biết chính xác giao dịch nào đã nhận được
+        lease = ObjectId()
+        ids = [doc["_id"] for doc in candidates]
+        await collection.update_many(
+            {"_id": {"$in": ids}, **due_filter},
+            {"$set": {"verify_lease": lease, "next_check_at": now + timedelta(seconds=self.lease_seconds)}},
+        )
+        claimed = await collection.find(
+            {"_id": {"$in": ids}, "verify_lease": lease},
+            {"tx_hash": 1, "verify_attempts": 1, "timestamp": 1, "medicine": 1,
+             "chain_id": 1, "price_eth": 1, "price_usd": 1},
+        ).to_list(length=None)
+
+        by_chain: Dict[int, List[Dict[str, Any]]] = {}
+        unknown = []
+        for tx in claimed:
+            chain_id = chain_key(tx.get("chain_id"))
+            if chain_id in self.transports:
+                by_chain.setdefault(chain_id, []).append(tx)
+            else:
+                unknown.append(tx["_id"])
+        if unknown:
+            # Chain chưa cấu hình provider: không gọi RPC, không tính lần thử, hoãn lại
+            self.unknown_chain += len(unknown)
+            await collection.update_many(
+                {"_id": {"$in": unknown}, "verify_lease": lease},
+                {"$set": {"next_check_at": now + timedelta(seconds=TX_VERIFY_BACKOFF_MAX_SECONDS)},
+                 "$unset": {"verify_lease": ""}},
+            )
+
+        # Tối đa `concurrency` HTTP request song song, mỗi request `batch_size` receipt
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(chain_id, chunk):
+            async with semaphore:
+                await self._check_chunk(collection, self.transports[chain_id], lease, chunk)
+
+        await asyncio.gather(*(
+            check(chain_id, txs[i:i + self.batch_size])
+            for chain_id, txs in by_chain.items()
+            for i in range(0, len(txs), self.batch_size)
+        ))
+        return len(candidates)
+
+    async def _check_chunk(self, collection, transport: Transport, lease: ObjectId, chunk: List[Dict[str, Any]]):
+        requests = [
+            {"jsonrpc": "2.0", "id": i, "method": "eth_getTransactionReceipt", "params": [tx["tx_hash"]]}
+            for i, tx in enumerate(chunk)
+        ]
+        try:
+            responses = {response.get("id"): response for response in await transport(requests)}
+        except Exception:
+            # Lỗi cả lô (mạng / provider): không tính vào số lần thử, vòng lặp nền sẽ lùi lại.
+            # Lease hết hạn sau TX_VERIFY_LEASE_SECONDS thì giao dịch lại đến hạn kiểm tra.
+            self.rpc_errors += 1
+            raise
+
+        now = datetime.utcnow()
+        updates = []
+        failures = []
+        confirmed = 0
+        for i, tx in enumerate(chunk):
+            response = responses.get(i) or {}
+            receipt = response.get("result")
+            attempts = tx.get("verify_attempts", 0) + 1
+            # Chỉ cập nhật khi còn giữ lease của lượt này (chưa bị worker khác nhận lại)
+            held = {"_id": tx["_id"], "status": "pending", "verify_lease": lease}
+
+            if receipt:
+                receipt_status = _to_int(receipt.get("status"))
+                fields = {
+                    "block_number": _to_int(receipt.get("blockNumber")),
+                    "verify_attempts": attempts,
+                    "verified_at": now,
+                }
+                settle = {"$unset": {"next_check_at": "", "verify_lease": ""}}
+                if receipt_status == 0:
+                    fields.update(status="failed", failure_reason="reverted")
+                    failures.append((tx, held, {"$set": fields, **settle}))
+                else:
+                    fields["status"] = "confirmed"
+                    updates.append(UpdateOne(held, {"$set": fields, **settle}))
+                    confirmed += 1
+            elif attempts >= self.max_attempts and "error" not in response:
+                failures.append((tx, held, {
+                    "$set": {"status": "failed", "failure_reason": "not_found",
+                             "verify_attempts": attempts, "verified_at": now},
+                    "$unset": {"next_check_at": "", "verify_lease": ""},
+                }))
+            else:
+                updates.append(UpdateOne(held, {
+                    "$set": {
+                        "verify_attempts": attempts,
+                        "next_check_at": now + timedelta(seconds=backoff_delay(attempts)),
+                    },
+                    "$unset": {"verify_lease": ""},
+                }))
+
+        if updates:
+            await collection.bulk_write(updates, ordered=False)
+        # Chuyển "failed" từng giao dịch: chỉ giao dịch mà update thực sự đổi trạng thái
+        # (modified_count == 1) mới được trừ khỏi rollup
+        failed = []
+        for tx, held, update in failures:
+            result = await collection.update_one(held, update)
+            if result.modified_count == 1:
+                failed.append(tx)
+
+        self.checked += len(chunk)
+        self.confirmed += confirmed
+        self.failed += len(failed)
+        if failed and self._on_failed is not None:
+            await self._on_failed(failed)
+        if (confirmed or failed) and self._on_updated is not None:
+            self._on_updated()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "checked": self.checked,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "rpc_errors": self.rpc_errors,
+            "unknown_chain": self.unknown_chain,
+            "chains": sorted(self.transports),
+        }
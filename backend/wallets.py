@@ -0,0 +1,122 @@
+# =====================================================================================
+# 👛 Pool ví blockchain tạo sẵn cho đăng ký user
+# ✅ Task nền tự bổ sung pool, lấy ví O(1) khi đăng ký, tạo hàng loạt cho onboarding
+# =====================================================================================
+
+import asyncio
+import os
+import secrets
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+WALLET_POOL_SIZE = int(os.getenv("WALLET_POOL_SIZE", "200"))
+# Khi số ví sẵn có xuống dưới ngưỡng này thì task nền bắt đầu bổ sung
+WALLET_POOL_LOW_WATERMARK = int(os.getenv("WALLET_POOL_LOW_WATERMARK", str(WALLET_POOL_SIZE // 2)))
+# Số ví tạo trong mỗi lần chạy trên executor
+WALLET_REFILL_CHUNK = 50
+
+
+class Wallet(NamedTuple):
+    address: str
+    private_key: str
+
+
+def generate_wallet() -> Wallet:
+    # Import muộn: eth_account nặng, chỉ cần khi tạo ví (luôn chạy trên executor)
+    from eth_account import Account
+
+    account = Account.create(secrets.token_hex(32))
+    return Wallet(account.address, account.key.hex())
+
+
+def generate_wallets(count: int) -> List[Wallet]:
+    return [generate_wallet() for _ in range(count)]
+
+
+class WalletPool:
+    """
+    Giữ sẵn tối đa `size` cặp khóa. take() lấy một ví trong O(1); nếu pool cạn
+    thì tạo ngay trên executor (không bao giờ trả về địa chỉ giả).
+    """
+
+    def __init__(self, size: int = WALLET_POOL_SIZE, low_watermark: int = WALLET_POOL_LOW_WATERMARK):
+        self.size = size
+        self.low_watermark = low_watermark
+        self._ready: deque = deque()
+        self._refill: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.generated = 0
+        self.served = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._ready)
+
+    def start(self):
+        if self._task is None:
+            # Tạo Event trong event loop đang chạy (không phải lúc import module)
+            self._refill = asyncio.Event()
+            self._refill.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            try:
+                while len(self._ready) < self.size:
+                    count = min(WALLET_REFILL_CHUNK, self.size - len(self._ready))
+                    self._ready.extend(await loop.run_in_executor(None, generate_wallets, count))
+                    self.generated += count
+            except Exception as e:
+                print(f"⚠️ Warning: Could not refill wallet pool: {e}")
+                await asyncio.sleep(1)
+                self._refill.set()
+
+    def _check_watermark(self):
+        if self._refill is not None and len(self._ready) < self.low_watermark:
+            self._refill.set()
+
+    async def take(self) -> Wallet:
+        """Lấy một ví từ pool (hoặc tạo mới ngoài event loop nếu pool đang trống)."""
+        self.served += 1
+        if self._ready:
+            wallet = self._ready.popleft()
+            self._check_watermark()
+            return wallet
+
+        self.misses += 1
+        self._check_watermark()
+        return await asyncio.get_running_loop().run_in_executor(None, generate_wallet)
+
+    async def take_many(self, count: int) -> List[Wallet]:
+        """Lấy `count` ví cho đăng ký hàng loạt: dùng pool trước, phần thiếu tạo một lần trên executor."""
+        wallets = []
+        while self._ready and len(wallets) < count:
+            wallets.append(self._ready.popleft())
+        missing = count - len(wallets)
+        if missing:
+            self.misses += missing
+            wallets.extend(await asyncio.get_running_loop().run_in_executor(None, generate_wallets, missing))
+        self.served += count
+        self._check_watermark()
+        return wallets
+
+    def stats(self) -> dict:
+        return {
+            "available": len(self._ready),
+            "size": self.size,
+            "generated": self.generated,
+            "served": self.served,
+            "misses": self.misses,
+        }
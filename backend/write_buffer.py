@@ -0,0 +1,175 @@
+# =====================================================================================
+# 📥 Bộ đệm ghi trễ (write-behind) gom nhiều insert đơn lẻ thành insert_many
+# =====================================================================================
+#
+# Về độ bền dữ liệu khi bật bộ đệm:
+# - Request được trả về ngay khi document nằm trong bộ nhớ của worker, TRƯỚC khi
+#   MongoDB xác nhận ghi. Nếu process bị kill -9 / crash, tối đa `max_size` document
+#   hoặc dữ liệu của `max_delay` giây cuối cùng có thể bị mất.
+# - Khi tắt ứng dụng bình thường (SIGTERM), close() báo vòng lặp nền dừng, chờ lần flush
+#   đang chạy xong (không hủy giữa chừng) rồi flush toàn bộ phần còn lại.
+# - Nếu flush lỗi, lô (hoặc chỉ các document flush_fn báo qua RetryDocuments) được đưa
+#   lại đầu hàng đợi và thử lại sau, khoảng chờ tăng dần tới `max_backoff` giây trong lúc
+#   MongoDB mất kết nối. Khi hàng đợi vượt `max_pending`, add() trả về False để caller
+#   ghi trực tiếp (không mất dữ liệu, chỉ mất lợi ích gom lô).
+# - Nếu lúc tắt vẫn không ghi được, số document bị bỏ được in ra log.
+# Client cần xác nhận bền vững nên dùng endpoint batch hoặc tắt bộ đệm.
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Khi flush lỗi liên tục, chỉ in cảnh báo tối đa một lần trong khoảng này
+FLUSH_ERROR_LOG_INTERVAL_SECONDS = 60
+
+
+class RetryDocuments(Exception):
+    """flush_fn ghi được một phần lô: chỉ `documents` cần được đưa lại hàng đợi."""
+
+    def __init__(self, documents: List[Dict[str, Any]], cause: Exception):
+        super().__init__(str(cause))
+        self.documents = documents
+        self.cause = cause
+
+
+class WriteBehindBuffer:
+    """Gom document và flush theo kích thước (`max_size`) hoặc thời gian (`max_delay` giây)."""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+        max_size: int = 500,
+        max_delay: float = 0.2,
+        max_pending: int = 10000,
+        max_backoff: float = 30,
+        name: str = "write-behind",
+    ):
+        self._flush_fn = flush_fn
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.name = name
+        self._backoff = 0.0
+        self._last_error_log: Optional[float] = None
+        self._suppressed_errors = 0
+        self._consecutive_errors = 0
+        self._pending: List[Dict[str, Any]] = []
+        # Event / Lock được tạo trong start() để gắn với event loop đang chạy
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.rejected = 0
+        self.flushed = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._stop = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    def add(self, doc: Dict[str, Any]) -> bool:
+        """Đưa document vào hàng đợi. Trả về False nếu hàng đợi đã đầy."""
+        if len(self._pending) >= self.max_pending:
+            self.rejected += 1
+            return False
+        self._pending.append(doc)
+        if self._wakeup is not None and len(self._pending) >= self.max_size:
+            self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            await self.flush()
+            if self._backoff:
+                # Đang lỗi (vd. MongoDB mất kết nối): chờ lâu dần thay vì thử lại mỗi max_delay
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self._backoff)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def flush(self):
+        """Ghi toàn bộ document đang chờ, mỗi lần tối đa `max_size` document."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.max_size]
+                del self._pending[:self.max_size]
+                try:
+                    await self._flush_fn(batch)
+                except asyncio.CancelledError:
+                    # Bị hủy giữa chừng: trả lô về hàng đợi (flush_fn của transactions coi
+                    # trùng _id là đã ghi nên ghi lại lô đã vào MongoDB vẫn an toàn)
+                    self._pending[:0] = batch
+                    raise
+                except Exception as e:
+                    # Đưa lô (hoặc phần chưa ghi được) về đầu hàng đợi để thử lại sau
+                    retry = e.documents if isinstance(e, RetryDocuments) else batch
+                    self._pending[:0] = retry
+                    self.flushed += len(batch) - len(retry)
+                    self.flush_errors += 1
+                    self._consecutive_errors += 1
+                    self._backoff = min(max(self._backoff * 2, self.max_delay), self.max_backoff)
+                    self._log_error(len(retry), e)
+                    return
+                self.flushed += len(batch)
+                self.flush_count += 1
+                if self._consecutive_errors:
+                    print(f"✅ {self.name} flush recovered after {self._consecutive_errors} failed attempts")
+                    self._backoff = 0.0
+                    self._consecutive_errors = 0
+                    self._suppressed_errors = 0
+                    self._last_error_log = None
+
+    def _log_error(self, count: int, error: Exception):
+        now = time.monotonic()
+        if self._last_error_log is not None and now - self._last_error_log < FLUSH_ERROR_LOG_INTERVAL_SECONDS:
+            self._suppressed_errors += 1
+            return
+        suppressed = f", {self._suppressed_errors} similar errors suppressed" if self._suppressed_errors else ""
+        print(f"Warning: {self.name} flush failed ({count} docs to retry, {len(self._pending)} pending{suppressed}): {error}")
+        self._last_error_log = now
+        self._suppressed_errors = 0
+
+    async def close(self, flush: bool = True):
+        """
+        Dừng vòng lặp nền và flush phần còn lại (gọi khi shutdown). Lần flush đang chạy
+        được chờ cho xong thay vì bị hủy, nên lô đang ghi không bị mất và các hook sau
+        khi ghi (rollup, phân tích) vẫn chạy. Document không ghi được (hoặc `flush=False`
+        khi không có kết nối) bị bỏ và được in ra log.
+        """
+        if self._task is not None:
+            self._stop.set()
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if flush:
+            await self.flush()
+        if self._pending:
+            print(f"⚠️ Warning: {self.name} dropped {len(self._pending)} unwritten documents at shutdown")
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "backoff_seconds": self._backoff,
+        }
@@ -1,5 +1,5 @@
 // src/App.jsx - Blockchain Integrated Version
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import Navbar from "./components/Navbar";
 import Banner from "./components/Banner";
 import ProductSection from "./components/ProductSection";
@@ -9,43 +9,52 @@ import { CartProvider } from "./contexts/CartContext";
 import { AuthProvider } from "./contexts/AuthContext";
 import { TransactionProvider } from "./contexts/TransactionContext";
 import { getBackendUrl } from "./utils/pricing";
+import { subscribeCatalog } from "./utils/catalogStream";
 import { formatEther } from "ethers";
 
+// Map backend drug format to frontend product format
+const mapDrug = (drug) => ({
+  id: drug.id || Math.random().toString(36).substr(2, 9),
+  name: drug.name || 'Unknown',
+  price: drug.price ? Number(formatEther(drug.price)) : 0,
+  imageUrl: "/api/placeholder/300/200",
+  rating: 4.5,
+  description: drug.batch ? `Batch: ${drug.batch}` : 'No description',
+  batch: drug.batch,
+  owner: drug.owner,
+  stage: drug.stage,
+});
+
 function App() {
   const [allProducts, setAllProducts] = useState([]);
   const [filtered, setFiltered] = useState([]);
   const [loading, setLoading] = useState(true);
 
-  // Load drugs from Blockchainadmin backend
+  // Query đang tìm kiếm; rỗng thì danh sách hiển thị đi theo catalog
+  const queryRef = useRef('');
+
+  // Load drugs from Blockchainadmin backend: snapshot + cập nhật trực tiếp qua SSE
   useEffect(() => {
+    // Lấy backend URL từ Blockchainadmin
+    const blockchainAdminUrl = getBackendUrl(); // Có thể cần config riêng cho Blockchainadmin
+
+    const applyCatalog = (items) => {
+      const mapped = items.map(mapDrug);
+      setAllProducts(mapped);
+      if (!queryRef.current) setFiltered(mapped);
+      setLoading(false);
+    };
+
+    // Fallback khi không dùng được stream: tải catalog một lần
     const loadDrugs = async () => {
-      setLoading(true);
       try {
-        // Lấy backend URL từ Blockchainadmin
-        const blockchainAdminUrl = getBackendUrl(); // Có thể cần config riêng cho Blockchainadmin
-        
-        // Thử lấy từ endpoint /drugs (cần auth) hoặc /api/drugs/search (public)
         // Dùng /api/drugs/search với query rỗng để lấy tất cả
         const res = await fetch(`${blockchainAdminUrl}/api/drugs/search?q=&limit=100`);
         
         if (res.ok) {
           const data = await res.json();
           if (data.items && Array.isArray(data.items)) {
-            // Map backend drug format to frontend product format
-            const mapped = data.items.map((drug) => ({
-              id: drug.id || Math.random().toString(36).substr(2, 9),
-              name: drug.name || 'Unknown',
-              price: drug.price ? Number(formatEther(drug.price)) : 0,
-    imageUrl: "/api/placeholder/300/200",
-    rating: 4.5,
-              description: drug.batch ? `Batch: ${drug.batch}` : 'No description',
-              batch: drug.batch,
-              owner: drug.owner,
-              stage: drug.stage,
-            }));
-            setAllProducts(mapped);
-            setFiltered(mapped);
-            setLoading(false);
+            applyCatalog(data.items);
             return;
           }
         }
@@ -54,12 +63,11 @@ function App() {
       }
       
       // Nếu không load được, để danh sách rỗng
-      setAllProducts([]);
-      setFiltered([]);
-      setLoading(false);
+      applyCatalog([]);
     };
 
-    loadDrugs();
+    setLoading(true);
+    return subscribeCatalog(blockchainAdminUrl, applyCatalog, loadDrugs);
   }, []);
 
   // Search handler - chỉ dùng backend Blockchainadmin
@@ -67,6 +75,7 @@ function App() {
     // expose search handler for Navbar
     window.__APP_ON_SEARCH__ = (query) => {
       const q = (query || '').trim();
+      queryRef.current = q;
       
       // Nếu query rỗng, hiển thị tất cả
       if (!q) {
@@ -83,18 +92,7 @@ function App() {
           if (res.ok) {
             const data = await res.json();
             if (data.items && Array.isArray(data.items)) {
-              // Map backend drug format to frontend product format
-              const mapped = data.items.map((drug) => ({
-                id: drug.id || Math.random().toString(36).substr(2, 9),
-                name: drug.name || 'Unknown',
-                price: drug.price ? Number(formatEther(drug.price)) : 0,
-                imageUrl: "/api/placeholder/300/200",
-                rating: 4.5,
-                description: drug.batch ? `Batch: ${drug.batch}` : 'No description',
-                batch: drug.batch,
-                owner: drug.owner,
-                stage: drug.stage,
-              }));
+              const mapped = data.items.map(mapDrug);
               setFiltered(mapped);
               return;
             }
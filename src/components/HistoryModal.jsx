@@ -12,39 +12,69 @@ const formatDate = (isoOrDate) => {
   }
 };
 
+const fetchRevenuePage = async (cursor) => {
+  const backend = getBackendUrl();
+  const now = new Date();
+  const params = new URLSearchParams({ month: now.getMonth() + 1, year: now.getFullYear() });
+  if (cursor) {
+    // Tổng tháng đã có từ trang đầu, các trang sau không cần tính lại
+    params.set('cursor', cursor);
+    params.set('total', 'none');
+  }
+  const res = await fetch(`${backend}/api/revenue?${params}`);
+  if (!res.ok) throw new Error('Failed to load history');
+  return res.json();
+};
+
 const HistoryModal = ({ onClose }) => {
   const [loading, setLoading] = React.useState(true);
+  const [loadingMore, setLoadingMore] = React.useState(false);
   const [error, setError] = React.useState(null);
   const [transactions, setTransactions] = React.useState([]);
   const [total, setTotal] = React.useState(0);
+  const [nextCursor, setNextCursor] = React.useState(null);
+  const mountedRef = React.useRef(true);
 
   React.useEffect(() => {
-    let mounted = true;
+    mountedRef.current = true;
     async function fetchHistory() {
       setLoading(true);
       setError(null);
       try {
-        const backend = getBackendUrl();
-        const now = new Date();
-        const month = now.getMonth() + 1;
-        const year = now.getFullYear();
-        const res = await fetch(`${backend}/api/revenue?month=${month}&year=${year}`);
-        if (!res.ok) throw new Error('Failed to load history');
-        const data = await res.json();
-        if (!mounted) return;
+        const data = await fetchRevenuePage(null);
+        if (!mountedRef.current) return;
         setTransactions(data.transactions || []);
         setTotal(data.total || 0);
+        setNextCursor(data.next_cursor || null);
       } catch (e) {
-        if (!mounted) return;
+        if (!mountedRef.current) return;
         setError(e.message || 'Failed to load history');
       } finally {
-        if (mounted) setLoading(false);
+        if (mountedRef.current) setLoading(false);
       }
     }
     fetchHistory();
-    return () => { mounted = false; };
+    return () => { mountedRef.current = false; };
   }, []);
 
+  // Backend trả về từng trang (next_cursor), tải tiếp khi người dùng bấm "Xem thêm"
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    setError(null);
+    try {
+      const data = await fetchRevenuePage(nextCursor);
+      if (!mountedRef.current) return;
+      setTransactions((prev) => prev.concat(data.transactions || []));
+      setNextCursor(data.next_cursor || null);
+    } catch (e) {
+      if (!mountedRef.current) return;
+      setError(e.message || 'Failed to load history');
+    } finally {
+      if (mountedRef.current) setLoadingMore(false);
+    }
+  };
+
   return (
     <div className="fixed inset-0 bg-black bg-opacity-50 z-50 flex items-center justify-center p-4">
       <div className="bg-white rounded-2xl shadow-xl w-full max-w-3xl max-h-[90vh] overflow-hidden">
@@ -62,7 +92,7 @@ const HistoryModal = ({ onClose }) => {
           {loading && <p className="text-gray-600">Đang tải...</p>}
           {error && <p className="text-red-600">{error}</p>}
 
-          {!loading && !error && (
+          {!loading && (!error || transactions.length > 0) && (
             <>
               <div className="mb-4 text-gray-800">
                 Tổng tháng này: <span className="font-semibold text-blue-600">{Number(total).toFixed(6)} ETH</span>
@@ -107,6 +137,15 @@ const HistoryModal = ({ onClose }) => {
                       )}
                     </div>
                   ))}
+                  {nextCursor && (
+                    <button
+                      onClick={loadMore}
+                      disabled={loadingMore}
+                      className="w-full py-2 text-sm font-medium text-blue-600 border border-blue-200 rounded-xl hover:bg-blue-50 disabled:opacity-50 transition-colors"
+                    >
+                      {loadingMore ? 'Đang tải...' : 'Xem thêm'}
+                    </button>
+                  )}
                 </div>
               )}
             </>
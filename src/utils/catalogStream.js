@@ -0,0 +1,61 @@
+// Theo dõi catalog qua Server-Sent Events (/api/catalog/stream):
+// nhận snapshot ban đầu rồi các delta upsert / delete, thay vì tải lại toàn bộ catalog.
+// Trả về hàm hủy theo dõi. onUnavailable được gọi nếu trình duyệt không hỗ trợ
+// EventSource hoặc không nhận được snapshot (để fallback sang fetch một lần).
+export function subscribeCatalog(baseUrl, onItems, onUnavailable) {
+  if (typeof EventSource === 'undefined') {
+    onUnavailable();
+    return () => {};
+  }
+
+  const items = new Map();
+  let source = null;
+  let receivedSnapshot = false;
+  let closed = false;
+
+  const emit = () => onItems(Array.from(items.values()));
+
+  const connect = () => {
+    source = new EventSource(`${baseUrl}/api/catalog/stream`);
+
+    source.addEventListener('snapshot', (e) => {
+      const data = JSON.parse(e.data);
+      items.clear();
+      for (const item of data.items || []) items.set(item.id, item);
+      receivedSnapshot = true;
+      emit();
+    });
+
+    source.addEventListener('upsert', (e) => {
+      const { item } = JSON.parse(e.data);
+      items.set(item.id, item);
+      emit();
+    });
+
+    source.addEventListener('delete', (e) => {
+      const { id } = JSON.parse(e.data);
+      if (items.delete(id)) emit();
+    });
+
+    // Server yêu cầu tải lại snapshot (client đọc chậm hoặc catalog thay đổi nhiều)
+    source.addEventListener('reset', () => {
+      source.close();
+      if (!closed) connect();
+    });
+
+    source.onerror = () => {
+      // EventSource tự kết nối lại; chỉ fallback nếu chưa từng nhận được snapshot
+      if (!receivedSnapshot) {
+        source.close();
+        closed = true;
+        onUnavailable();
+      }
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    if (source) source.close();
+  };
+}
@@ -2,11 +2,11 @@
 
 
 export async function fetchEthRate() {
-  // Returns USD per 1 ETH
-  const res = await fetch('https://api.coinbase.com/v2/exchange-rates?currency=ETH');
+  // Returns USD per 1 ETH (tỷ giá do backend cache, không gọi Coinbase từ trình duyệt)
+  const res = await fetch(`${getBackendUrl()}/api/rates/eth`);
   if (!res.ok) throw new Error('Failed to fetch ETH rate');
   const data = await res.json();
-  const usdPerEth = parseFloat(data?.data?.rates?.USD);
+  const usdPerEth = Number(data?.usd_per_eth);
   if (!usdPerEth || Number.isNaN(usdPerEth)) throw new Error('Invalid ETH rate');
   return usdPerEth;
 }